@@ -0,0 +1,95 @@
+"""ITK pipelines versus the NumPy backend for the primitive smoothing filters.
+
+    python -m benchmarks.bench_backends [--sizes 32 128 512 1024] [--repeats 5]
+
+Runs every filter of ``numpy_backend.FILTERS`` on 8-bit synthetic images
+through the ``*_array`` functions with ``backend="itk"``, ``"numpy"`` and
+the automatic choice, and reports the best of ``--repeats`` calls. Every
+NumPy output is checked to be identical to the ITK one, on the synthetic
+images and on ``assets/brain-noise.png``. The automatic column follows the
+saved calibration (``python -m src.smoothing.backends``) and is ITK without
+one.
+"""
+
+import argparse
+import time
+
+import itk
+import numpy as np
+
+from benchmarks.bench_suite import _synthetic
+from src.caching import disable_cache
+from src.smoothing import bluring
+from src.smoothing.backends import load_calibration, select_backend
+
+IMAGE = "assets/brain-noise.png"
+
+CASES = [
+    ("binomial", bluring.binomial_array, [1, 4]),
+    ("discrete_gaussian", bluring.discrete_gaussian_array, [1.0, 16.0]),
+    ("recursive_gaussian_iir", bluring.recursive_gaussian_iir_array, [1.0, 4.0]),
+    ("median", bluring.median_array, [1, 3]),
+]
+
+
+def _best_of(repeats, function, *args, **kwargs):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[32, 128, 512, 1024])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    disable_cache()
+    if load_calibration() is None:
+        print("no calibration saved, the automatic choice is ITK\n")
+    brain = np.asarray(itk.imread(IMAGE, itk.F))
+    print(
+        "%-24s %6s %6s %10s %10s %10s %7s %8s"
+        % ("filter", "param", "size", "itk s", "numpy s", "auto s", "auto", "speedup")
+    )
+    for name, function, values in CASES:
+        for value in values:
+            # also warms up the ITK wrappers and SciPy
+            assert np.array_equal(
+                function(brain, value, backend="itk"),
+                function(brain, value, backend="numpy"),
+            ), (name, value, IMAGE)
+            for size in args.sizes:
+                image = _synthetic(size).astype(np.uint8)
+                assert np.array_equal(
+                    function(image, value, backend="itk"),
+                    function(image, value, backend="numpy"),
+                ), (name, value, size)
+                itkSeconds = _best_of(
+                    args.repeats, function, image, value, backend="itk"
+                )
+                numpySeconds = _best_of(
+                    args.repeats, function, image, value, backend="numpy"
+                )
+                autoSeconds = _best_of(args.repeats, function, image, value)
+                print(
+                    "%-24s %6g %6d %10.5f %10.5f %10.5f %7s %7.2fx"
+                    % (
+                        name,
+                        value,
+                        size,
+                        itkSeconds,
+                        numpySeconds,
+                        autoSeconds,
+                        select_backend(name, image, value),
+                        itkSeconds / autoSeconds,
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
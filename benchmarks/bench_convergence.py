@@ -0,0 +1,159 @@
+"""Iterations and time saved by the convergence window.
+
+    python -m benchmarks.bench_convergence [--size 256]
+
+Runs every registration engine on the example pairs under ``assets`` and on
+synthetic pairs with a known shift, once with the full iteration budget and
+once with a convergence window, and reports iterations, seconds and how far
+the early-stopped translation lies from the full run's.
+
+The windows below are the settings we use: a short one for the regular step
+optimizers, which mostly stop on their own once the step has shrunk, and a
+longer one with a parameter tolerance for the legacy Viola-Wells engine,
+whose fixed learning rate never stops before the iteration budget.
+"""
+
+import argparse
+import math
+import time
+
+import itk
+
+from benchmarks.bench_suite import _synthetic
+from src.caching import disable_cache
+from src.registration.multimodal import _register_legacy, _register_v4
+from src.registration.unimodal import _register_unimodal
+
+ENGINES = [
+    (
+        "unimodal",
+        _register_unimodal,
+        False,
+        {"convergenceWindow": 10, "convergenceTolerance": 1e-3},
+    ),
+    (
+        "unimodal pyramid",
+        lambda f, m, **kwargs: _register_unimodal(f, m, multiResolution=True, **kwargs),
+        False,
+        {"convergenceWindow": 10, "convergenceTolerance": 1e-3},
+    ),
+    (
+        "multimodal v4",
+        _register_v4,
+        True,
+        {"convergenceWindow": 10, "convergenceTolerance": 1e-3},
+    ),
+    (
+        "multimodal legacy",
+        _register_legacy,
+        True,
+        {
+            "convergenceWindow": 20,
+            "convergenceTolerance": 0.02,
+            "convergenceParameterTolerance": 0.3,
+        },
+    ),
+]
+
+ASSET_PAIRS = {
+    False: (
+        "assets/registration/translation/BrainProtonDensitySliceBorder20.png",
+        "assets/registration/translation/BrainProtonDensitySliceShifted13x17y.png",
+    ),
+    True: (
+        "assets/registration/multi-modal/brain1.png",
+        "assets/registration/multi-modal/brain2.png",
+    ),
+}
+
+SYNTHETIC_SHIFTS = [(7.0, -5.0), (12.0, 9.0)]
+
+
+def _pairs(multimodal, size):
+    fixedFile, movingFile = ASSET_PAIRS[multimodal]
+    yield "assets", itk.imread(fixedFile, itk.F), itk.imread(movingFile, itk.F)
+    for shift in SYNTHETIC_SHIFTS:
+        moving = _synthetic(size, shift)
+        if multimodal:
+            moving = 255.0 - moving
+        yield (
+            "synthetic %+g,%+g" % shift,
+            itk.image_from_array(_synthetic(size)),
+            itk.image_from_array(moving),
+        )
+
+
+def _run(register, fixed, moving, **kwargs):
+    start = time.perf_counter()
+    result = register(fixed, moving, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=256)
+    args = parser.parse_args(argv)
+
+    disable_cache()
+    print(
+        "%-18s %-20s %9s %9s %9s %9s %7s %9s"
+        % (
+            "engine",
+            "pair",
+            "full it",
+            "early it",
+            "full s",
+            "early s",
+            "saved",
+            "delta mm",
+        )
+    )
+    totals = {}
+    for name, register, multimodal, window in ENGINES:
+        for pairName, fixed, moving in _pairs(multimodal, args.size):
+            # warm up template instantiation for this pair's image type
+            register(fixed, moving, numberOfIterations=2)
+            full, fullSeconds = _run(register, fixed, moving)
+            early, earlySeconds = _run(register, fixed, moving, **window)
+            delta = math.dist(full.translation, early.translation)
+            print(
+                "%-18s %-20s %9d %9d %9.3f %9.3f %6.0f%% %9.3f"
+                % (
+                    name,
+                    pairName,
+                    full.iterations,
+                    early.iterations,
+                    fullSeconds,
+                    earlySeconds,
+                    100 * (1 - earlySeconds / fullSeconds),
+                    delta,
+                )
+            )
+            total = totals.setdefault(name, [0, 0, 0.0, 0.0])
+            total[0] += full.iterations
+            total[1] += early.iterations
+            total[2] += fullSeconds
+            total[3] += earlySeconds
+
+    print()
+    for name, (
+        fullIterations,
+        earlyIterations,
+        fullSeconds,
+        earlySeconds,
+    ) in totals.items():
+        print(
+            "%-18s %d -> %d iterations, %.2fs -> %.2fs (%.0f%% saved)"
+            % (
+                name,
+                fullIterations,
+                earlyIterations,
+                fullSeconds,
+                earlySeconds,
+                100 * (1 - earlySeconds / fullSeconds),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Anisotropic diffusion stopped at a tolerance versus a fixed iteration count.
+
+    python -m benchmarks.bench_diffusion [--size 512] [--iterations 50] [--tolerances 0.5 0.25 0.1] [--repeats 2]
+
+Runs both diffusion pipelines on a synthetic ``--size`` squared image and on
+a ``--size // 8`` cubed volume (with the automatic, spacing-dependent time
+step: 0.125 in 2D, 0.0625 in 3D), once for the full ``--iterations`` and
+once per tolerance. For every run it reports the iterations run and saved,
+the best of ``--repeats`` times, and how far the 8-bit output is from the
+full run's (largest and mean absolute difference in gray levels).
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_suite import _synthetic
+from src.smoothing.pipelines import (
+    CurvatureAnisotropicDiffusionFilter,
+    GradientAnisotropicDiffusionFilter,
+)
+
+PIPELINES = [
+    ("gradient", GradientAnisotropicDiffusionFilter),
+    ("curvature", CurvatureAnisotropicDiffusionFilter),
+]
+
+
+def _run(PipelineType, image, repeats, **parameters):
+    best = None
+    for _ in range(repeats):
+        # a new pipeline, so every repeat runs the filter
+        pipeline = PipelineType(image.ndim)
+        pipeline.SetInputArray(image)
+        pipeline.SetParameters(**parameters)
+        start = time.perf_counter()
+        pipeline.Update()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    output = np.array(pipeline.GetOutput()).astype(np.int16)
+    return best, output, pipeline.GetConvergence()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--tolerances", type=float, nargs="+", default=[0.5, 0.25, 0.1])
+    parser.add_argument("--repeats", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    image = _synthetic(args.size)
+    edge = args.size // 8
+    volume = np.stack([_synthetic(edge, seed=seed) for seed in range(edge)]).astype(
+        np.float32
+    )
+    print(
+        "%-10s %-10s %10s %6s %6s %10s %8s %9s %8s %9s"
+        % (
+            "filter",
+            "image",
+            "tolerance",
+            "iters",
+            "saved",
+            "time step",
+            "s",
+            "speedup",
+            "max diff",
+            "mean diff",
+        )
+    )
+    for name, PipelineType in PIPELINES:
+        for label, array in (
+            ("%d^2" % args.size, image),
+            ("%d^3" % edge, volume),
+        ):
+            for tolerance in [None] + args.tolerances:
+                seconds, output, convergence = _run(
+                    PipelineType,
+                    array,
+                    args.repeats,
+                    numberOfIterations=args.iterations,
+                    tolerance=tolerance,
+                )
+                if tolerance is None:
+                    fullSeconds, full = seconds, output
+                difference = np.abs(output - full)
+                print(
+                    "%-10s %-10s %10s %6d %6d %10.4f %8.3f %8.2fx %8d %9.3f"
+                    % (
+                        name,
+                        label,
+                        "-" if tolerance is None else "%g" % tolerance,
+                        convergence["iterations"],
+                        convergence["iterations_saved"],
+                        convergence["time_step"],
+                        seconds,
+                        fullSeconds / seconds,
+                        difference.max(),
+                        difference.mean(),
+                    )
+                )
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Fused edge filter versus the three-filter ``EdgeFilter`` chain.
+
+    python -m benchmarks.bench_edge_filter [--sizes 512 1024 2048 4096] [--repeats 5]
+
+Every (filter, size) cell runs in a process forked after the templates were
+instantiated. Once the input image exists, the process returns its free heap
+to the system and resets its peak RSS (``/proc/self/clear_refs``), so the
+reported memory is what one ``Update()`` adds on top of the input (output
+copy included); the time is the median over ``--repeats`` calls. Both
+outputs are checked to be identical.
+"""
+
+import argparse
+import ctypes
+import multiprocessing
+import statistics
+import time
+
+import itk
+import numpy as np
+
+from benchmarks.bench_suite import _synthetic
+from src.composite_filter import EdgeFilter, FusedEdgeFilter
+
+FILTERS = {"EdgeFilter": EdgeFilter, "FusedEdgeFilter": FusedEdgeFilter}
+
+
+def _status_mib(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024.0
+    raise KeyError(field)
+
+
+def _edges(EdgeFilterType, image):
+    edgeFilter = EdgeFilterType()
+    edgeFilter.SetInput(image)
+    edgeFilter.ThresholdBelow(10.0)
+    edgeFilter.Update()
+    return itk.array_from_image(edgeFilter.GetOutput())
+
+
+def _cell(name, size, repeats, connection):
+    image = itk.image_from_array(_synthetic(size))
+    ctypes.CDLL("libc.so.6").malloc_trim(0)
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    baseline = _status_mib("VmRSS")
+    output = _edges(FILTERS[name], image)
+    extra = _status_mib("VmHWM") - baseline
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _edges(FILTERS[name], image)
+        times.append(time.perf_counter() - start)
+    connection.send((statistics.median(times), extra, output))
+
+
+def _run_cell(name, size, repeats):
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_cell, args=(name, size, repeats, sender))
+    process.start()
+    sender.close()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048, 4096])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    # instantiate the templates before forking
+    for EdgeFilterType in FILTERS.values():
+        _edges(EdgeFilterType, itk.image_from_array(_synthetic(32)))
+
+    print(
+        "%6s %14s %14s %14s %14s %9s %9s"
+        % ("size", "chain s", "fused s", "chain MiB", "fused MiB", "speedup", "memory")
+    )
+    for size in args.sizes:
+        chainSeconds, chainMiB, chainOutput = _run_cell(
+            "EdgeFilter", size, args.repeats
+        )
+        fusedSeconds, fusedMiB, fusedOutput = _run_cell(
+            "FusedEdgeFilter", size, args.repeats
+        )
+        assert np.array_equal(chainOutput, fusedOutput), size
+        print(
+            "%6d %14.4f %14.4f %14.1f %14.1f %8.2fx %8.0f%%"
+            % (
+                size,
+                chainSeconds,
+                fusedSeconds,
+                chainMiB,
+                fusedMiB,
+                chainSeconds / fusedSeconds,
+                100 * (fusedMiB / chainMiB - 1),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
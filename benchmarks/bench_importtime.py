@@ -0,0 +1,95 @@
+"""Import time, memory and time to first result of the package modules.
+
+    python -m benchmarks.bench_importtime [--repeats 3]
+
+Every measurement runs in a fresh interpreter, so nothing is shared with an
+earlier import: ``import`` reports the seconds and peak RSS right after
+importing the module, ``first result`` additionally runs one small call
+through it (which is where the ITK wrapper modules it needs get loaded).
+``python -X importtime -c "import src.smoothing.pipelines"`` breaks an import
+down further.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+MODULES = [
+    "itk",
+    "src.caching",
+    "src.profiling",
+    "src.smoothing.pipelines",
+    "src.smoothing.bluring",
+    "src.smoothing.edge_preserving_smoothing",
+    "src.smoothing.batch",
+    "src.composite_filter",
+    "src.registration",
+]
+
+FIRST_RESULT = {
+    "median_array": (
+        "src.smoothing.bluring",
+        "median_array(np.zeros((64, 64), np.float32), radius=1)",
+    ),
+    "grad_anisotropic_diffusion_array": (
+        "src.smoothing.edge_preserving_smoothing",
+        "grad_anisotropic_diffusion_array(np.zeros((64, 64), np.float32), 1)",
+    ),
+    "EdgeFilter": (
+        "src.composite_filter",
+        "EdgeFilter().SetInput(itk.image_from_array(np.zeros((64, 64), np.float32)))",
+    ),
+}
+
+_PROBE = """
+import json, resource, time
+start = time.perf_counter()
+%s
+imported = time.perf_counter() - start
+%s
+done = time.perf_counter() - start
+print(json.dumps([imported, done, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss]))
+"""
+
+
+def _probe(imports, call=""):
+    if call:
+        imports = "import itk\nimport numpy as np\n" + imports
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE % (imports, call)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _median(samples):
+    return [statistics.median(values) for values in zip(*samples)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print("%-44s %10s %10s" % ("import", "seconds", "peak MiB"))
+    for module in MODULES:
+        seconds, _, rss = _median(
+            [_probe("import %s" % module) for _ in range(args.repeats)]
+        )
+        print("%-44s %10.3f %10.1f" % (module, seconds, rss / 1024))
+
+    print()
+    print("%-44s %10s %10s %10s" % ("first result", "import s", "total s", "peak MiB"))
+    for name, (module, call) in FIRST_RESULT.items():
+        imported, done, rss = _median(
+            [_probe("from %s import *" % module, call) for _ in range(args.repeats)]
+        )
+        print("%-44s %10.3f %10.3f %10.1f" % (name, imported, done, rss / 1024))
+
+
+if __name__ == "__main__":
+    main()
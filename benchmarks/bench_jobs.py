@@ -0,0 +1,183 @@
+"""Event loop responsiveness, cancellation and backpressure of ``JobRunner``.
+
+    python -m benchmarks.bench_jobs [--iterations 50] [--repeats 3]
+
+While a job runs, a heartbeat task sleeps 10 ms at a time and records how
+late it wakes up. Each job runs three ways: called directly in the loop,
+through a plain ``run_in_executor`` and through ``JobRunner``; the table
+shows the worst and the median lag (over ``--repeats`` runs) and the job's
+wall time. The ITK modules are loaded before anything is timed.
+
+Cancellation is timed on a 2000-iteration diffusion and a 5000-iteration
+(legacy) multimodal registration: the time from cancelling the awaiting task to the worker
+being free again. The backpressure run submits 12 jobs to a runner with 2
+workers and 4 waiting places and reports how many were refused and the
+largest number of jobs that ran at once.
+"""
+
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+
+import itk
+import numpy as np
+
+from src.caching import disable_cache
+from src.jobs import JobRunner, RunnerBusy
+from src.registration import register_unimodal
+from src.smoothing import bluring, edge_preserving_smoothing
+
+IMAGE = "assets/brain-noise.png"
+FIXED = "assets/registration/multi-modal/brain1.png"
+MOVING = "assets/registration/multi-modal/brain2.png"
+UNIMODAL = (
+    "assets/registration/translation/BrainProtonDensitySliceBorder20.png",
+    "assets/registration/translation/BrainProtonDensitySliceShifted13x17y.png",
+)
+
+
+async def _heartbeat(stop, lags, period=0.01):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(period)
+        lags.append(time.perf_counter() - start - period)
+
+
+async def _lags(call):
+    stop = asyncio.Event()
+    lags = []
+    heartbeat = asyncio.create_task(_heartbeat(stop, lags))
+    # let the heartbeat start before the job
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await call()
+    seconds = time.perf_counter() - start
+    stop.set()
+    await heartbeat
+    return max(lags), statistics.median(lags), seconds
+
+
+async def _direct(function, *args):
+    return function(*args)
+
+
+async def _executor(function, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+async def _cancel_after(runner, seconds, job):
+    task = asyncio.create_task(job)
+    await asyncio.sleep(seconds)
+    start = time.perf_counter()
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    while runner.running:
+        await asyncio.sleep(0.001)
+    return time.perf_counter() - start
+
+
+async def _backpressure(image):
+    lock = threading.Lock()
+    running = [0]
+    largest = [0]
+
+    def job():
+        with lock:
+            running[0] += 1
+            largest[0] = max(largest[0], running[0])
+        try:
+            return bluring.median_array(image, 2, backend="itk")
+        finally:
+            with lock:
+                running[0] -= 1
+
+    async with JobRunner(maxWorkers=2, maxPending=4) as runner:
+        results = await asyncio.gather(
+            *(runner.run(job) for _ in range(12)), return_exceptions=True
+        )
+    refused = sum(isinstance(result, RunnerBusy) for result in results)
+    return refused, len(results) - refused, largest[0]
+
+
+async def _main(args):
+    image = np.asarray(itk.imread(IMAGE, itk.F))
+    cases = [
+        (
+            "grad diffusion %d" % args.iterations,
+            edge_preserving_smoothing.grad_anisotropic_diffusion_array,
+            (image, args.iterations),
+        ),
+        ("median radius 3", bluring.median_array, (image, 3, None, "itk")),
+        ("unimodal registration", register_unimodal, UNIMODAL),
+    ]
+
+    async with JobRunner(maxWorkers=1) as runner:
+        await runner.warmup()
+        # registration modules too
+        await runner.register("unimodal", *UNIMODAL, numberOfIterations=1)
+
+        print(
+            "%-24s %-10s %10s %10s %10s"
+            % ("job", "caller", "max lag s", "lag s", "job s")
+        )
+        for name, function, arguments in cases:
+            callers = {
+                "direct": lambda: _direct(function, *arguments),
+                "executor": lambda: _executor(function, *arguments),
+                "JobRunner": lambda: runner.run(function, *arguments),
+            }
+            for caller, call in callers.items():
+                runs = [await _lags(call) for _ in range(args.repeats)]
+                print(
+                    "%-24s %-10s %10.4f %10.4f %10.3f"
+                    % (
+                        name,
+                        caller,
+                        max(run[0] for run in runs),
+                        statistics.median(run[1] for run in runs),
+                        statistics.median(run[2] for run in runs),
+                    )
+                )
+
+        print()
+        diffusion = await _cancel_after(
+            runner, 0.5, runner.smooth("grad_anisotropic_diffusion", image, 2000)
+        )
+        print(
+            "cancel grad diffusion 2000 iterations: worker free after %.4f s"
+            % diffusion
+        )
+        registration = await _cancel_after(
+            runner,
+            0.5,
+            runner.register("multimodal", FIXED, MOVING, numberOfIterations=5000),
+        )
+        print(
+            "cancel multimodal registration 5000:   worker free after %.4f s"
+            % registration
+        )
+
+    refused, done, largest = await _backpressure(image)
+    print(
+        "\nbackpressure: 12 jobs, 2 workers, 4 waiting: %d done, %d refused, "
+        "at most %d running" % (done, refused, largest)
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    disable_cache()
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""MedianImageFilter versus the histogram median over the radius.
+
+    python -m benchmarks.bench_median [--sizes 256 1024] [--radii 1 ... 15] [--repeats 3]
+
+Runs ``median_array`` on 8-bit synthetic images of every ``--sizes`` squared
+size with ``engine="filter"`` (on the ITK backend) and
+``engine="histogram"`` for every radius from 1 to 15, and reports the best
+of ``--repeats`` calls. Every histogram output is checked to be identical
+to the filter's, on the synthetic images and on ``assets/brain-noise.png``.
+The filter's time grows with the window area, the histogram's does not; the
+"auto" column is the engine ``engine=None`` picks (see
+``histogram_median.HISTOGRAM_RADIUS``).
+"""
+
+import argparse
+import time
+
+import itk
+import numpy as np
+
+from benchmarks.bench_suite import _synthetic
+from src.caching import disable_cache
+from src.smoothing import bluring
+from src.smoothing.histogram_median import is_large
+
+IMAGE = "assets/brain-noise.png"
+
+
+def _best_of(repeats, function, *args, **kwargs):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = np.array(function(*args, **kwargs))
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 1024])
+    parser.add_argument("--radii", type=int, nargs="+", default=range(1, 16))
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    disable_cache()
+    brain = itk.array_from_image(itk.imread(IMAGE, itk.UC))
+    for radius in (1, 4):
+        expected = np.array(bluring.median_array(brain, radius, backend="itk"))
+        assert np.array_equal(
+            bluring.median_array(brain, radius, engine="histogram"), expected
+        ), radius
+
+    print(
+        "%6s %6s %10s %12s %8s %10s"
+        % ("size", "radius", "filter s", "histogram s", "speedup", "auto")
+    )
+    for size in args.sizes:
+        image = _synthetic(size).astype(np.uint8)
+        for radius in args.radii:
+            filterSeconds, expected = _best_of(
+                args.repeats, bluring.median_array, image, radius, backend="itk"
+            )
+            histogramSeconds, output = _best_of(
+                args.repeats, bluring.median_array, image, radius, engine="histogram"
+            )
+            assert np.array_equal(output, expected), (size, radius)
+            print(
+                "%6d %6d %10.4f %12.4f %7.2fx %10s"
+                % (
+                    size,
+                    radius,
+                    filterSeconds,
+                    histogramSeconds,
+                    filterSeconds / histogramSeconds,
+                    "histogram" if is_large(radius) else "filter",
+                )
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main()
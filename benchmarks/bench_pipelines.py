@@ -0,0 +1,103 @@
+"""Per-image latency of the one-shot smoothing functions versus reused pipelines.
+
+    python -m benchmarks.bench_pipelines [--repeats 20] [--size 64]
+
+The one-shot path builds the reader, filter and rescaler for every call (what
+``median()`` and friends do). The reused path builds each pipeline once and
+then only swaps the input file, so ITK re-executes the stages downstream of
+the change.
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import itk
+import numpy as np
+
+from src.smoothing import bluring, pipelines
+
+CASES = [
+    (
+        "binomial",
+        bluring._binomial,
+        pipelines.BinomialFilter,
+        {"number_of_repetitions": 2},
+    ),
+    (
+        "discrete_gaussian",
+        bluring._discrete_gaussian,
+        pipelines.DiscreteGaussianFilter,
+        {"variance": 3},
+    ),
+    (
+        "recursive_gaussian_iir",
+        bluring._recursive_gaussian_iir,
+        pipelines.RecursiveGaussianFilter,
+        {"sigma": 2},
+    ),
+    ("median", bluring._median, pipelines.MedianFilter, {"radius": 1}),
+]
+
+
+def _make_slices(directory, size, count):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, "slice%03d.png" % i)
+        itk.imwrite(
+            itk.image_from_array(rng.integers(0, 256, (size, size), dtype=np.uint8)),
+            path,
+        )
+        paths.append(path)
+    return paths
+
+
+def _time(function, repeats):
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        function(i)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1e3
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--size", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = _make_slices(directory, args.size, args.repeats)
+
+        print(
+            "%dx%d slices, median latency over %d images"
+            % (args.size, args.size, args.repeats)
+        )
+        print("%-24s %12s %12s %8s" % ("filter", "one-shot ms", "reused ms", "speedup"))
+        for name, oneShot, PipelineType, params in CASES:
+            # warm up template instantiation so neither side pays for it
+            oneShot(paths[0], **params)
+
+            oneShotMs = _time(lambda i: oneShot(paths[i], **params), args.repeats)
+
+            pipeline = PipelineType()
+            pipeline.SetParameters(**params)
+
+            def reused(i):
+                pipeline.SetFileName(paths[i])
+                pipeline.Update()
+                itk.array_from_image(pipeline.GetOutput())
+
+            reusedMs = _time(reused, args.repeats)
+            print(
+                "%-24s %12.2f %12.2f %7.1fx"
+                % (name, oneShotMs, reusedMs, oneShotMs / reusedMs)
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Peak memory and throughput of the "float" and "native" precision policies.
+
+    python -m benchmarks.bench_precision [--sizes 1024 2048 4096] [--repeats 3]
+
+Every filter with native pixel types runs on a synthetic 8-bit grayscale
+PNG, once per policy and backend: the ITK pipeline reads the file, filters
+and rescales it as the batch engine does, and the NumPy backend filters the
+decoded uint8 array. Each cell runs in a forked process that returns its
+free heap to the system and resets its peak RSS before the first call (see
+``bench_edge_filter``). The reported memory is what that call adds, and the
+time the median of ``--repeats`` calls. The last column is the largest
+difference between the native and float outputs.
+"""
+
+import argparse
+import ctypes
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_edge_filter import _status_mib
+from benchmarks.bench_suite import _synthetic
+from src.caching import disable_cache
+from src.smoothing import numpy_backend
+from src.smoothing.bluring import _run
+from src.smoothing.pipelines import NUMPY_TYPES, PIPELINES, pixel_type_of
+
+CASES = [
+    ("median", {"radius": 1}),
+    ("median", {"radius": 3}),
+    ("binomial", {"number_of_repetitions": 1}),
+    ("binomial", {"number_of_repetitions": 4}),
+]
+
+
+def _call(backend, name, params, precision, path, array):
+    PipelineType = PIPELINES[name]
+    if backend == "itk":
+        _, out = _run(PipelineType, path, precision, **params)
+        return out
+    PixelType = PipelineType.GetPixelType(precision, pixel_type_of(array))
+    (value,) = params.values()
+    return numpy_backend.FILTERS[name](array, value, NUMPY_TYPES[PixelType])
+
+
+def _cell(arguments, repeats, connection):
+    ctypes.CDLL("libc.so.6").malloc_trim(0)
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    baseline = _status_mib("VmRSS")
+    output = np.array(_call(*arguments))
+    extra = _status_mib("VmHWM") - baseline
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _call(*arguments)
+        times.append(time.perf_counter() - start)
+    connection.send((statistics.median(times), extra, output))
+
+
+def _run_cell(repeats, *arguments):
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_cell, args=(arguments, repeats, sender))
+    process.start()
+    sender.close()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048, 4096])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    from PIL import Image
+
+    disable_cache()
+    with tempfile.TemporaryDirectory() as directory:
+        # instantiate both pixel types' templates before forking
+        warmup = os.path.join(directory, "warmup.png")
+        Image.fromarray(_synthetic(32).astype(np.uint8)).save(warmup)
+        for name, params in CASES:
+            for precision in ("float", "native"):
+                _call("itk", name, params, precision, warmup, None)
+
+        print(
+            "%-22s %-6s %6s %10s %10s %10s %10s %8s %8s %5s"
+            % (
+                "filter",
+                "engine",
+                "size",
+                "float s",
+                "native s",
+                "float MiB",
+                "native MiB",
+                "speedup",
+                "memory",
+                "diff",
+            )
+        )
+        for size in args.sizes:
+            array = _synthetic(size).astype(np.uint8)
+            path = os.path.join(directory, "%d.png" % size)
+            Image.fromarray(array).save(path)
+            for name, params in CASES:
+                label = "%s %s" % (name, list(params.values())[0])
+                for backend in ("itk", "numpy"):
+                    floatSeconds, floatMiB, floatOutput = _run_cell(
+                        args.repeats, backend, name, params, "float", path, array
+                    )
+                    nativeSeconds, nativeMiB, nativeOutput = _run_cell(
+                        args.repeats, backend, name, params, "native", path, array
+                    )
+                    print(
+                        "%-22s %-6s %6d %10.4f %10.4f %10.1f %10.1f %7.2fx %7.0f%% %5d"
+                        % (
+                            label,
+                            backend,
+                            size,
+                            floatSeconds,
+                            nativeSeconds,
+                            floatMiB,
+                            nativeMiB,
+                            floatSeconds / nativeSeconds,
+                            100 * (nativeMiB / floatMiB - 1),
+                            np.abs(
+                                nativeOutput.astype(int) - floatOutput.astype(int)
+                            ).max(),
+                        )
+                    )
+
+
+if __name__ == "__main__":
+    main()
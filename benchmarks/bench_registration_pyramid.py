@@ -0,0 +1,88 @@
+"""Single-level versus multi-resolution ``register_unimodal``.
+
+    python -m benchmarks.bench_registration_pyramid [--scales 1 2 4]
+
+Registers the translation pair from ``assets/registration/translation``
+(a known 13 x 17 pixel shift), upsampled by each scale factor to mimic larger
+images. For every run it reports wall-clock time, total optimizer iterations
+over all levels, the final (full-resolution) metric value and the error
+against the known shift.
+"""
+
+import argparse
+import time
+
+import itk
+
+from src.registration.pyramid import auto_schedule
+from src.registration.unimodal import _register_unimodal
+
+FIXED = "assets/registration/translation/BrainProtonDensitySliceBorder20.png"
+MOVING = "assets/registration/translation/BrainProtonDensitySliceShifted13x17y.png"
+SHIFT = (13.0, 17.0)
+
+
+def _upsample(image, scale):
+    if scale == 1:
+        return image
+    size = [int(s * scale) for s in image.GetLargestPossibleRegion().GetSize()]
+    spacing = [s / scale for s in image.GetSpacing()]
+    resampled = itk.resample_image_filter(
+        image,
+        size=size,
+        output_spacing=spacing,
+        output_origin=image.GetOrigin(),
+        output_direction=image.GetDirection(),
+    )
+    # back to unit spacing so that the shift grows with the scale factor
+    resampled.SetSpacing([1.0] * image.GetImageDimension())
+    return resampled
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args(argv)
+
+    fixedImage = itk.imread(FIXED, itk.F)
+    movingImage = itk.imread(MOVING, itk.F)
+    # warm up ITK's lazy template loading outside the timed runs
+    _register_unimodal(fixedImage, movingImage, numberOfIterations=1)
+
+    print(
+        "%-6s %-10s %-24s %8s %6s %12s %8s"
+        % ("scale", "size", "mode", "time s", "iters", "metric", "err px")
+    )
+    for scale in args.scales:
+        fixed = _upsample(fixedImage, scale)
+        moving = _upsample(movingImage, scale)
+        size = list(fixed.GetLargestPossibleRegion().GetSize())
+
+        for mode, kwargs in [
+            ("single-level", {}),
+            ("pyramid %s" % auto_schedule(size)[0], {"multiResolution": True}),
+        ]:
+            start = time.perf_counter()
+            result = _register_unimodal(fixed, moving, **kwargs)
+            seconds = time.perf_counter() - start
+
+            error = max(
+                abs(result.parameters[0] - SHIFT[0] * scale),
+                abs(result.parameters[1] - SHIFT[1] * scale),
+            )
+            print(
+                "%-6d %-10s %-24s %8.2f %6d %12.5g %8.3f"
+                % (
+                    scale,
+                    "%dx%d" % tuple(size),
+                    mode,
+                    seconds,
+                    result.iterations,
+                    result.metricValue,
+                    error,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Peak memory of whole-image versus tiled smoothing.
+
+    python -m benchmarks.bench_streaming [--size 6000] [--budget 64]
+
+Writes a synthetic ``size x size`` float MHA image and filters it once with
+the regular pipeline and once with ``stream_smooth`` under a ``budget`` MiB
+memory budget. Each run happens in a fresh process so that its peak RSS
+(``ru_maxrss``, measured after loading ITK) is not inherited from the other
+one. The tiled figure includes the pages of its memory-mapped spill and output
+files that were touched; those are file backed and can be dropped by the
+kernel under memory pressure, unlike the whole-image buffers.
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+
+CASES = [
+    ("median", {"radius": 2}),
+    ("discrete_gaussian", {"variance": 3}),
+    ("binomial", {"number_of_repetitions": 3}),
+]
+
+
+def _peak_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _warm_up(filter_name, params):
+    # load ITK's wrapped libraries for this filter before taking the baseline
+    import itk
+
+    from src.smoothing.pipelines import PIPELINES
+
+    pipeline = PIPELINES[filter_name]()
+    pipeline.SetInputArray(np.zeros((8, 8), np.float32))
+    pipeline.SetParameters(**params)
+    pipeline.Update()
+    itk.ExtractImageFilter[pipeline.InputImageType, pipeline.InputImageType].New()
+
+
+def _whole(path, filter_name, params, output, queue):
+    import itk
+
+    from src.smoothing.pipelines import PIPELINES
+
+    _warm_up(filter_name, params)
+    baseline = _peak_rss_mib()
+    start = time.perf_counter()
+    pipeline = PIPELINES[filter_name]()
+    pipeline.SetFileName(path)
+    pipeline.SetParameters(**params)
+    pipeline.Update()
+    itk.imwrite(pipeline.GetOutput(), output)
+    queue.put((time.perf_counter() - start, _peak_rss_mib() - baseline))
+
+
+def _tiled(path, filter_name, params, output, budget, queue):
+    from src.smoothing.streaming import stream_smooth
+
+    _warm_up(filter_name, params)
+    baseline = _peak_rss_mib()
+    start = time.perf_counter()
+    stream_smooth(path, filter_name, params, output, memoryBudget=budget)
+    queue.put((time.perf_counter() - start, _peak_rss_mib() - baseline))
+
+
+def _run(target, *args):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=target, args=args + (queue,))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=6000)
+    parser.add_argument("--budget", type=float, default=64, help="MiB")
+    args = parser.parse_args(argv)
+    budget = int(args.budget * 2**20)
+
+    with tempfile.TemporaryDirectory() as directory:
+        import itk
+
+        path = os.path.join(directory, "input.mha")
+        rng = np.random.default_rng(0)
+        array = rng.normal(128, 40, (args.size, args.size)).astype(np.float32)
+        itk.imwrite(itk.image_view_from_array(array), path)
+        del array
+
+        print(
+            "%dx%d float input (%.0f MiB), tiled budget %.0f MiB"
+            % (args.size, args.size, args.size**2 * 4 / 2**20, args.budget)
+        )
+        print(
+            "%-20s %10s %10s %12s %12s"
+            % ("filter", "whole s", "tiled s", "whole MiB", "tiled MiB")
+        )
+        for filter_name, params in CASES:
+            output = os.path.join(directory, "output.mha")
+            wholeSeconds, wholeMemory = _run(_whole, path, filter_name, params, output)
+            tiledSeconds, tiledMemory = _run(
+                _tiled, path, filter_name, params, output, budget
+            )
+            print(
+                "%-20s %10.2f %10.2f %12.0f %12.0f"
+                % (filter_name, wholeSeconds, tiledSeconds, wholeMemory, tiledMemory)
+            )
+
+
+if __name__ == "__main__":
+    main()
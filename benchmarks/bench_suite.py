@@ -0,0 +1,340 @@
+"""Time, throughput and peak memory of every filter and registration routine.
+
+    python -m benchmarks.bench_suite [--sizes 256 512 1024 2048] [--threads 1 8]
+        [--cases median curve_anisotropic_diffusion ...] [--repeats 3]
+        [--output bench_suite.json] [--compare previous.json]
+
+Each case runs on synthetic square images of every requested size, for every
+parameter set in its grid and every ITK global thread count. One cell (case,
+parameters, size, thread count) runs in its own process, forked from a parent
+that has already instantiated the case's ITK templates on a small image.
+The cell's peak RSS therefore covers only that workload; it is reported both
+as an absolute value and relative to the freshly forked process. Times are
+the median over ``--repeats`` calls, and throughput is input megapixels per
+second.
+
+The results go to a JSON file together with the ITK version, machine and
+arguments. ``--compare`` prints the time ratio against an earlier file for
+every cell found in both.
+
+The result cache (``src.caching``) is disabled here, so every call computes.
+The smoothing cases run on the ITK backend with ``MedianImageFilter``, never
+the NumPy backend or the histogram median a calibration or the image could
+select, so the same code is timed in every run.
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+
+import itk
+import numpy as np
+
+from src.caching import disable_cache
+from src.composite_filter import EdgeFilter, FusedEdgeFilter
+from src.registration.multimodal import _register_legacy, _register_v4
+from src.registration.unimodal import _register_unimodal
+from src.smoothing import bluring, edge_preserving_smoothing
+
+# true translation between the synthetic fixed and moving images
+SHIFT = (7.0, -5.0)
+
+
+def _synthetic(size, shift=(0.0, 0.0), seed=0):
+    # a few smooth blobs plus noise; analytic, so shifted copies are exact
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32)
+    x -= shift[0]
+    y -= shift[1]
+    image = np.zeros((size, size), np.float32)
+    for cx, cy, radius, amplitude in rng.uniform(
+        (0.2, 0.2, 0.05, 60), (0.8, 0.8, 0.2, 200), (6, 4)
+    ):
+        r2 = (x - cx * size) ** 2 + (y - cy * size) ** 2
+        image += amplitude * np.exp(-r2 / (2 * (radius * size) ** 2))
+    image += rng.normal(0, 8, image.shape).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.float32)
+
+
+def _smoothing(function, **fixed):
+    # ``fixed`` pins the implementation (backend, median engine), so that the
+    # automatic choices never change what a case measures between runs
+    def prepare(size):
+        return (_synthetic(size),)
+
+    def run(image, **params):
+        return function(image, **params, **fixed)
+
+    return prepare, run
+
+
+def _edge_filter(EdgeFilterType):
+    def prepare(size):
+        return (itk.image_from_array(_synthetic(size)),)
+
+    def run(image, threshold):
+        edgeFilter = EdgeFilterType()
+        edgeFilter.SetInput(image)
+        edgeFilter.ThresholdBelow(threshold)
+        edgeFilter.Update()
+        return edgeFilter.GetOutput()
+
+    return prepare, run
+
+
+def _registration(function, multimodal):
+    def prepare(size):
+        fixed = _synthetic(size)
+        moving = _synthetic(size, SHIFT)
+        if multimodal:
+            moving = 255.0 - moving
+        return itk.image_from_array(fixed), itk.image_from_array(moving)
+
+    def run(fixed, moving, **params):
+        return function(fixed, moving, **params)
+
+    return prepare, run
+
+
+# name -> (prepare/run pair, parameter grid, largest size worth running)
+CASES = {
+    "binomial": (
+        _smoothing(bluring.binomial_array, backend="itk"),
+        [{"number_of_repetitions": 1}, {"number_of_repetitions": 4}],
+        None,
+    ),
+    "discrete_gaussian": (
+        _smoothing(bluring.discrete_gaussian_array, backend="itk"),
+        [{"variance": 1}, {"variance": 4}],
+        None,
+    ),
+    "recursive_gaussian_iir": (
+        _smoothing(bluring.recursive_gaussian_iir_array, backend="itk"),
+        [{"sigma": 1}, {"sigma": 4}],
+        None,
+    ),
+    "median": (
+        _smoothing(bluring.median_array, backend="itk", engine="filter"),
+        [{"radius": 1}, {"radius": 3}],
+        None,
+    ),
+    "grad_anisotropic_diffusion": (
+        _smoothing(edge_preserving_smoothing.grad_anisotropic_diffusion_array),
+        [{"numberOfIterations": 5}, {"numberOfIterations": 25}],
+        None,
+    ),
+    "curve_anisotropic_diffusion": (
+        _smoothing(edge_preserving_smoothing.curve_anisotropic_diffusion_array),
+        [{"numberOfIterations": 5}, {"numberOfIterations": 25}],
+        None,
+    ),
+    "edge_filter": (_edge_filter(EdgeFilter), [{"threshold": 10.0}], None),
+    "fused_edge_filter": (_edge_filter(FusedEdgeFilter), [{"threshold": 10.0}], None),
+    "register_unimodal": (
+        _registration(_register_unimodal, False),
+        [
+            {"numberOfIterations": 200},
+            {"numberOfIterations": 200, "multiResolution": True},
+        ],
+        None,
+    ),
+    "register_multimodal_v4": (
+        _registration(_register_v4, True),
+        [{"numberOfIterations": 200}],
+        None,
+    ),
+    # the legacy Viola-Wells metric takes seconds even at 256x256
+    "register_multimodal_legacy": (
+        _registration(_register_legacy, True),
+        [{"numberOfIterations": 200}],
+        512,
+    ),
+}
+
+
+def _peak_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _cell(name, params, size, threads, repeats, connection):
+    try:
+        itk.MultiThreaderBase.SetGlobalDefaultNumberOfThreads(threads)
+        (prepare, run), _, _ = CASES[name]
+        inputs = prepare(size)
+        baseline = _peak_rss_mib()
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run(*inputs, **params)
+            times.append(time.perf_counter() - start)
+        peak = _peak_rss_mib()
+        connection.send(
+            {
+                "seconds": statistics.median(times),
+                "seconds_min": min(times),
+                "peak_rss_mib": peak,
+                "peak_rss_delta_mib": peak - baseline,
+                "error": None,
+            }
+        )
+    except Exception as err:
+        connection.send({"error": "%s: %s" % (type(err).__name__, err)})
+    finally:
+        connection.close()
+
+
+def _run_cell(name, params, size, threads, repeats):
+    # fork, so the child inherits the warmed-up ITK modules
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_cell, args=(name, params, size, threads, repeats, sender)
+    )
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {"error": "worker exited with code %s" % process.exitcode}
+    process.join()
+    return result
+
+
+def _warm_up(name):
+    (prepare, run), grid, _ = CASES[name]
+    for params in grid:
+        try:
+            run(*prepare(64), **params)
+        except Exception:
+            # the cells will run into (and report) the same error
+            pass
+
+
+def _key(row):
+    return (
+        row["case"],
+        json.dumps(row["params"], sort_keys=True),
+        row["size"],
+        row["threads"],
+    )
+
+
+def compare(rows, previousPath):
+    """Print the time ratio of ``rows`` against a previous results file."""
+    with open(previousPath) as f:
+        previous = {_key(row): row for row in json.load(f)["results"]}
+    print("\ncompared with %s (ratio > 1 is slower now)" % previousPath)
+    for row in rows:
+        old = previous.get(_key(row))
+        if old is None or row["error"] or old["error"]:
+            continue
+        print(
+            "%-28s %-52s %6d %3d  %8.3fs -> %8.3fs  %5.2fx"
+            % (
+                row["case"],
+                json.dumps(row["params"], sort_keys=True),
+                row["size"],
+                row["threads"],
+                old["seconds"],
+                row["seconds"],
+                row["seconds"] / old["seconds"],
+            )
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 512, 1024, 2048])
+    parser.add_argument(
+        "--threads", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1})
+    )
+    parser.add_argument(
+        "--cases", nargs="+", choices=sorted(CASES), default=list(CASES)
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default="bench_suite.json")
+    parser.add_argument("--compare", default=None, help="earlier results JSON")
+    args = parser.parse_args(argv)
+
+    disable_cache()
+
+    rows = []
+    print(
+        "%-28s %-52s %6s %3s %10s %10s %10s"
+        % ("case", "params", "size", "thr", "seconds", "MP/s", "peak MiB")
+    )
+    for name in args.cases:
+        _warm_up(name)
+        _, grid, maximumSize = CASES[name]
+        for params in grid:
+            for size in args.sizes:
+                if maximumSize is not None and size > maximumSize:
+                    continue
+                for threads in args.threads:
+                    result = _run_cell(name, params, size, threads, args.repeats)
+                    row = {
+                        "case": name,
+                        "params": params,
+                        "size": size,
+                        "threads": threads,
+                        "repeats": args.repeats,
+                        "megapixels": size * size / 1e6,
+                        "seconds": None,
+                        "seconds_min": None,
+                        "megapixels_per_second": None,
+                        "peak_rss_mib": None,
+                        "peak_rss_delta_mib": None,
+                    }
+                    row.update(result)
+                    if row["error"] is None:
+                        row["megapixels_per_second"] = (
+                            row["megapixels"] / row["seconds"]
+                        )
+                        print(
+                            "%-28s %-52s %6d %3d %10.4f %10.2f %10.0f"
+                            % (
+                                name,
+                                json.dumps(params, sort_keys=True),
+                                size,
+                                threads,
+                                row["seconds"],
+                                row["megapixels_per_second"],
+                                row["peak_rss_delta_mib"],
+                            )
+                        )
+                    else:
+                        print("%-28s %6d %3d  %s" % (name, size, threads, row["error"]))
+                    rows.append(row)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "itk": itk.Version.GetITKVersion(),
+            "numpy": np.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "argv": sys.argv[1:] if argv is None else list(argv),
+        },
+        "results": rows,
+    }
+    dir, _ = os.path.split(args.output)
+    if dir:
+        os.makedirs(dir, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("wrote %d results to %s" % (len(rows), args.output))
+
+    if args.compare is not None:
+        compare(rows, args.compare)
+
+
+if __name__ == "__main__":
+    main()
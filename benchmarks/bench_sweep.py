@@ -0,0 +1,116 @@
+"""Parameter sweep versus calling the ``*_array`` functions in a loop.
+
+    python -m benchmarks.bench_sweep [--workers N] [--repeats 3]
+
+For each grid, the loop reads the image and builds a new pipeline per
+combination, the way a notebook calling ``grad_anisotropic_diffusion`` over
+and over does (minus the plots). ``sweep`` reads once, reuses one pipeline
+per worker and, for diffusion, resumes each iteration count from the
+previous one; ``incremental=False`` shows how much of that is the resuming.
+Every sweep output is checked against the loop's. Timings are the best of
+``--repeats`` runs and exclude scoring, which is reported separately.
+"""
+
+import argparse
+import time
+
+import itk
+import numpy as np
+
+from src.caching import disable_cache
+from src.smoothing import bluring, edge_preserving_smoothing
+from src.smoothing.sweep import sweep
+
+IMAGE = "assets/brain-noise.png"
+
+GRIDS = [
+    (
+        "grad_anisotropic_diffusion",
+        edge_preserving_smoothing.grad_anisotropic_diffusion_array,
+        {"numberOfIterations": [5, 10, 25, 50], "conductance": [1.0, 3.0, 9.0]},
+    ),
+    (
+        "curve_anisotropic_diffusion",
+        edge_preserving_smoothing.curve_anisotropic_diffusion_array,
+        {"numberOfIterations": [5, 10, 25], "conductance": [1.0, 3.0]},
+    ),
+    ("median", bluring.median_array, {"radius": [1, 2, 3, 4, 5]}),
+    (
+        "discrete_gaussian",
+        bluring.discrete_gaussian_array,
+        {"variance": [1, 2, 4, 8, 16]},
+    ),
+]
+
+
+def _loop(function, combinations):
+    outputs = []
+    for parameters in combinations:
+        outputs.append(np.array(function(itk.imread(IMAGE, itk.F), **parameters)))
+    return np.stack(outputs)
+
+
+def _best_of(repeats, run):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        value = run()
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best[1]:
+            best = value, seconds
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    disable_cache()
+    # reference for the scores: the strongest median of the grid above
+    reference = np.array(bluring.median_array(itk.imread(IMAGE, itk.F), 3))
+
+    print(
+        "%-30s %6s %10s %12s %12s %9s"
+        % ("filter", "combos", "loop s", "sweep s", "resume s", "speedup")
+    )
+    for name, function, grid in GRIDS:
+        # warm up template instantiation
+        sweep(IMAGE, name, {key: values[:1] for key, values in grid.items()}, workers=1)
+
+        full, fullSeconds = _best_of(
+            args.repeats, lambda: sweep(IMAGE, name, grid, workers=args.workers)
+        )
+        loop, loopSeconds = _best_of(
+            args.repeats, lambda: _loop(function, full.parameters)
+        )
+        assert np.array_equal(loop, full.outputs), name
+        _, plainSeconds = _best_of(
+            args.repeats,
+            lambda: sweep(IMAGE, name, grid, workers=args.workers, incremental=False),
+        )
+
+        start = time.perf_counter()
+        scored = sweep(IMAGE, name, grid, reference=reference, workers=args.workers)
+        scoredSeconds = time.perf_counter() - start
+        print(
+            "%-30s %6d %10.3f %12.3f %12.3f %8.2fx"
+            % (
+                name,
+                len(full),
+                loopSeconds,
+                plainSeconds,
+                fullSeconds,
+                loopSeconds / fullSeconds,
+            )
+        )
+        parameters, _, metrics = scored.best("ssim")
+        print(
+            "%30s best SSIM %.4f at %s (%.3fs with scoring)"
+            % ("", metrics["ssim"], parameters, scoredSeconds)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Throughput of the batch engine for every split of the cores.
+
+    python -m benchmarks.bench_threads [--cpus N] [--repeats 2]
+
+Each workload smooths a set of synthetic PNGs with ``batch_smooth``: many
+small images with a cheap filter, a few large images with anisotropic
+diffusion, and a middle case. For every split of ``--cpus`` (default: all
+cores) into workers x ITK threads per worker, from 1 x cpus to cpus x 1,
+and for the old default of one worker per core that keeps ITK's own thread
+count (cpus x cpus), it reports the files per second (best of
+``--repeats``). The split ``plan_workers`` picks for ``--cpus`` cores (as
+``plan_batch`` does) is marked with ``*``.
+
+The curve needs several cores: on a single core every split is 1 x 1, and
+a ``--cpus`` above the real count only shows the cost of oversubscribing.
+"""
+
+import argparse
+import os
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.bench_suite import _synthetic
+from src.caching import disable_cache
+from src.jobs.threads import plan_workers
+from src.smoothing.batch import batch_smooth
+from src.smoothing.pipelines import PIPELINES
+
+WORKLOADS = [
+    # (name, files, size, filter, params)
+    ("many small, median r1", 64, 256, "median", {"radius": 1}),
+    ("middle, median r3", 16, 1024, "median", {"radius": 3}),
+    (
+        "few large, diffusion 10",
+        2,
+        2048,
+        "grad_anisotropic_diffusion",
+        {"numberOfIterations": 10},
+    ),
+]
+
+
+def _splits(cpus):
+    workers = sorted({cpus // threads for threads in range(1, cpus + 1)})
+    return [(count, cpus // count) for count in workers] + [(cpus, cpus)]
+
+
+def _inputs(directory, files, size):
+    paths = []
+    for seed in range(files):
+        path = os.path.join(directory, "input%03d.png" % seed)
+        Image.fromarray(_synthetic(size, seed=seed).astype(np.uint8)).save(path)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cpus", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeats", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    disable_cache()
+    print("%d cores\n" % args.cpus)
+    print("%-26s %8s %8s %10s" % ("workload", "workers", "threads", "files/s"))
+    for name, files, size, filterName, params in WORKLOADS:
+        with tempfile.TemporaryDirectory() as directory:
+            paths = _inputs(directory, files, size)
+            output = os.path.join(directory, "output")
+            planned = plan_workers(
+                files,
+                size * size,
+                PIPELINES[filterName].GetWorkPerPixel(2, **params),
+                cpus=args.cpus,
+            )
+            # not timed: loads the filter's ITK module
+            batch_smooth(paths[:1], filterName, params, output, workers=1, threads=1)
+            for workers, threads in _splits(args.cpus):
+                rates = [
+                    batch_smooth(
+                        paths,
+                        filterName,
+                        params,
+                        output,
+                        workers=workers,
+                        threads=threads,
+                        writers=0,
+                    )["files_per_second"]
+                    for _ in range(args.repeats)
+                ]
+                marker = "*" if (workers, threads) == planned else ""
+                print(
+                    "%-26s %8d %8d %10.2f %s"
+                    % (name, workers, threads, max(rates), marker)
+                )
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Whole-volume processing versus the slice-by-slice Python loop.
+
+    python -m benchmarks.bench_volume [--shape 64 256 256] [--repeats 3]
+
+Runs every filter once on a synthetic ``shape`` (z, y, x) volume with the 3D
+pipeline, and once per z slice with a reused 2D pipeline, stacking the
+slices. The 3D filters use 3D kernels, so the two results are not the same
+image: this measures what replacing the loop costs or saves, not a
+bit-identical port. The registration case compares one 3D translation
+registration against registering every slice pair independently.
+
+ITK's global thread count (all cores by default, ``--threads`` otherwise)
+applies to both sides.
+"""
+
+import argparse
+import statistics
+import time
+
+import itk
+import numpy as np
+
+from src.caching import disable_cache
+from src.composite_filter import EdgeFilter
+from src.registration.multimodal import _register_v4
+from src.smoothing import bluring, edge_preserving_smoothing, pipelines
+
+SHIFT = (3.0, -2.0, 1.5)
+
+
+def _synthetic(shape, shift=(0.0, 0.0, 0.0), seed=0):
+    rng = np.random.default_rng(seed)
+    z, y, x = np.mgrid[0 : shape[0], 0 : shape[1], 0 : shape[2]].astype(np.float32)
+    x -= shift[0]
+    y -= shift[1]
+    z -= shift[2]
+    volume = np.zeros(shape, np.float32)
+    for cz, cy, cx, radius, amplitude in rng.uniform(
+        (0.2, 0.2, 0.2, 0.1, 60), (0.8, 0.8, 0.8, 0.25, 200), (5, 5)
+    ):
+        r2 = (
+            ((z - cz * shape[0]) / shape[0]) ** 2
+            + ((y - cy * shape[1]) / shape[1]) ** 2
+            + ((x - cx * shape[2]) / shape[2]) ** 2
+        )
+        volume += amplitude * np.exp(-r2 / (2 * radius**2))
+    volume += rng.normal(0, 8, shape).astype(np.float32)
+    return np.clip(volume, 0, 255).astype(np.float32)
+
+
+def _smoothing(function, PipelineType, params):
+    def volume(array):
+        return function(array, **params)
+
+    def slices(array):
+        pipeline = PipelineType()
+        return np.stack(
+            [np.array(function(s, pipeline=pipeline, **params)) for s in array]
+        )
+
+    return volume, slices
+
+
+def _edges(array, edgeFilter):
+    edgeFilter.SetInput(itk.image_view_from_array(array))
+    edgeFilter.ThresholdBelow(10.0)
+    edgeFilter.Update()
+    return itk.array_from_image(edgeFilter.GetOutput())
+
+
+def _edge_filter():
+    def volume(array):
+        return _edges(array, EdgeFilter(3))
+
+    def slices(array):
+        edgeFilter = EdgeFilter()
+        return np.stack([_edges(s, edgeFilter) for s in array])
+
+    return volume, slices
+
+
+def _registration(moving):
+    def volume(array):
+        return _register_v4(
+            itk.image_from_array(array), itk.image_from_array(moving)
+        ).parameters
+
+    def slices(array):
+        return [
+            _register_v4(
+                itk.image_from_array(np.ascontiguousarray(f)),
+                itk.image_from_array(np.ascontiguousarray(m)),
+            ).parameters
+            for f, m in zip(array, moving)
+        ]
+
+    return volume, slices
+
+
+def _time(function, array, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(array)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shape", type=int, nargs=3, default=[64, 256, 256])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    disable_cache()
+    if args.threads is not None:
+        itk.MultiThreaderBase.SetGlobalDefaultNumberOfThreads(args.threads)
+
+    shape = tuple(args.shape)
+    array = _synthetic(shape)
+    moving = 255.0 - _synthetic(shape, SHIFT)
+    cases = [
+        (
+            "median r=2",
+            _smoothing(bluring.median_array, pipelines.MedianFilter, {"radius": 2}),
+        ),
+        (
+            "discrete_gaussian v=4",
+            _smoothing(
+                bluring.discrete_gaussian_array,
+                pipelines.DiscreteGaussianFilter,
+                {"variance": 4},
+            ),
+        ),
+        (
+            "recursive_gaussian s=2",
+            _smoothing(
+                bluring.recursive_gaussian_iir_array,
+                pipelines.RecursiveGaussianFilter,
+                {"sigma": 2},
+            ),
+        ),
+        (
+            "grad_diffusion 10 it",
+            _smoothing(
+                edge_preserving_smoothing.grad_anisotropic_diffusion_array,
+                pipelines.GradientAnisotropicDiffusionFilter,
+                {"numberOfIterations": 10},
+            ),
+        ),
+        ("edge_filter", _edge_filter()),
+        ("register_multimodal v4", _registration(moving)),
+    ]
+
+    print(
+        "%s volume (%.1f MVoxel), %d ITK threads"
+        % (
+            "x".join(map(str, shape)),
+            np.prod(shape) / 1e6,
+            itk.MultiThreaderBase.GetGlobalDefaultNumberOfThreads(),
+        )
+    )
+    print("%-24s %12s %12s %8s" % ("case", "volume s", "slices s", "speedup"))
+    for name, (volume, slices) in cases:
+        # warm up template instantiation for both dimensions
+        volume(array[:8, :32, :32].copy())
+        slices(array[:2, :32, :32].copy())
+        volumeSeconds = _time(volume, array, args.repeats)
+        slicesSeconds = _time(slices, array, args.repeats)
+        print(
+            "%-24s %12.3f %12.3f %7.2fx"
+            % (name, volumeSeconds, slicesSeconds, slicesSeconds / volumeSeconds)
+        )
+
+    parameters = _registration(moving)[0](array)
+    print(
+        "3D registration recovered (%s), true shift (%s)"
+        % (
+            ", ".join("%.2f" % p for p in parameters),
+            ", ".join("%.2f" % s for s in SHIFT),
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
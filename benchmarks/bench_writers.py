@@ -0,0 +1,167 @@
+"""Output formats and background writes.
+
+    python -m benchmarks.bench_writers [--size 2048] [--files 8] [--repeats 3]
+
+The format table writes one smoothed ``--size`` squared uint8 image (and a
+volume of ``--size // 8`` cubed) in every format: PNG at PIL's default level
+and at level 1, MHA and NRRD at the ``FAST`` zlib level and raw, the chunk
+store, and ``itk.imwrite`` with compression for comparison. Every file is
+read back and checked against the array; times are the median of
+``--repeats`` writes.
+
+The overlap table runs the loop of a batch job: smooth ``--files`` images
+with ``discrete_gaussian_array`` and export each output, once writing in the
+loop and once through a ``WriterPool`` with one and two threads. The
+"bound" column is the larger of the total compute and the total write time,
+the best a perfect overlap could do. ``itk.imwrite`` holds the GIL, so its
+row shows no gain from the pool. The writer threads need a core of their
+own: on a single core they take turns with the filter, the pool cannot beat
+the "in loop" row and its write times include the waits for the core.
+"""
+
+import argparse
+import contextlib
+import os
+import statistics
+import tempfile
+import time
+
+import itk
+import numpy as np
+
+from benchmarks.bench_suite import _synthetic
+from src.caching import disable_cache
+from src.export import FAST, WriterPool, open_chunked, save, write
+from src.smoothing import bluring
+
+CASES = [
+    ("png", ".png", {}),
+    ("png level 1", ".png", {"compression": 1}),
+    ("mha fast", ".mha", {}),
+    ("mha raw", ".mha", {"compression": None}),
+    ("nrrd fast", ".nrrd", {}),
+    ("zarr fast", ".zarr", {}),
+    ("itk.imwrite mha", ".mha", {"format": "itk", "compression": True}),
+]
+
+
+def _read(path):
+    if path.endswith(".zarr"):
+        return open_chunked(path)[...]
+    return itk.array_from_image(itk.imread(path))
+
+
+def _size(path):
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)
+        )
+    return os.path.getsize(path)
+
+
+def _median_seconds(repeats, function, *args, **kwargs):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def _format_table(directory, size, repeats):
+    image = bluring.discrete_gaussian_array(_synthetic(size), 2.0)
+    volume = (
+        np.stack([image[: size // 8, : size // 8]] * (size // 8))
+        + np.arange(size // 8, dtype=np.uint8)[:, None, None]
+    )
+    print("zlib level of the fast formats: %d\n" % FAST)
+    print("%-18s %-18s %10s %10s %8s" % ("format", "image", "write s", "MiB", "ratio"))
+    for label, array in (("%d^2" % size, image), ("%d^3" % (size // 8), volume)):
+        for name, extension, options in CASES:
+            if extension == ".png" and array.ndim != 2:
+                continue
+            path = os.path.join(directory, name.replace(" ", "_") + extension)
+            seconds = _median_seconds(repeats, write, array, path, **options)
+            assert np.array_equal(_read(path), array), name
+            print(
+                "%-18s %-18s %10.4f %10.2f %7.2fx"
+                % (
+                    name,
+                    label,
+                    seconds,
+                    _size(path) / 2**20,
+                    array.nbytes / _size(path),
+                )
+            )
+
+
+def _batch(images, directory, extension, options, writers):
+    start = time.perf_counter()
+    compute = 0.0
+    futures = []
+    with WriterPool(writers) if writers else contextlib.nullcontext():
+        for i, image in enumerate(images):
+            computeStart = time.perf_counter()
+            out = bluring.discrete_gaussian_array(image, 4.0)
+            compute += time.perf_counter() - computeStart
+            futures.append(
+                save(out, os.path.join(directory, "%d%s" % (i, extension)), **options)
+            )
+    return time.perf_counter() - start, compute, futures
+
+
+def _overlap_table(directory, size, files, repeats):
+    images = [_synthetic(size, seed=seed) for seed in range(files)]
+    print(
+        "\n%-18s %8s %10s %10s %10s %10s"
+        % ("format", "writers", "wall s", "compute s", "write s", "bound s")
+    )
+    for name, extension, options in CASES:
+        if name in ("mha raw", "png level 1"):
+            continue
+        # the synchronous run gives the total write time
+        runs = [
+            _batch(images, directory, extension, options, 0) for _ in range(repeats)
+        ]
+        wall, compute, _ = min(runs, key=lambda run: run[0])
+        writes = wall - compute
+        print(
+            "%-18s %8s %10.3f %10.3f %10.3f %10.3f"
+            % (name, "in loop", wall, compute, writes, max(compute, writes))
+        )
+        for writers in (1, 2):
+            runs = [
+                _batch(images, directory, extension, options, writers)
+                for _ in range(repeats)
+            ]
+            wall, compute, futures = min(runs, key=lambda run: run[0])
+            print(
+                "%-18s %8d %10.3f %10.3f %10.3f %10s"
+                % (
+                    name,
+                    writers,
+                    wall,
+                    compute,
+                    sum(future.result() for future in futures),
+                    "",
+                )
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    disable_cache()
+    # not timed: loads the ITK modules
+    bluring.discrete_gaussian_array(_synthetic(64), 4.0)
+    with tempfile.TemporaryDirectory() as directory:
+        _format_table(directory, args.size, args.repeats)
+        _overlap_table(directory, args.size, args.files, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+from .result_cache import (
+    ResultCache,
+    cache_stats,
+    cached,
+    disable_cache,
+    enable_cache,
+    get_cache,
+)
@@ -0,0 +1,269 @@
+"""Opt-in on-disk cache for the smoothing and registration results.
+
+Entries are content addressed: the key is a SHA-256 over the function name,
+the ITK version, ``CACHE_VERSION`` and every argument, where image files are
+hashed by their bytes (not their path or modification time), NumPy arrays by
+dtype, shape and data, and ``itk.Image`` objects by pixel type, geometry and
+pixels; other objects hash the value their ``GetCacheKey()`` returns.
+Re-running an experiment on the same data therefore hits the cache even if
+the files were copied or renamed, and an ITK upgrade or a change to
+``CACHE_VERSION`` never serves stale results.
+
+Results are pickled into one file per key. The directory is kept below
+``maxBytes`` by removing the least recently used entries; a hit refreshes the
+entry's modification time, which doubles as its LRU stamp, so several
+processes (e.g. the batch workers) can share one directory.
+
+The cache is off unless ``enable_cache()`` is called or the
+``ITK_EXPLORE_CACHE_DIR`` environment variable is set (which also covers
+worker processes that are spawned rather than forked). Calls whose arguments
+cannot be hashed, e.g. ones that pass a reusable ``pipeline=``, run uncached.
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+import time
+
+import itk
+import numpy as np
+
+# bump whenever a cached function changes its results
+CACHE_VERSION = 2
+
+DEFAULT_MAX_BYTES = 2 * 2**30
+
+_SUFFIX = ".pkl"
+_CHUNK = 2**20
+
+
+class _Unhashable(Exception):
+    pass
+
+
+def _update_file(h, path):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+
+
+def _update(h, value):
+    # a type tag in front of every value keeps e.g. 1 and "1" apart
+    if value is None or isinstance(value, (bool, int, float)):
+        h.update(b"s" + repr(value).encode())
+    elif isinstance(value, str):
+        if os.path.isfile(value):
+            h.update(b"f")
+            _update_file(h, value)
+        else:
+            h.update(b"t" + value.encode() + b"\0")
+    elif isinstance(value, (list, tuple)):
+        h.update(b"l%d" % len(value))
+        for item in value:
+            _update(h, item)
+    elif isinstance(value, dict):
+        h.update(b"d%d" % len(value))
+        for key in sorted(value):
+            _update(h, key)
+            _update(h, value[key])
+    elif isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        h.update(b"a" + array.dtype.str.encode() + repr(array.shape).encode())
+        h.update(memoryview(array).cast("B"))
+    elif isinstance(value, itk.DataObject) and hasattr(value, "GetSpacing"):
+        h.update(b"i" + type(value).__name__.encode())
+        _update(h, [float(v) for v in value.GetSpacing()])
+        _update(h, [float(v) for v in value.GetOrigin()])
+        _update(h, itk.array_from_matrix(value.GetDirection()))
+        _update(h, itk.array_view_from_image(value))
+    elif hasattr(value, "GetCacheKey"):
+        # objects derived from their inputs alone, e.g. PreparedFixedImage
+        h.update(b"k" + type(value).__name__.encode())
+        _update(h, value.GetCacheKey())
+    else:
+        raise _Unhashable(type(value).__name__)
+
+
+class ResultCache:
+    """Directory of pickled results with LRU eviction and hit/miss counters."""
+
+    def __init__(self, directory, maxBytes=DEFAULT_MAX_BYTES):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.maxBytes = maxBytes
+        os.makedirs(self.directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.evictions = 0
+        self.secondsSaved = 0.0
+
+    def key(self, name, arguments):
+        """Hex digest for calling ``name`` with the ``arguments`` mapping."""
+        h = hashlib.sha256()
+        _update(h, [name, itk.Version.GetITKVersion(), CACHE_VERSION])
+        _update(h, arguments)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def get(self, key):
+        """Return ``(True, value)`` for a hit, ``(False, None)`` otherwise."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                seconds, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return False, None
+        try:
+            os.utime(path)
+        except OSError:
+            # evicted by another process meanwhile, the value is still good
+            pass
+        self.hits += 1
+        self.secondsSaved += seconds
+        return True, value
+
+    def put(self, key, value, seconds):
+        # write to a temporary file first so readers never see partial entries
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((seconds, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self._path(key))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.evict()
+
+    def entries(self):
+        """``(mtime, size, path)`` of every entry, least recently used first."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(_SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, maxBytes=None):
+        """Remove least recently used entries until at most ``maxBytes`` remain."""
+        maxBytes = self.maxBytes if maxBytes is None else maxBytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= maxBytes:
+                break
+            try:
+                os.unlink(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        self.evict(0)
+
+    def stats(self):
+        calls = self.hits + self.misses
+        entries = self.entries()
+        return {
+            "directory": self.directory,
+            "hits": self.hits,
+            "misses": self.misses,
+            "uncacheable": self.uncacheable,
+            "hit_rate": self.hits / calls if calls else 0.0,
+            "seconds_saved": self.secondsSaved,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.maxBytes,
+        }
+
+
+_cache = None
+
+
+def enable_cache(directory=None, maxBytes=DEFAULT_MAX_BYTES):
+    """Turn the cache on for this process and return it.
+
+    ``directory`` defaults to ``$ITK_EXPLORE_CACHE_DIR`` or
+    ``~/.cache/itk-explore``. The variable is set to the chosen directory so
+    that worker processes pick up the same cache.
+    """
+    global _cache
+    if directory is None:
+        directory = os.environ.get(
+            "ITK_EXPLORE_CACHE_DIR", os.path.join("~", ".cache", "itk-explore")
+        )
+    _cache = ResultCache(directory, maxBytes)
+    os.environ["ITK_EXPLORE_CACHE_DIR"] = _cache.directory
+    os.environ["ITK_EXPLORE_CACHE_MAX_BYTES"] = str(maxBytes)
+    return _cache
+
+
+def disable_cache():
+    global _cache
+    _cache = None
+    os.environ.pop("ITK_EXPLORE_CACHE_DIR", None)
+    os.environ.pop("ITK_EXPLORE_CACHE_MAX_BYTES", None)
+
+
+def get_cache():
+    """The active ``ResultCache``, or ``None`` when caching is off."""
+    return _cache
+
+
+def cache_stats():
+    return None if _cache is None else _cache.stats()
+
+
+def cached(function):
+    """Cache the results of ``function`` while the cache is enabled.
+
+    Only for functions whose result depends on nothing but their arguments
+    and that return a picklable value.
+    """
+    signature = inspect.signature(function)
+    name = "%s.%s" % (function.__module__, function.__qualname__)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        cache = _cache
+        if cache is None:
+            return function(*args, **kwargs)
+
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        try:
+            key = cache.key(name, bound.arguments)
+        except _Unhashable:
+            cache.uncacheable += 1
+            return function(*args, **kwargs)
+
+        hit, value = cache.get(key)
+        if hit:
+            return value
+        start = time.perf_counter()
+        value = function(*args, **kwargs)
+        cache.put(key, value, time.perf_counter() - start)
+        return value
+
+    return wrapper
+
+
+if "ITK_EXPLORE_CACHE_DIR" in os.environ:
+    enable_cache(
+        os.environ["ITK_EXPLORE_CACHE_DIR"],
+        int(os.environ.get("ITK_EXPLORE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+    )
@@ -1 +1,2 @@
 from .edge_filter import EdgeFilter
+from .fused_edge_filter import FusedEdgeFilter
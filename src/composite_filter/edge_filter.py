@@ -1,16 +1,41 @@
 import itk
 
+from ..profiling import instrument
+
+
+class _ImageType:
+    """``itk.Image[<pixel type attribute>, Dimension]``, looked up on access.
+
+    Instantiating ``itk.Image`` loads ITK's image wrappers, which should not
+    happen just because this module was imported. Reading the attribute on
+    the class or on an instance gives the type for that ``Dimension``.
+    """
+
+    def __init__(self, pixelTypeAttribute):
+        self.pixelTypeAttribute = pixelTypeAttribute
+
+    def __get__(self, instance, owner):
+        source = owner if instance is None else instance
+        return itk.Image[getattr(source, self.pixelTypeAttribute), source.Dimension]
+
 
 class EdgeFilter:
     InputPixelType = itk.F
     IntermediatePixelType = itk.F
     OutputPixelType = itk.UC
     Dimension = 2
-    InputImageType = itk.Image[InputPixelType, Dimension]
-    IntermediateImageType = itk.Image[IntermediatePixelType, Dimension]
-    OutputImageType = itk.Image[OutputPixelType, Dimension]
+    InputImageType = _ImageType("InputPixelType")
+    IntermediateImageType = _ImageType("IntermediatePixelType")
+    OutputImageType = _ImageType("OutputPixelType")
+
+    def __init__(self, Dimension=None):
+        self.threshold = None
+        self._build(self.Dimension if Dimension is None else Dimension)
+
+    def _build(self, Dimension):
+        # the image type attributes follow the instance's Dimension
+        self.Dimension = Dimension
 
-    def __init__(self):
         self.gradientFilter = itk.GradientMagnitudeImageFilter[
             self.InputImageType, self.IntermediateImageType
         ].New()
@@ -27,13 +52,23 @@ class EdgeFilter:
         self.rescaler.SetOutputMinimum(0)
         self.rescaler.SetOutputMaximum(255)
 
+        if self.threshold is not None:
+            self.thresholdFilter.ThresholdBelow(self.threshold)
+
     def ThresholdBelow(self, m_Threshold):
+        self.threshold = m_Threshold
         self.thresholdFilter.ThresholdBelow(m_Threshold)
 
     def SetInput(self, input):
+        # a volume (or any other dimension) rebuilds the filters for it, so one
+        # EdgeFilter works on slices and whole volumes alike
+        if input.GetImageDimension() != self.Dimension:
+            self._build(input.GetImageDimension())
         self.gradientFilter.SetInput(input)
 
     def Update(self):
+        for stage in (self.gradientFilter, self.thresholdFilter, self.rescaler):
+            instrument(stage, category="EdgeFilter")
         self.rescaler.Update()
 
     def GetOutput(self):
@@ -0,0 +1,3 @@
+from .background import WriterPool, save
+from .chunked import ChunkedArray, open_chunked, write_chunked
+from .formats import FAST, FORMATS, format_for, geometry_of, write
@@ -0,0 +1,153 @@
+"""Background writes, so that encoding overlaps the next computation.
+
+    from src.export import WriterPool
+
+    with WriterPool(maxWorkers=2):
+        for path in paths:
+            median(path, 3, outputPathFor(path))  # returns once the output is queued
+    # leaving the block waits for the writes and raises the first failure
+
+While a pool is open in a ``with`` block, every export path (``_export`` of
+the smoothing functions, ``RegistrationResult.export``, the batch engine)
+hands its arrays to the pool through ``save`` instead of writing them
+itself. The pool copies each array before queueing it, so the caller may
+reuse its buffers (the batch pipelines overwrite their output with the next
+file) right away.
+
+At most ``maxPendingBytes`` of arrays wait or are being written; ``submit``
+blocks until enough of them are done, so a producer faster than the disk
+does not pile up copies in memory. A single array larger than the limit is
+still written, on its own.
+
+The writers overlap with other threads only while they do not hold the GIL:
+PNG, MHA, NRRD and the chunk store do (see ``formats.py``), the ``"itk"``
+fallback does not.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+
+from .formats import write
+
+DEFAULT_PENDING_BYTES = 256 * 2**20
+
+_active = None
+
+
+def _timed_write(array, path, geometry, format, options):
+    start = time.perf_counter()
+    write(array, path, geometry, format, **options)
+    return time.perf_counter() - start
+
+
+class WriterPool:
+    """Writes images in ``maxWorkers`` background threads.
+
+    ``submit`` returns a ``concurrent.futures.Future`` whose result is the
+    time the write took in seconds.
+    """
+
+    def __init__(self, maxWorkers=2, maxPendingBytes=DEFAULT_PENDING_BYTES):
+        if maxWorkers < 1:
+            raise ValueError("maxWorkers must be at least 1")
+        self.maxWorkers = maxWorkers
+        self.maxPendingBytes = maxPendingBytes
+        self._executor = ThreadPoolExecutor(maxWorkers, thread_name_prefix="writer")
+        self._condition = threading.Condition()
+        self._pendingBytes = 0
+        self._futures = []
+        self._previous = None
+
+    @property
+    def pendingBytes(self):
+        """Bytes of the arrays queued or being written."""
+        return self._pendingBytes
+
+    def _done(self, size):
+        with self._condition:
+            self._pendingBytes -= size
+            self._condition.notify_all()
+
+    def submit(self, array, path, geometry=None, format=None, copy=True, **options):
+        """Queue ``write(array, path, geometry, format, **options)``.
+
+        With ``copy=False`` the array is written as it is when the write
+        runs, and must not change before the future is done.
+        """
+        if self._executor is None:
+            raise RuntimeError("The writer pool is closed")
+        size = np.asarray(array).nbytes
+        with self._condition:
+            while (
+                self._pendingBytes and self._pendingBytes + size > self.maxPendingBytes
+            ):
+                self._condition.wait()
+            self._pendingBytes += size
+        try:
+            if copy:
+                array = np.array(array, copy=True)
+            future = self._executor.submit(
+                _timed_write, array, path, geometry, format, options
+            )
+        except BaseException:
+            self._done(size)
+            raise
+        future.add_done_callback(lambda _: self._done(size))
+        self._futures.append(future)
+        return future
+
+    def wait(self, raiseErrors=True):
+        """Wait for every write queued so far.
+
+        Raises the first failed write's exception unless ``raiseErrors`` is
+        false; the failures are then only reported by their futures.
+        """
+        futures, self._futures = self._futures, []
+        wait(futures)
+        if raiseErrors:
+            for future in futures:
+                if future.exception() is not None:
+                    raise future.exception()
+
+    def close(self, raiseErrors=True):
+        """Wait for the queued writes (see ``wait``) and stop the threads."""
+        if self._executor is None:
+            return
+        try:
+            self.wait(raiseErrors)
+        finally:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        _active = self
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        global _active
+        _active = self._previous
+        # an error in the block is not hidden behind a failed write
+        self.close(raiseErrors=excType is None)
+
+
+def active():
+    """The pool of the innermost open ``with WriterPool()`` block, or ``None``."""
+    return _active
+
+
+def save(array, path, geometry=None, format=None, **options):
+    """Write ``array`` through the active pool, or right away without one.
+
+    Returns the pool's future, or None when the array was written
+    synchronously.
+    """
+    pool = _active
+    if pool is None:
+        write(array, path, geometry, format, **options)
+        return None
+    return pool.submit(array, path, geometry, format, **options)
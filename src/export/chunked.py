@@ -0,0 +1,204 @@
+"""Chunked, compressed array store for large outputs.
+
+    write_chunked(volume, "out/volume.zarr", geometry=information)
+    store = open_chunked("out/volume.zarr")
+    slab = store[100:116]  # reads only the chunks this slab touches
+
+The store is a directory in the Zarr version 2 layout: a ``.zarray`` JSON
+file with the shape, chunk shape and data type, one zlib compressed file per
+chunk named by its chunk indices (``"0.3.1"``), and the image geometry in
+``.zattrs``. Edge chunks are padded to the full chunk shape, as Zarr
+expects, so ``zarr.open(path)`` reads the store where Zarr is installed;
+``open_chunked`` needs only NumPy.
+
+Each chunk is compressed on its own, so writing one never holds more than a
+chunk of compressed data, and reading a region decompresses only the chunks
+it overlaps.
+"""
+
+import itertools
+import json
+import math
+import os
+import zlib
+
+import numpy as np
+
+from .formats import FAST
+
+# bytes of one chunk when no chunk shape is given
+DEFAULT_CHUNK_BYTES = 2**20
+
+
+def default_chunks(shape, itemsize):
+    """Chunk shape of about ``DEFAULT_CHUNK_BYTES`` with equal edges."""
+    edge = max(1, int((DEFAULT_CHUNK_BYTES / itemsize) ** (1.0 / len(shape))))
+    return tuple(min(edge, size) for size in shape)
+
+
+def _chunk_ranges(shape, chunks):
+    return itertools.product(
+        *[range(math.ceil(size / chunk)) for size, chunk in zip(shape, chunks)]
+    )
+
+
+def write_chunked(array, path, chunks=None, compression=FAST, geometry=None):
+    """Write ``array`` (NumPy order) as a chunk store at ``path``.
+
+    ``array`` may be a memory map; it is read one chunk at a time.
+    ``geometry`` (ITK order, see ``formats.py``) is kept in ``.zattrs``.
+    """
+    dtype = np.dtype(array.dtype).newbyteorder("<")
+    shape = tuple(int(s) for s in array.shape)
+    chunks = tuple(chunks or default_chunks(shape, dtype.itemsize))
+    if len(chunks) != len(shape):
+        raise ValueError("chunks %s do not match the shape %s" % (chunks, shape))
+    os.makedirs(path, exist_ok=True)
+
+    padded = np.zeros(chunks, dtype)
+    for index in _chunk_ranges(shape, chunks):
+        region = tuple(
+            slice(i * chunk, min((i + 1) * chunk, size))
+            for i, chunk, size in zip(index, chunks, shape)
+        )
+        block = array[region]
+        if block.shape != chunks:
+            padded[...] = 0
+            padded[tuple(slice(0, s) for s in block.shape)] = block
+            block = padded
+        data = np.ascontiguousarray(block, dtype).tobytes()
+        if compression is not None:
+            data = zlib.compress(data, compression)
+        with open(os.path.join(path, ".".join(map(str, index))), "wb") as f:
+            f.write(data)
+
+    attributes = {}
+    if geometry is not None:
+        attributes = {
+            "spacing": [float(v) for v in geometry["spacing"]],
+            "origin": [float(v) for v in geometry["origin"]],
+            "direction": np.asarray(geometry["direction"], dtype=float).tolist(),
+        }
+    with open(os.path.join(path, ".zattrs"), "w") as f:
+        json.dump(attributes, f, indent=2)
+    # written last: a store without it is incomplete
+    with open(os.path.join(path, ".zarray"), "w") as f:
+        json.dump(
+            {
+                "zarr_format": 2,
+                "shape": list(shape),
+                "chunks": list(chunks),
+                "dtype": dtype.str,
+                "compressor": (
+                    None
+                    if compression is None
+                    else {"id": "zlib", "level": compression}
+                ),
+                "fill_value": 0,
+                "filters": None,
+                "order": "C",
+                "dimension_separator": ".",
+            },
+            f,
+            indent=2,
+        )
+
+
+class ChunkedArray:
+    """Read access to a store written by ``write_chunked``.
+
+    Indexing with integers and slices (without steps) reads and decompresses
+    only the chunks the region overlaps; ``[...]`` reads everything.
+    ``geometry`` is the stored geometry dictionary, or None.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, ".zarray")) as f:
+            metadata = json.load(f)
+        if metadata.get("order", "C") != "C" or metadata.get("filters"):
+            raise ValueError("%s: only C order stores without filters are read" % path)
+        compressor = metadata.get("compressor")
+        if compressor is not None and compressor.get("id") != "zlib":
+            raise ValueError(
+                "%s: '%s' chunks need zarr to read" % (path, compressor.get("id"))
+            )
+        self.shape = tuple(metadata["shape"])
+        self.chunks = tuple(metadata["chunks"])
+        self.dtype = np.dtype(metadata["dtype"])
+        self._compressed = compressor is not None
+        self._fillValue = metadata.get("fill_value") or 0
+        self._separator = metadata.get("dimension_separator", ".")
+        self.geometry = None
+        attributesPath = os.path.join(path, ".zattrs")
+        if os.path.exists(attributesPath):
+            with open(attributesPath) as f:
+                attributes = json.load(f)
+            if "spacing" in attributes:
+                self.geometry = dict(
+                    attributes, direction=np.array(attributes["direction"])
+                )
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def _chunk(self, index):
+        name = os.path.join(self.path, self._separator.join(map(str, index)))
+        if not os.path.exists(name):
+            return np.full(self.chunks, self._fillValue, self.dtype)
+        with open(name, "rb") as f:
+            data = f.read()
+        if self._compressed:
+            data = zlib.decompress(data)
+        return np.frombuffer(data, self.dtype).reshape(self.chunks)
+
+    def _region(self, key):
+        if key is Ellipsis:
+            key = ()
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > self.ndim:
+            raise IndexError("too many indices for a %dD store" % self.ndim)
+        region, squeeze = [], []
+        for axis, size in enumerate(self.shape):
+            item = key[axis] if axis < len(key) else slice(None)
+            if isinstance(item, slice):
+                start, stop, step = item.indices(size)
+                if step != 1:
+                    raise IndexError("slices with steps are not supported")
+                region.append((start, max(start, stop)))
+            else:
+                index = int(item) + size if int(item) < 0 else int(item)
+                if not 0 <= index < size:
+                    raise IndexError("index %d out of range for axis %d" % (item, axis))
+                region.append((index, index + 1))
+                squeeze.append(axis)
+        return region, tuple(squeeze)
+
+    def __getitem__(self, key):
+        region, squeeze = self._region(key)
+        output = np.empty([stop - start for start, stop in region], self.dtype)
+        ranges = [
+            range(start // chunk, math.ceil(stop / chunk)) if stop > start else range(0)
+            for (start, stop), chunk in zip(region, self.chunks)
+        ]
+        for index in itertools.product(*ranges):
+            chunk = self._chunk(index)
+            source, target = [], []
+            for i, (start, stop), size in zip(index, region, self.chunks):
+                low = max(start, i * size)
+                high = min(stop, (i + 1) * size)
+                source.append(slice(low - i * size, high - i * size))
+                target.append(slice(low - start, high - start))
+            output[tuple(target)] = chunk[tuple(source)]
+        return output.squeeze(squeeze) if squeeze else output
+
+    def __array__(self, dtype=None, copy=None):
+        array = self[...]
+        return array if dtype is None else array.astype(dtype)
+
+
+def open_chunked(path):
+    """Open the chunk store at ``path`` for reading."""
+    return ChunkedArray(path)
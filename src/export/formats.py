@@ -0,0 +1,257 @@
+"""Image writers, one per output format.
+
+    from src.export import write
+
+    write(array, "out/brain[median].mha", geometry=read_image_information(path))
+
+The format follows the file extension (see ``format_for``):
+
+* ``"png"``: 8 and 16 bit 2D images through PIL, as every export path
+  wrote them so far.
+* ``"mha"`` and ``"nrrd"``: MetaImage and NRRD with zlib (gzip for NRRD)
+  compression at ``FAST`` level by default; ``compression=None`` writes the
+  raw buffer, any other zlib level trades time for size. Their headers are
+  those ``itk.imwrite`` produces, and ITK reads the files back.
+* ``"zarr"``: a directory of compressed chunks (see ``chunked.py``) for
+  outputs too large to encode or read in one piece.
+* ``"itk"``: every other extension ITK knows (.nii.gz, .tif, ...) through
+  ``itk.imwrite``.
+
+The MHA, NRRD and chunk encoders run in Python around ``zlib``, which, like
+PIL's PNG encoder, releases the GIL while it compresses. ``itk.imwrite``
+holds the GIL for the whole write, so only these writers overlap with ITK
+filters running in other threads (see ``background.py``).
+
+``geometry`` is a dictionary with the ``"spacing"``, ``"origin"`` and
+``"direction"`` of the image in ITK order, as ``read_image_information``
+returns it; PNG has no place for it.
+"""
+
+import os
+import zlib
+
+import itk
+import numpy as np
+
+from ..profiling import span
+
+FORMATS = ("png", "mha", "nrrd", "zarr", "itk")
+
+EXTENSIONS = {".png": "png", ".mha": "mha", ".nrrd": "nrrd", ".zarr": "zarr"}
+
+# zlib level of the compressed formats: level 1 is several times faster
+# than PNG's default 6 on smoothed images, at a slightly larger size
+FAST = 1
+
+# bytes handed to zlib per call, so that large volumes are compressed
+# without a second full-size buffer
+_BLOCK_BYTES = 16 * 2**20
+
+_META_TYPES = {
+    "uint8": "MET_UCHAR",
+    "int8": "MET_CHAR",
+    "uint16": "MET_USHORT",
+    "int16": "MET_SHORT",
+    "uint32": "MET_UINT",
+    "int32": "MET_INT",
+    "uint64": "MET_ULONG_LONG",
+    "int64": "MET_LONG_LONG",
+    "float32": "MET_FLOAT",
+    "float64": "MET_DOUBLE",
+}
+
+_NRRD_TYPES = {
+    "uint8": "unsigned char",
+    "int8": "signed char",
+    "uint16": "unsigned short",
+    "int16": "short",
+    "uint32": "unsigned int",
+    "int32": "int",
+    "uint64": "unsigned long long int",
+    "int64": "long long int",
+    "float32": "float",
+    "float64": "double",
+}
+
+
+def format_for(path):
+    """Output format of ``path`` from its extension, ``"itk"`` when unknown."""
+    _, extension = os.path.splitext(path.rstrip("/\\"))
+    return EXTENSIONS.get(extension.lower(), "itk")
+
+
+def geometry_of(image):
+    """The geometry dictionary of an ``itk.Image``."""
+    return {
+        "spacing": [float(v) for v in image.GetSpacing()],
+        "origin": [float(v) for v in image.GetOrigin()],
+        "direction": itk.array_from_matrix(image.GetDirection()),
+    }
+
+
+def _geometry(geometry, Dimension):
+    if geometry is None:
+        return [1.0] * Dimension, [0.0] * Dimension, np.eye(Dimension)
+    return (
+        [float(v) for v in geometry["spacing"]],
+        [float(v) for v in geometry["origin"]],
+        np.asarray(geometry["direction"], dtype=float),
+    )
+
+
+def _number(value):
+    return "%.17g" % value
+
+
+def _little_endian(array):
+    # both headers below declare little endian, C order data
+    array = np.ascontiguousarray(array)
+    if array.dtype.byteorder == ">":
+        array = array.astype(array.dtype.newbyteorder("<"))
+    return array
+
+
+def _blocks(array):
+    data = memoryview(array.reshape(-1)).cast("B")
+    for start in range(0, len(data), _BLOCK_BYTES):
+        yield data[start : start + _BLOCK_BYTES]
+
+
+def _compressed(array, level, wbits=zlib.MAX_WBITS):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+    blocks = [compressor.compress(block) for block in _blocks(array)]
+    blocks.append(compressor.flush())
+    return blocks
+
+
+def _write_file(path, header, blocks):
+    # a reader never sees a half written file under the final name
+    partial = path + ".part"
+    with open(partial, "wb") as f:
+        f.write(header.encode("ascii"))
+        for block in blocks:
+            f.write(block)
+    os.replace(partial, path)
+
+
+def _dtype_name(array, types, format):
+    name = array.dtype.name
+    if name not in types:
+        raise ValueError("Cannot write %s pixels as %s" % (name, format.upper()))
+    return name
+
+
+def write_mha(array, path, geometry=None, compression=FAST):
+    """MetaImage with the header ``itk.imwrite`` writes."""
+    array = _little_endian(array)
+    typeName = _META_TYPES[_dtype_name(array, _META_TYPES, "mha")]
+    Dimension = array.ndim
+    spacing, origin, direction = _geometry(geometry, Dimension)
+    if compression is None:
+        blocks = list(_blocks(array))
+    else:
+        blocks = _compressed(array, compression)
+    lines = [
+        "ObjectType = Image",
+        "NDims = %d" % Dimension,
+        "BinaryData = True",
+        "BinaryDataByteOrderMSB = False",
+        "CompressedData = %s" % (compression is not None),
+    ]
+    if compression is not None:
+        lines.append("CompressedDataSize = %d" % sum(len(b) for b in blocks))
+    lines += [
+        # MetaIO stores the direction matrix column by column
+        "TransformMatrix = " + " ".join(_number(v) for v in direction.T.reshape(-1)),
+        "Offset = " + " ".join(_number(v) for v in origin),
+        "CenterOfRotation = " + " ".join(["0"] * Dimension),
+        "ElementSpacing = " + " ".join(_number(v) for v in spacing),
+        "DimSize = " + " ".join(str(s) for s in reversed(array.shape)),
+        "ElementType = " + typeName,
+        "ElementDataFile = LOCAL",
+    ]
+    _write_file(path, "\n".join(lines) + "\n", blocks)
+
+
+def write_nrrd(array, path, geometry=None, compression=FAST):
+    """NRRD with the header ``itk.imwrite`` writes, gzip encoded."""
+    array = _little_endian(array)
+    typeName = _NRRD_TYPES[_dtype_name(array, _NRRD_TYPES, "nrrd")]
+    Dimension = array.ndim
+    spacing, origin, direction = _geometry(geometry, Dimension)
+    if compression is None:
+        blocks = list(_blocks(array))
+    else:
+        # wbits 31 writes a gzip member
+        blocks = _compressed(array, compression, 16 + zlib.MAX_WBITS)
+    directions = [
+        "(%s)" % ",".join(_number(v) for v in direction[:, axis] * spacing[axis])
+        for axis in range(Dimension)
+    ]
+    lines = [
+        "NRRD0004",
+        "type: " + typeName,
+        "dimension: %d" % Dimension,
+        (
+            "space: left-posterior-superior"
+            if Dimension == 3
+            else "space dimension: %d" % Dimension
+        ),
+        "sizes: " + " ".join(str(s) for s in reversed(array.shape)),
+        "space directions: " + " ".join(directions),
+        "kinds: " + " ".join(["domain"] * Dimension),
+        "endian: little",
+        "encoding: " + ("raw" if compression is None else "gzip"),
+        "space origin: (%s)" % ",".join(_number(v) for v in origin),
+    ]
+    _write_file(path, "\n".join(lines) + "\n\n", blocks)
+
+
+def write_png(array, path, compression=None):
+    """PNG through PIL; ``compression`` is the zlib level (PIL's default 6)."""
+    from PIL import Image
+
+    options = {} if compression is None else {"compress_level": compression}
+    Image.fromarray(array).save(path, **options)
+
+
+def write_itk(array, path, geometry=None, compression=False):
+    image = itk.image_from_array(np.ascontiguousarray(array))
+    if geometry is not None:
+        spacing, origin, direction = _geometry(geometry, array.ndim)
+        image.SetSpacing(spacing)
+        image.SetOrigin(origin)
+        image.SetDirection(itk.matrix_from_array(direction))
+    itk.imwrite(image, path, compression=bool(compression))
+
+
+def write(array, path, geometry=None, format=None, **options):
+    """Write ``array`` (NumPy order) to ``path`` in the calling thread.
+
+    ``format`` overrides the one of the extension. ``options`` go to the
+    format's writer: ``compression`` for all of them, ``chunks`` for
+    ``"zarr"``. Arrays PNG cannot hold (volumes) are written by ITK.
+    """
+    from .chunked import write_chunked
+
+    format = format or format_for(path)
+    if format not in FORMATS:
+        raise ValueError(
+            "Unknown format '%s', expected one of %s" % (format, ", ".join(FORMATS))
+        )
+    if format == "png" and array.ndim != 2:
+        format = "itk"
+    directory, _ = os.path.split(path.rstrip("/\\"))
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with span("write " + format, "export"):
+        if format == "png":
+            write_png(array, path, **options)
+        elif format == "mha":
+            write_mha(array, path, geometry, **options)
+        elif format == "nrrd":
+            write_nrrd(array, path, geometry, **options)
+        elif format == "zarr":
+            write_chunked(array, path, geometry=geometry, **options)
+        else:
+            write_itk(array, path, geometry, **options)
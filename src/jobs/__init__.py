@@ -0,0 +1,3 @@
+from .cancellation import CancellationToken, JobCancelled, raise_if_cancelled, watch
+from .runner import JobRunner, RunnerBusy
+from .threads import itk_threads, plan_workers, set_itk_threads
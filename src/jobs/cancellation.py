@@ -0,0 +1,118 @@
+"""Cancellation of the ITK work a job runs.
+
+A job runs under a ``CancellationToken`` made current in its worker thread.
+The smoothing pipelines and the registration cores pass every ITK object
+they run to ``watch()``, next to their profiling hooks. While a token is
+current, a watched object is observed as follows:
+
+* process objects through their ``ProgressEvent``, which calls
+  ``AbortGenerateDataOn()`` once the token is cancelled. ITK then stops the
+  filter and ``Update()`` raises a ``RuntimeError``; the abort flag is reset
+  by the object's next run;
+* optimizers through their ``IterationEvent``, which calls
+  ``StopOptimization()``. The registration returns normally, so the cores
+  call ``raise_if_cancelled()`` after ``Update()`` rather than hand a
+  truncated optimization to the result cache.
+
+ITK's Python wrappers hold the GIL for the whole ``Update()``, so both
+observers also sleep for zero seconds at every event. This lets the event
+loop and the other workers run between two progress steps or iterations.
+
+Objects keep their observers afterwards; with no job running them those
+observers only yield.
+"""
+
+import threading
+import time
+import weakref
+
+import itk
+
+_local = threading.local()
+
+# watched object -> token of the job currently running it
+_tokens = weakref.WeakKeyDictionary()
+_observed = weakref.WeakSet()
+
+
+class JobCancelled(Exception):
+    """The job was cancelled before its result was complete."""
+
+
+class CancellationToken:
+    """Cancellation flag shared by a job and whoever waits for it."""
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._objects = weakref.WeakSet()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def __enter__(self):
+        if getattr(_local, "token", None) is not None:
+            raise RuntimeError("A job is already running in this thread")
+        _local.token = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.token = None
+        for itkObject in list(self._objects):
+            if _tokens.get(itkObject) is self:
+                del _tokens[itkObject]
+
+
+def current_token():
+    """The token of the job running in this thread, or ``None``."""
+    return getattr(_local, "token", None)
+
+
+def raise_if_cancelled():
+    token = current_token()
+    if token is not None and token.cancelled:
+        raise JobCancelled()
+
+
+def watch(itkObject):
+    """Let the job running in this thread cancel ``itkObject``.
+
+    Does nothing outside a job. Returns the object.
+    """
+    token = current_token()
+    if token is None:
+        return itkObject
+    _tokens[itkObject] = token
+    token._objects.add(itkObject)
+    if itkObject in _observed:
+        return itkObject
+    _observed.add(itkObject)
+
+    # keep no reference to the object itself, its observers live inside it
+    reference = weakref.ref(itkObject)
+
+    def cancelled():
+        observed = reference()
+        token = None if observed is None else _tokens.get(observed)
+        return observed if token is not None and token.cancelled else None
+
+    def onProgress():
+        observed = cancelled()
+        if observed is not None:
+            observed.AbortGenerateDataOn()
+        time.sleep(0)
+
+    def onIteration():
+        observed = cancelled()
+        if observed is not None:
+            observed.StopOptimization()
+        time.sleep(0)
+
+    if hasattr(itkObject, "AbortGenerateDataOn"):
+        itkObject.AddObserver(itk.ProgressEvent(), onProgress)
+    elif hasattr(itkObject, "StopOptimization"):
+        itkObject.AddObserver(itk.IterationEvent(), onIteration)
+    return itkObject
@@ -0,0 +1,217 @@
+"""Asynchronous facade over the smoothing and registration functions.
+
+    from src.jobs import JobRunner
+
+    runner = JobRunner(maxWorkers=2, maxPending=8)
+
+    async def handler(array):
+        return await runner.smooth("grad_anisotropic_diffusion", array, 25)
+
+Every call runs in a worker thread of the runner, so ``Update()`` never
+blocks the event loop; the ITK objects yield the GIL at every progress event
+or iteration (see ``cancellation.py``).
+
+Cancelling the awaiting task cancels the job: the diffusion filters and the
+registration optimizers stop at their next progress event or iteration and
+the worker is released. Work without progress events (the NumPy backend,
+reading and writing files) runs to its end first. So does loading an ITK
+module on first use, see ``JobRunner.warmup()``.
+
+Backpressure: at most ``maxWorkers`` jobs run at once, and a cancelled job
+keeps its slot until its worker is actually free. At most ``maxPending``
+further calls wait for a slot, and beyond that ``RunnerBusy`` is raised at
+once so that the service can answer "busy" instead of queueing without
+bound. While the runner is open, ITK's global default number of threads is
+lowered so that the jobs together use the machine's cores once; filters
+created before the runner keep their own setting.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import itk
+
+from .cancellation import CancellationToken, JobCancelled
+
+SMOOTHING_FUNCTIONS = (
+    "binomial",
+    "discrete_gaussian",
+    "recursive_gaussian_iir",
+    "median",
+    "grad_anisotropic_diffusion",
+    "curve_anisotropic_diffusion",
+)
+
+REGISTRATION_FUNCTIONS = ("unimodal", "multimodal")
+
+
+class RunnerBusy(Exception):
+    """Every worker is busy and the waiting list is full."""
+
+
+def _call(token, function, args, kwargs):
+    # runs in a worker thread
+    with token:
+        try:
+            result = function(*args, **kwargs)
+        except Exception as error:
+            if token.cancelled:
+                raise JobCancelled() from error
+            raise
+    if token.cancelled:
+        raise JobCancelled()
+    return result
+
+
+def _smoothing_function(name):
+    from ..smoothing import bluring, edge_preserving_smoothing
+
+    if name not in SMOOTHING_FUNCTIONS:
+        raise ValueError(
+            "Unknown filter '%s', expected one of %s"
+            % (name, ", ".join(SMOOTHING_FUNCTIONS))
+        )
+    module = bluring if hasattr(bluring, name + "_array") else edge_preserving_smoothing
+    return getattr(module, name + "_array")
+
+
+def _registration_function(method):
+    from .. import registration
+
+    if method not in REGISTRATION_FUNCTIONS:
+        raise ValueError(
+            "Unknown method '%s', expected one of %s"
+            % (method, ", ".join(REGISTRATION_FUNCTIONS))
+        )
+    return getattr(registration, "register_" + method)
+
+
+class JobRunner:
+    """Runs blocking smoothing and registration calls for an event loop.
+
+    ``threadsPerJob`` is the ITK default number of threads set while the
+    runner is open, ``os.cpu_count() // maxWorkers`` (at least 1) when None.
+    The runner must be used from one event loop; ``close()`` (or leaving an
+    ``async with`` block) waits for the running jobs and restores the ITK
+    default.
+    """
+
+    def __init__(self, maxWorkers=2, maxPending=8, threadsPerJob=None):
+        if maxWorkers < 1:
+            raise ValueError("maxWorkers must be at least 1")
+        self.maxWorkers = maxWorkers
+        self.maxPending = maxPending
+        self.threadsPerJob = (
+            max(1, (os.cpu_count() or 1) // maxWorkers)
+            if threadsPerJob is None
+            else threadsPerJob
+        )
+        self._executor = ThreadPoolExecutor(maxWorkers, thread_name_prefix="itk-job")
+        self._slots = asyncio.Semaphore(maxWorkers)
+        self._waiting = 0
+        self._running = 0
+
+        MultiThreader = itk.MultiThreaderBase
+        self._previousThreads = MultiThreader.GetGlobalDefaultNumberOfThreads()
+        MultiThreader.SetGlobalDefaultNumberOfThreads(self.threadsPerJob)
+
+    @property
+    def running(self):
+        """Jobs holding a worker, cancelled ones that have not stopped included."""
+        return self._running
+
+    @property
+    def waiting(self):
+        return self._waiting
+
+    def _release(self, future):
+        self._running -= 1
+        self._slots.release()
+        # the exception of a job nobody awaits anymore is not an error
+        if not future.cancelled():
+            future.exception()
+
+    async def run(self, function, *args, **kwargs):
+        """``function(*args, **kwargs)`` in a worker thread.
+
+        Raises ``RunnerBusy`` when ``maxPending`` calls already wait for a
+        worker, and ``JobCancelled`` when the job was cancelled from another
+        thread. Cancelling the calling task cancels the job.
+        """
+        if self._executor is None:
+            raise RuntimeError("The runner is closed")
+        if self._slots.locked() and self._waiting >= self.maxPending:
+            raise RunnerBusy(
+                "%d jobs running and %d waiting" % (self._running, self._waiting)
+            )
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        token = CancellationToken()
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(
+                self._executor, _call, token, function, args, kwargs
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        self._running += 1
+        future.add_done_callback(self._release)
+        try:
+            # the job keeps running after a cancellation until ITK stops it
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            token.cancel()
+            raise
+
+    async def smooth(self, name, image, *args, **kwargs):
+        """``<name>_array(image, *args, **kwargs)``, e.g. ``smooth("median", array, 2)``.
+
+        ``name`` is one of ``SMOOTHING_FUNCTIONS``; returns the uint8 array.
+        """
+        return await self.run(_smoothing_function(name), image, *args, **kwargs)
+
+    async def register(self, method, fixedImageFile, movingImageFile, **kwargs):
+        """``register_<method>(fixedImageFile, movingImageFile, **kwargs)``.
+
+        ``method`` is ``"unimodal"`` or ``"multimodal"``; returns the
+        ``RegistrationResult``.
+        """
+        return await self.run(
+            _registration_function(method), fixedImageFile, movingImageFile, **kwargs
+        )
+
+    async def warmup(self, dimensions=(2,)):
+        """Build every smoothing pipeline once, for images of ``dimensions``.
+
+        The first use of a filter loads its ITK module, which holds the GIL,
+        and with it the event loop, for up to several seconds. Await this
+        while the service starts instead.
+        """
+        from ..smoothing.pipelines import PIPELINES
+
+        def build():
+            for PipelineType in PIPELINES.values():
+                for dimension in dimensions:
+                    PipelineType(dimension)
+
+        await self.run(build)
+
+    def close(self):
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        itk.MultiThreaderBase.SetGlobalDefaultNumberOfThreads(self._previousThreads)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # waiting for the workers must not block the loop either
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
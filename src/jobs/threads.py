@@ -0,0 +1,123 @@
+"""Sharing the cores between worker processes and ITK's own threads.
+
+    workers, threads = plan_workers(len(paths), pixels, workPerPixel)
+
+The ITK filters and the v4 metrics split every ``Update()`` over
+``MultiThreaderBase``'s default number of threads, one per core. A pool of
+one worker process per core, each of which starts a thread per core, runs
+cores squared threads and loses time to switching between them. The batch
+engines (smoothing, sweeps, registration) therefore pick a number of
+workers and a number of ITK threads per worker whose product is the number
+of cores, and set the ITK default in every worker before it builds its
+filters.
+
+Which split is best depends on the work: every image also has to be read,
+rescaled and written on a single thread, and starting the threads of a
+filter has a fixed cost. ``plan_workers`` estimates the time of one task
+with ``threads`` threads as
+
+    pixels * (SERIAL_WORK + workPerPixel / threads) + threads * THREAD_WORK
+
+and picks the split with the shortest estimated total, over
+``ceil(tasks / workers)`` rounds; a task too small to pay for more threads
+gets fewer than its share of the cores. Many cheap images then get one ITK
+thread per worker ("many workers x 1 thread"), while a few large or
+expensive ones get several threads each ("few workers x many threads").
+The workers are also limited to what the available memory can hold at
+``bytesPerPixel`` per pixel of a task.
+"""
+
+import contextlib
+import math
+import os
+
+import itk
+
+# operations per pixel that stay on one thread: reading, rescaling, writing
+SERIAL_WORK = 8.0
+
+# operations it costs to start and join one more thread of a filter
+THREAD_WORK = 2.0**16
+
+# bytes per pixel one task holds: reader, filter stages and output in float
+DEFAULT_BYTES_PER_PIXEL = 16
+
+
+def available_memory():
+    """Bytes of physical memory not in use, or None where it is unknown."""
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def task_work(pixels, workPerPixel, threads):
+    """Estimated operations on the critical path of one task."""
+    return pixels * (SERIAL_WORK + workPerPixel / threads) + threads * THREAD_WORK
+
+
+def plan_workers(
+    tasks,
+    pixels,
+    workPerPixel,
+    cpus=None,
+    workers=None,
+    threads=None,
+    bytesPerPixel=DEFAULT_BYTES_PER_PIXEL,
+):
+    """``(workers, threads)`` for ``tasks`` tasks of ``pixels`` pixels each.
+
+    ``workPerPixel`` is the filter's estimate (see the pipelines'
+    ``GetWorkPerPixel``). A given ``workers`` or ``threads`` is kept and the
+    other one fills the ``cpus`` (default: all cores).
+    """
+    cpus = cpus or os.cpu_count() or 1
+    tasks = max(1, tasks)
+    if workers and threads:
+        return workers, threads
+    if workers:
+        return workers, max(1, cpus // workers)
+    if threads:
+        return max(1, min(tasks, cpus // threads)), threads
+
+    largest = min(tasks, cpus)
+    memory = available_memory()
+    if memory is not None:
+        # half of it, the rest is the caller's and the page cache's
+        taskBytes = max(1, int(pixels * bytesPerPixel))
+        largest = min(largest, max(1, memory // 2 // taskBytes))
+
+    best = None
+    for count in range(1, largest + 1):
+        # a small task may not be worth all the threads its share allows
+        threadCount = min(
+            range(1, max(1, cpus // count) + 1),
+            key=lambda t: task_work(pixels, workPerPixel, t),
+        )
+        total = math.ceil(tasks / count) * task_work(pixels, workPerPixel, threadCount)
+        # ties go to more workers, which also overlap the serial parts
+        if best is None or total <= best[0]:
+            best = (total, count, threadCount)
+    return best[1], best[2]
+
+
+def set_itk_threads(threads):
+    """Set ITK's default number of threads for the rest of this process.
+
+    Meant for worker initializers; filters created before keep their own
+    setting.
+    """
+    if threads:
+        itk.MultiThreaderBase.SetGlobalDefaultNumberOfThreads(threads)
+
+
+@contextlib.contextmanager
+def itk_threads(threads):
+    """ITK's default number of threads inside the ``with`` block."""
+    MultiThreader = itk.MultiThreaderBase
+    previous = MultiThreader.GetGlobalDefaultNumberOfThreads()
+    set_itk_threads(threads)
+    try:
+        yield
+    finally:
+        MultiThreader.SetGlobalDefaultNumberOfThreads(previous)
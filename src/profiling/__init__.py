@@ -0,0 +1 @@
+from .trace import Trace, active, instrument, profile, span
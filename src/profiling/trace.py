@@ -0,0 +1,238 @@
+"""Per-stage profiling of the ITK pipelines.
+
+    from src.profiling import profile
+
+    with profile() as trace:
+        grad_anisotropic_diffusion("assets/brain-noise.png", 25, exportPath="out.png")
+    print(trace.format_summary())
+    trace.dump_json("trace.json")
+    trace.dump_chrome_trace("trace.chrome.json")  # chrome://tracing or Perfetto
+
+While a trace is active, every ITK object the smoothing pipelines,
+``EdgeFilter`` and the registration cores run is observed through its
+``StartEvent``, ``ProgressEvent`` and ``EndEvent``. Each stage records its
+wall time, the progress samples, its number of work units and threads, and
+the size of its output buffer. Python-side work between ITK stages (NumPy
+views, PNG encoding, lazily resampled result images) is recorded by
+``span()`` blocks in the same trace.
+
+Objects are observed the first time they run under a trace and keep their
+observers afterwards; outside a trace those observers return immediately,
+and objects that never run under a trace get none.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+import weakref
+
+import itk
+
+_active = None
+_instrumented = weakref.WeakSet()
+
+
+class Trace:
+    """Stages recorded while this trace was active, in start order."""
+
+    def __init__(self):
+        self.events = []
+        self.origin = time.perf_counter()
+        self.wallClock = time.time()
+
+    def _now(self):
+        return time.perf_counter() - self.origin
+
+    def _begin(self, name, category, kind, className=None):
+        event = {
+            "name": name,
+            "category": category,
+            "kind": kind,
+            "class": className,
+            "start": self._now(),
+            "seconds": None,
+            "thread_id": threading.get_ident(),
+            "work_units": None,
+            "threads": None,
+            "output_bytes": None,
+            "progress": [],
+        }
+        self.events.append(event)
+        return event
+
+    def _end(self, event):
+        event["seconds"] = self._now() - event["start"]
+
+    def summary(self):
+        """Total seconds, calls and largest output per stage name."""
+        stages = {}
+        for event in self.events:
+            if event["seconds"] is None:
+                continue
+            stage = stages.setdefault(
+                event["name"],
+                {"calls": 0, "seconds": 0.0, "max_output_bytes": None},
+            )
+            stage["calls"] += 1
+            stage["seconds"] += event["seconds"]
+            if event["output_bytes"] is not None:
+                stage["max_output_bytes"] = max(
+                    stage["max_output_bytes"] or 0, event["output_bytes"]
+                )
+        return stages
+
+    def format_summary(self):
+        stages = sorted(self.summary().items(), key=lambda item: -item[1]["seconds"])
+        lines = ["%-40s %6s %10s %12s" % ("stage", "calls", "seconds", "output MiB")]
+        for name, stage in stages:
+            output = stage["max_output_bytes"]
+            lines.append(
+                "%-40s %6d %10.4f %12s"
+                % (
+                    name,
+                    stage["calls"],
+                    stage["seconds"],
+                    "-" if output is None else "%.2f" % (output / 2**20),
+                )
+            )
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {
+            "started": self.wallClock,
+            "pid": os.getpid(),
+            "events": self.events,
+            "summary": self.summary(),
+        }
+
+    def to_chrome_trace(self):
+        """The trace in the Chrome trace event format (complete events)."""
+        pid = os.getpid()
+        traceEvents = []
+        for event in self.events:
+            if event["seconds"] is None:
+                continue
+            traceEvents.append(
+                {
+                    "name": event["name"],
+                    "cat": event["category"],
+                    "ph": "X",
+                    "ts": event["start"] * 1e6,
+                    "dur": event["seconds"] * 1e6,
+                    "pid": pid,
+                    "tid": event["thread_id"],
+                    "args": {
+                        key: event[key]
+                        for key in ("class", "work_units", "threads", "output_bytes")
+                        if event[key] is not None
+                    },
+                }
+            )
+        return {"traceEvents": traceEvents, "displayTimeUnit": "ms"}
+
+    def dump_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def dump_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+@contextlib.contextmanager
+def profile():
+    """Record every instrumented stage run inside the ``with`` block."""
+    global _active
+    previous = _active
+    trace = Trace()
+    _active = trace
+    try:
+        yield trace
+    finally:
+        _active = previous
+
+
+def active():
+    """The trace being recorded, or ``None``."""
+    return _active
+
+
+@contextlib.contextmanager
+def span(name, category="python"):
+    """Record a Python-side stage; free when no trace is active."""
+    trace = _active
+    if trace is None:
+        yield
+        return
+    event = trace._begin(name, category, "python")
+    try:
+        yield
+    finally:
+        trace._end(event)
+
+
+def _output_bytes(processObject):
+    try:
+        output = processObject.GetOutput()
+        return int(itk.array_view_from_image(output).nbytes)
+    except Exception:
+        # transforms, decorated outputs, optimizers, unbuffered images
+        return None
+
+
+def _threads(processObject):
+    try:
+        workUnits = processObject.GetNumberOfWorkUnits()
+    except AttributeError:
+        workUnits = None
+    try:
+        threads = processObject.GetMultiThreader().GetMaximumNumberOfThreads()
+    except AttributeError:
+        threads = None
+    return workUnits, threads
+
+
+def instrument(itkObject, name=None, category="itk"):
+    """Observe ``itkObject``'s start, progress and end while a trace is active.
+
+    Does nothing when no trace is active or when the object is already
+    observed. Returns the object.
+    """
+    if _active is None or itkObject in _instrumented:
+        return itkObject
+    _instrumented.add(itkObject)
+
+    className = itkObject.GetNameOfClass()
+    name = name or className
+    # keep no reference to the object itself, its observers live inside it
+    reference = weakref.ref(itkObject)
+    running = []
+
+    def onStart():
+        trace = _active
+        if trace is not None:
+            running.append((trace, trace._begin(name, category, "itk", className)))
+
+    def onProgress():
+        observed = reference()
+        if running and observed is not None:
+            trace, event = running[-1]
+            event["progress"].append((trace._now(), observed.GetProgress()))
+
+    def onEnd():
+        if not running:
+            return
+        trace, event = running.pop()
+        trace._end(event)
+        observed = reference()
+        if observed is not None:
+            event["work_units"], event["threads"] = _threads(observed)
+            event["output_bytes"] = _output_bytes(observed)
+
+    itkObject.AddObserver(itk.StartEvent(), onStart)
+    itkObject.AddObserver(itk.EndEvent(), onEnd)
+    if hasattr(itkObject, "GetProgress"):
+        itkObject.AddObserver(itk.ProgressEvent(), onProgress)
+    return itkObject
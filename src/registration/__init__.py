@@ -1,2 +1,5 @@
 from .multimodal import register_multimodal
+from .prepared import PreparedFixedImage, prepare_fixed_image
+from .resampler import Resampler
+from .transforms import TRANSFORMS
 from .unimodal import register_unimodal
@@ -0,0 +1,242 @@
+"""Register one fixed image against many moving images.
+
+The fixed image is read and prepared once (see ``prepare_fixed_image``: for
+the multimodal engines normalized and smoothed, for v4 also its metric
+sample points) and handed to every worker process when the pool starts, so
+each pair only pays for reading its moving image and for the optimization
+itself. The result is a table with one row per moving image.
+
+The v4 metrics are multithreaded, so unless given, the number of workers
+and of ITK threads per worker are planned from the fixed image size and the
+iterations (see ``src/jobs/threads.py``).
+
+Example:
+
+    python -m src.registration.batch fixed.png "series/*.png" \\
+        --method multimodal --engine v4 --workers 8 --output table.csv
+"""
+
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import itk
+
+from ..jobs.threads import itk_threads, plan_workers, set_itk_threads
+from .multimodal import _register_legacy, _register_v4
+from .prepared import prepare_fixed_image
+from .transforms import TRANSFORMS
+from .unimodal import _register_unimodal
+
+METHODS = ("unimodal", "multimodal")
+
+COLUMNS = [
+    "moving",
+    "translation",
+    "parameters",
+    "iterations",
+    "metric",
+    "stop_condition",
+    "seconds",
+    "error",
+]
+
+# per-worker state, set by _init_worker
+_fixed = None
+_options = None
+
+
+def _prepare_fixed(fixedImageFile, method, engine, kwargs):
+    sampling = {
+        name: kwargs[name]
+        for name in ("samplingStrategy", "samplingPercentage")
+        if name in kwargs
+    }
+    return prepare_fixed_image(fixedImageFile, method, engine, **sampling)
+
+
+def _work_per_pixel(method, engine, kwargs):
+    # metric value and derivative at every sampled pixel and iteration
+    iterations = kwargs.get("numberOfIterations", 200)
+    if method == "unimodal":
+        return 4.0 * iterations
+    if engine == "v4":
+        fraction = 1.0
+        if kwargs.get("samplingStrategy", "random") != "none":
+            fraction = kwargs.get("samplingPercentage", 0.1)
+        return 4.0 * iterations * fraction
+    # the legacy metric draws a fixed number of samples on one thread, the
+    # per-pixel work is the normalizing and smoothing of the moving image
+    return 20.0
+
+
+def _init_worker(fixed, options, threads=None):
+    global _fixed, _options
+    set_itk_threads(threads)
+    _fixed = fixed
+    _options = options
+
+
+def _register_pair(movingImageFile):
+    method = _options["method"]
+    kwargs = dict(_options["kwargs"])
+    start = time.perf_counter()
+    try:
+        movingImage = itk.imread(movingImageFile, itk.F)
+        if method == "unimodal":
+            result = _register_unimodal(_fixed, movingImage, **kwargs)
+        else:
+            register = _register_v4 if _options["engine"] == "v4" else _register_legacy
+            result = register(_fixed, movingImage, **kwargs)
+    except Exception as err:
+        return {
+            "moving": movingImageFile,
+            "translation": None,
+            "parameters": None,
+            "iterations": None,
+            "metric": None,
+            "stop_condition": None,
+            "seconds": time.perf_counter() - start,
+            "error": "%s: %s" % (type(err).__name__, err),
+        }
+    return {
+        "moving": movingImageFile,
+        "translation": result.translation,
+        "parameters": result.parameters,
+        "iterations": result.iterations,
+        "metric": result.metricValue,
+        "stop_condition": result.stopCondition,
+        "seconds": time.perf_counter() - start,
+        "error": None,
+    }
+
+
+def register_batch(
+    fixedImageFile,
+    movingImageFiles,
+    method="multimodal",
+    engine="v4",
+    workers=None,
+    threads=None,
+    **kwargs
+):
+    """Register every moving image against ``fixedImageFile``.
+
+    ``method`` is ``"unimodal"`` (mean squares) or ``"multimodal"`` (mutual
+    information, ``engine`` ``"v4"`` or ``"legacy"``); remaining keyword
+    arguments go to the registration core, e.g. ``multiResolution=True`` or
+    ``samplingPercentage=0.2``. ``workers`` processes with ``threads`` ITK
+    threads each register the pairs, planned where they are not given.
+    Returns one row (a dict with the ``COLUMNS`` keys) per moving image, in
+    input order.
+    """
+    if method not in METHODS:
+        raise ValueError("Unknown method '%s', expected one of %s" % (method, METHODS))
+    fixed = _prepare_fixed(fixedImageFile, method, engine, kwargs)
+    options = {"method": method, "engine": engine, "kwargs": kwargs}
+    workers, threads = plan_workers(
+        len(movingImageFiles),
+        fixed.image.GetLargestPossibleRegion().GetNumberOfPixels(),
+        _work_per_pixel(method, engine, kwargs),
+        workers=workers,
+        threads=threads,
+    )
+
+    if workers == 1:
+        with itk_threads(threads):
+            _init_worker(fixed, options)
+            return [_register_pair(path) for path in movingImageFiles]
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(fixed, options, threads),
+    ) as executor:
+        return list(executor.map(_register_pair, movingImageFiles))
+
+
+def write_table(rows, path):
+    """Write the rows returned by ``register_batch`` as CSV."""
+    dir, _ = os.path.split(path)
+    if dir:
+        os.makedirs(dir, exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            row = dict(row)
+            for column in ("translation", "parameters"):
+                if row[column] is not None:
+                    row[column] = " ".join("%g" % t for t in row[column])
+            writer.writerow(row)
+
+
+def main(argv=None):
+    from ..smoothing.batch import collect_inputs
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("fixed", help="fixed (reference) image")
+    parser.add_argument("moving", nargs="*", help="moving image paths or globs")
+    parser.add_argument("--manifest", help="text file with one moving path per line")
+    parser.add_argument("--method", choices=METHODS, default="multimodal")
+    parser.add_argument("--engine", choices=("legacy", "v4"), default="v4")
+    parser.add_argument("--transform", choices=TRANSFORMS, default="translation")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--threads", type=int, default=None, help="ITK threads per worker"
+    )
+    parser.add_argument("--output", default=None, help="CSV table path")
+    parser.add_argument(
+        "--convergence-window",
+        type=int,
+        default=None,
+        help="stop once the metric plateaus over this many iterations",
+    )
+    parser.add_argument("--convergence-tolerance", type=float, default=1e-4)
+    parser.add_argument("--convergence-parameter-tolerance", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    movingImageFiles = collect_inputs(args.moving, args.manifest)
+    if not movingImageFiles:
+        parser.error("no moving images given")
+
+    start = time.perf_counter()
+    rows = register_batch(
+        args.fixed,
+        movingImageFiles,
+        method=args.method,
+        engine=args.engine,
+        workers=args.workers,
+        threads=args.threads,
+        convergenceWindow=args.convergence_window,
+        convergenceTolerance=args.convergence_tolerance,
+        convergenceParameterTolerance=args.convergence_parameter_tolerance,
+        transform=args.transform,
+    )
+    wall = time.perf_counter() - start
+
+    if args.output is not None:
+        write_table(rows, args.output)
+    for row in rows:
+        if row["error"] is not None:
+            print("%s: %s" % (row["moving"], row["error"]))
+        else:
+            print(
+                "%s: translation %s, %d iterations, metric %g, %.2fs"
+                % (
+                    row["moving"],
+                    "(%s)" % ", ".join("%.3f" % t for t in row["translation"]),
+                    row["iterations"],
+                    row["metric"],
+                    row["seconds"],
+                )
+            )
+    failed = sum(row["error"] is not None for row in rows)
+    print("%d pairs (%d failed) in %.2fs" % (len(rows), failed, wall))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
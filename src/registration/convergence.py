@@ -0,0 +1,141 @@
+import math
+
+import itk
+
+from .result import _to_list
+
+
+def _trend(values):
+    # change across the window of the least-squares line through ``values``
+    n = len(values)
+    mean = sum(values) / n
+    center = (n - 1) / 2.0
+    slope = sum((i - center) * (v - mean) for i, v in enumerate(values)) / sum(
+        (i - center) ** 2 for i in range(n)
+    )
+    return slope * (n - 1), mean
+
+
+def _step_length(optimizer):
+    # the v4 regular step optimizer tracks its step; for plain gradient descent
+    # the step is the learning rate times the gradient norm
+    if hasattr(optimizer, "GetCurrentStepLength"):
+        return optimizer.GetCurrentStepLength()
+    gradient = optimizer.GetGradient()
+    norm = math.sqrt(
+        sum(gradient.GetElement(i) ** 2 for i in range(gradient.GetSize()))
+    )
+    return optimizer.GetLearningRate() * norm
+
+
+class ConvergenceMonitor:
+    """Records every optimizer iteration and optionally stops on a plateau.
+
+    Each ``IterationEvent`` appends ``{"level", "iteration", "metric", "step",
+    "parameters"}`` to ``history``. With a ``window``, a line is fitted to the
+    metric values of the last ``window`` iterations, and the optimizer is
+    stopped as soon as that trend changes the metric by less than
+    ``tolerance`` across the window, relative to its mean magnitude. Fitting
+    a trend instead of comparing extremes keeps the sampled mutual
+    information metrics, whose values jitter from one iteration to the next,
+    from never converging. Every resolution level gets its own window, since
+    the metric jumps when the level changes.
+
+    A metric can creep up slowly while the transform is still travelling
+    towards the optimum (the legacy Viola-Wells engine does this in its first
+    hundred iterations). ``parameterTolerance`` additionally requires the
+    fitted trend of the parameters to move them by less than that (Euclidean,
+    in parameter units, i.e. mm for translations) across the window.
+    """
+
+    def __init__(
+        self,
+        optimizer,
+        registration=None,
+        window=None,
+        tolerance=1e-4,
+        parameterTolerance=None,
+    ):
+        if window is not None and window < 2:
+            raise ValueError("The convergence window needs at least 2 iterations")
+        self.optimizer = optimizer
+        self.registration = registration
+        self.window = window
+        self.tolerance = tolerance
+        self.parameterTolerance = parameterTolerance
+        self.history = []
+        self.converged = False
+        self.stoppedEarly = []
+        self._level = None
+        self._levelValues = []
+        self._levelParameters = []
+        optimizer.AddObserver(itk.IterationEvent(), self._onIteration)
+
+    def _currentLevel(self):
+        if self.registration is None or not hasattr(
+            self.registration, "GetCurrentLevel"
+        ):
+            return 0
+        return self.registration.GetCurrentLevel()
+
+    def _onIteration(self):
+        optimizer = self.optimizer
+        level = self._currentLevel()
+        if level != self._level:
+            self._level = level
+            self._levelValues = []
+            self._levelParameters = []
+
+        metric = optimizer.GetValue()
+        parameters = _to_list(optimizer.GetCurrentPosition())
+        self.history.append(
+            {
+                "level": level,
+                "iteration": len(self._levelValues),
+                "metric": metric,
+                "step": _step_length(optimizer),
+                "parameters": parameters,
+            }
+        )
+        self._levelValues.append(metric)
+        self._levelParameters.append(parameters)
+
+        if self.window is None or len(self._levelValues) < self.window:
+            return
+        if self.relativeTrend() < self.tolerance and (
+            self.parameterTolerance is None
+            or self.parameterTrend() < self.parameterTolerance
+        ):
+            self.converged = True
+            self.stoppedEarly.append(level)
+            optimizer.StopOptimization()
+
+    def relativeTrend(self):
+        """Relative metric change across the window of the least-squares line."""
+        change, mean = _trend(self._levelValues[-self.window :])
+        return abs(change) / max(abs(mean), 1e-12)
+
+    def parameterTrend(self):
+        """Parameter displacement across the window of the least-squares lines."""
+        recent = self._levelParameters[-self.window :]
+        return math.sqrt(sum(_trend(axis)[0] ** 2 for axis in zip(*recent)))
+
+    @property
+    def iterations(self):
+        return len(self.history)
+
+    def GetStopConditionDescription(self, default):
+        """``default`` unless the window stopped the (last) level."""
+        if not self.converged or self.stoppedEarly[-1] != self._level:
+            return default
+        description = "metric trend below %g (relative)" % self.tolerance
+        if self.parameterTolerance is not None:
+            description += " and parameter trend below %g" % self.parameterTolerance
+        return (
+            "ConvergenceMonitor: %s over the last %d iterations after %d iterations"
+            % (
+                description,
+                self.window,
+                len(self._levelValues),
+            )
+        )
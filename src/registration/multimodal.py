@@ -1,24 +1,71 @@
+import time
+
 import itk
-import os
-import matplotlib.pyplot as plt
-from PIL import Image
 
+from ..caching import cached
+from ..jobs.cancellation import raise_if_cancelled, watch
+from ..profiling import instrument, span
+from .convergence import ConvergenceMonitor
+from .prepared import PreparedFixedImage, _read_fixed
+from .result import RegistrationResult, _to_list
+from .transforms import initial_transform, physical_shift_scales
 
-def register_multimodal(fixedImageFile: str, movingImageFile: str, exportDir=None):
-    Dimension = 2
-    PixelType = itk.F
+ENGINES = ("legacy", "v4")
 
-    FixedImageType = itk.Image[PixelType, Dimension]
-    MovingImageType = itk.Image[PixelType, Dimension]
+SAMPLING_STRATEGIES = {
+    "none": "MetricSamplingStrategy_NONE",
+    "regular": "MetricSamplingStrategy_REGULAR",
+    "random": "MetricSamplingStrategy_RANDOM",
+}
 
+
+def _preprocess(image):
     #  It is convenient to work with an internal image type because mutual
     #  information will perform better on images with a normalized statistical
     #  distribution. The fixed and moving images will be normalized and
     #  converted to this internal type.
+    InternalImageType = itk.Image[itk.F, image.GetImageDimension()]
+
+    normalizer = itk.NormalizeImageFilter[type(image), InternalImageType].New()
+    normalizer.SetInput(image)
+
+    smoother = itk.DiscreteGaussianImageFilter[
+        InternalImageType, InternalImageType
+    ].New()
+    smoother.SetVariance(2.0)
+    smoother.SetInput(normalizer.GetOutput())
+
+    instrument(normalizer, category="preprocess")
+    instrument(smoother, category="preprocess")
+    watch(normalizer)
+    watch(smoother)
+    smoother.Update()
+    return smoother.GetOutput()
+
+
+def _fixed(fixedImage):
+    # (fixed image, its preprocessed version, PreparedFixedImage or None); a
+    # prepared fixed image shared by many registrations is preprocessed once
+    if isinstance(fixedImage, PreparedFixedImage):
+        return fixedImage.image, fixedImage.smoothed, fixedImage
+    return fixedImage, _preprocess(fixedImage), None
+
+
+@cached
+def _register_legacy(
+    fixedImage,
+    movingImage,
+    numberOfIterations=200,
+    convergenceWindow=None,
+    convergenceTolerance=1e-4,
+    convergenceParameterTolerance=None,
+    transform="translation",
+):
+    fixedImage, fixedSmoothed, _ = _fixed(fixedImage)
+    Dimension = fixedImage.GetImageDimension()
     InternalPixelType = itk.F
     InternalImageType = itk.Image[InternalPixelType, Dimension]
 
-    TransformType = itk.TranslationTransform[itk.D, Dimension]
     OptimizerType = itk.GradientDescentOptimizer
     InterpolatorType = itk.LinearInterpolateImageFunction[InternalImageType, itk.D]
     RegistrationType = itk.ImageRegistrationMethod[InternalImageType, InternalImageType]
@@ -27,14 +74,14 @@ def register_multimodal(fixedImageFile: str, movingImageFile: str, exportDir=Non
         InternalImageType, InternalImageType
     ]
 
-    transform = TransformType.New()
+    initialTransform = initial_transform(transform, fixedImage, movingImage)
     optimizer = OptimizerType.New()
     interpolator = InterpolatorType.New()
     registration = RegistrationType.New()
     metric = MetricType.New()
 
     registration.SetOptimizer(optimizer)
-    registration.SetTransform(transform)
+    registration.SetTransform(initialTransform)
     registration.SetInterpolator(interpolator)
     registration.SetMetric(metric)
 
@@ -49,50 +96,16 @@ def register_multimodal(fixedImageFile: str, movingImageFile: str, exportDir=Non
     metric.SetFixedImageStandardDeviation(0.4)
     metric.SetMovingImageStandardDeviation(0.4)
 
-    fixedImage = itk.imread(fixedImageFile, PixelType)
-    movingImage = itk.imread(movingImageFile, PixelType)
-
-    FixedNormalizeFilterType = itk.NormalizeImageFilter[
-        FixedImageType, InternalImageType
-    ]
-
-    MovingNormalizeFilterType = itk.NormalizeImageFilter[
-        MovingImageType, InternalImageType
-    ]
-
-    fixedNormalizer = FixedNormalizeFilterType.New()
-
-    movingNormalizer = MovingNormalizeFilterType.New()
-
-    GaussianFilterType = itk.DiscreteGaussianImageFilter[
-        InternalImageType, InternalImageType
-    ]
-
-    fixedSmoother = GaussianFilterType.New()
-    movingSmoother = GaussianFilterType.New()
-
-    fixedSmoother.SetVariance(2.0)
-    movingSmoother.SetVariance(2.0)
-
-    fixedNormalizer.SetInput(fixedImage)
-    movingNormalizer.SetInput(movingImage)
+    movingSmoothed = _preprocess(movingImage)
 
-    fixedSmoother.SetInput(fixedNormalizer.GetOutput())
-    movingSmoother.SetInput(movingNormalizer.GetOutput())
+    registration.SetFixedImage(fixedSmoothed)
+    registration.SetMovingImage(movingSmoothed)
 
-    registration.SetFixedImage(fixedSmoother.GetOutput())
-    registration.SetMovingImage(movingSmoother.GetOutput())
-
-    fixedNormalizer.Update()
-    fixedImageRegion = fixedNormalizer.GetOutput().GetBufferedRegion()
+    fixedImageRegion = fixedSmoothed.GetBufferedRegion()
     registration.SetFixedImageRegion(fixedImageRegion)
 
-    initialParameters = transform.GetParameters()
-
-    initialParameters[0] = 0.0  # Initial offset in mm along X
-    initialParameters[1] = 0.0  # Initial offset in mm along Y
-
-    registration.SetInitialTransformParameters(initialParameters)
+    # no initial offset; rotations start about the fixed image centre
+    registration.SetInitialTransformParameters(initialTransform.GetParameters())
 
     #  We should now define the number of spatial samples to be considered in
     #  the metric computation. Note that we were forced to postpone this setting
@@ -135,7 +148,7 @@ def register_multimodal(fixedImageFile: str, movingImageFile: str, exportDir=Non
     #  default behavior by invoking the MaximizeOn() method.
     #  Additionally, we need to define the optimizer's step size the
     #  SetLearningRate() method.
-    optimizer.SetNumberOfIterations(200)
+    optimizer.SetNumberOfIterations(numberOfIterations)
     optimizer.MaximizeOn()
 
     # Note that large values of the learning rate will make the optimizer
@@ -154,119 +167,264 @@ def register_multimodal(fixedImageFile: str, movingImageFile: str, exportDir=Non
     # Metrics with large values will require you to use smaller values for the
     # learning rate in order to maintain a similar optimizer behavior.
     optimizer.SetLearningRate(15.0)
-
-    try:
-        registration.Update()
-        print(
-            "Optimizer stop condition: ",
-            registration.GetOptimizer().GetStopConditionDescription(),
+    if transform != "translation":
+        # the learning rate above is in millimetres, the scales bring the
+        # angles and scale factors to the same physical step
+        optimizer.SetScales(physical_shift_scales(initialTransform, fixedSmoothed))
+
+    monitor = ConvergenceMonitor(
+        optimizer,
+        registration,
+        convergenceWindow,
+        convergenceTolerance,
+        convergenceParameterTolerance,
+    )
+
+    instrument(registration, category="registration")
+    instrument(optimizer, category="registration")
+    watch(registration)
+    watch(optimizer)
+    start = time.perf_counter()
+    registration.Update()
+    seconds = time.perf_counter() - start
+    # a cancelled optimization returns early, never hand it to the cache
+    raise_if_cancelled()
+
+    return RegistrationResult(
+        "multimodal",
+        fixedImage,
+        movingImage,
+        _to_list(registration.GetLastTransformParameters()),
+        _to_list(initialTransform.GetFixedParameters()),
+        monitor.iterations,
+        optimizer.GetValue(),
+        monitor.GetStopConditionDescription(optimizer.GetStopConditionDescription()),
+        {"registration": seconds},
+        numberOfSamples,
+        monitor.history,
+        transform,
+    )
+
+
+@cached
+def _register_v4(
+    fixedImage,
+    movingImage,
+    numberOfIterations=200,
+    samplingStrategy="random",
+    samplingPercentage=0.1,
+    numberOfHistogramBins=24,
+    numberOfThreads=None,
+    convergenceWindow=None,
+    convergenceTolerance=1e-4,
+    convergenceParameterTolerance=None,
+    transform="translation",
+):
+    fixedImage, fixedSmoothed, prepared = _fixed(fixedImage)
+    Dimension = fixedImage.GetImageDimension()
+    InternalImageType = itk.Image[itk.F, Dimension]
+
+    movingSmoothed = _preprocess(movingImage)
+
+    initialTransform = initial_transform(transform, fixedImage, movingImage)
+
+    #  Mattes et al. estimate the joint histogram from a single set of samples
+    #  with B-spline Parzen windows, which is both cheaper and smoother than the
+    #  Viola-Wells estimate of the legacy engine. Unlike the legacy metric it
+    #  is minimized (it returns the negative mutual information).
+    metric = itk.MattesMutualInformationImageToImageMetricv4[
+        InternalImageType, InternalImageType
+    ].New()
+    metric.SetNumberOfHistogramBins(numberOfHistogramBins)
+    if numberOfThreads is not None:
+        metric.SetMaximumNumberOfWorkUnits(numberOfThreads)
+
+    #  The parameter scales are estimated from the physical shift that a unit
+    #  change of each parameter produces, so translations and rotations move
+    #  comparably; the step size is not estimated, the regular step optimizer
+    #  starts from LearningRate and relaxes it on every change of direction.
+    scalesEstimator = itk.RegistrationParameterScalesFromPhysicalShift[
+        type(metric)
+    ].New()
+    scalesEstimator.SetMetric(metric)
+
+    optimizer = itk.RegularStepGradientDescentOptimizerv4.New(
+        LearningRate=4,
+        MinimumStepLength=0.001,
+        RelaxationFactor=0.5,
+        NumberOfIterations=numberOfIterations,
+    )
+    optimizer.SetScalesEstimator(scalesEstimator)
+    if transform != "translation":
+        # see _register_unimodal
+        optimizer.SetRelaxationFactor(0.8)
+    if numberOfThreads is not None:
+        optimizer.SetNumberOfWorkUnits(numberOfThreads)
+
+    registration = itk.ImageRegistrationMethodv4[
+        InternalImageType, InternalImageType
+    ].New(
+        FixedImage=fixedSmoothed,
+        MovingImage=movingSmoothed,
+        Metric=metric,
+        Optimizer=optimizer,
+        InitialTransform=initialTransform,
+    )
+    registration.SetNumberOfLevels(1)
+    registration.SetSmoothingSigmasPerLevel([0])
+    registration.SetShrinkFactorsPerLevel([1])
+
+    if samplingStrategy not in SAMPLING_STRATEGIES:
+        raise ValueError(
+            "Unknown sampling strategy '%s', expected one of %s"
+            % (samplingStrategy, sorted(SAMPLING_STRATEGIES))
         )
-    except itk.ExceptionObject as err:
-        print("case bung")
-
-    finalParameters = registration.GetLastTransformParameters()
-
-    TranslationAlongX = finalParameters[0]
-    TranslationAlongY = finalParameters[1]
-
-    numberOfIterations = optimizer.GetCurrentIteration()
-
-    bestValue = optimizer.GetValue()
-
-    # Print out results
-    print("Result ")
-    print(" Translation X = ", TranslationAlongX)
-    print(" Translation Y = ", TranslationAlongY)
-    print(" Iterations    = ", numberOfIterations)
-    print(" Metric value  = ", bestValue)
-    print(" Numb. Samples = ", numberOfSamples)
-
-    ResampleFilterType = itk.ResampleImageFilter[MovingImageType, FixedImageType]
-
-    finalTransform = TransformType.New()
-
-    finalTransform.SetParameters(finalParameters)
-    finalTransform.SetFixedParameters(transform.GetFixedParameters())
-
-    resample = ResampleFilterType.New()
-
-    resample.SetTransform(finalTransform)
-    resample.SetInput(movingImage)
-    resample.SetSize(fixedImage.GetLargestPossibleRegion().GetSize())
-    resample.SetOutputOrigin(fixedImage.GetOrigin())
-    resample.SetOutputSpacing(fixedImage.GetSpacing())
-    resample.SetOutputDirection(fixedImage.GetDirection())
-    resample.SetDefaultPixelValue(100)
-
-    OutputPixelType = itk.UC
-
-    OutputImageType = itk.Image[OutputPixelType, Dimension]
-
-    CastFilterType = itk.CastImageFilter[FixedImageType, OutputImageType]
-
-    caster = CastFilterType.New()
-    caster.SetInput(resample.GetOutput())
-
-    caster.Update()
-    outputImageFile = caster.GetOutput().__array__().copy()
-    # if exportDir is not None:
-    #     writer = itk.ImageFileWriter[OutputImageType].New()
-    #     writer.SetInput(caster.GetOutput())
-
-    #     writer.SetFileName(outputImageFile)
-    #     writer.Update()
-
-    # Generate checkerboards before and after registration
-    CheckerBoardFilterType = itk.CheckerBoardImageFilter[FixedImageType]
-
-    checker = CheckerBoardFilterType.New()
-    checker.SetInput1(fixedImage)
-    checker.SetInput2(resample.GetOutput())
-
-    caster.SetInput(checker.GetOutput())
-
-    # Before registration
-    identityTransform = TransformType.New()
-    identityTransform.SetIdentity()
-    resample.SetTransform(identityTransform)
-
-    caster.Update()
-    checkerBoardBefore = caster.GetOutput().__array__().copy()
-    # if exportDir is not None:
-    #     writer.SetFileName(checkerBoardBeforePath)
-    #     writer.Update()
-
-    # After registration
-    resample.SetTransform(finalTransform)
-    caster.Update()
-    checkerBoardAfter = caster.GetOutput().__array__().copy()
-    # if exportDir is not None:
-    #     writer.SetFileName(checkerBoardAfterPath)
-    #     writer.Update()
-
-    fig, ax = plt.subplots(2, 2, figsize=(6, 6))
-    ax[0][0].imshow(fixedImage, cmap="gray")
-    ax[0][0].set_title("Fixed image")
-    ax[0][1].imshow(movingImage, cmap="gray")
-    ax[0][1].set_title("Moving image")
-
-    ax[1][0].imshow(checkerBoardBefore, cmap="gray")
-    ax[1][0].set_title("Checker board before")
-    ax[1][1].imshow(checkerBoardAfter, cmap="gray")
-    ax[1][1].set_title("Checker board after")
+    registration.SetMetricSamplingStrategy(
+        getattr(
+            itk.ImageRegistrationMethodv4Enums,
+            SAMPLING_STRATEGIES[samplingStrategy],
+        )
+    )
+    if samplingStrategy == "none":
+        samplingPercentage = 1.0
+    samplePoints = None
+    if prepared is not None:
+        samplePoints = prepared.GetSamplePoints(samplingStrategy, samplingPercentage)
+    if samplePoints is not None:
+        # the prepared points replace the ones the method would draw itself
+        registration.SetMetricSamplingStrategy(
+            itk.ImageRegistrationMethodv4Enums.MetricSamplingStrategy_NONE
+        )
+        metric.SetFixedSampledPointSet(samplePoints)
+        metric.SetUseSampledPointSet(True)
+    registration.SetMetricSamplingPercentage(samplingPercentage)
+    # For consistent results when regression testing.
+    registration.MetricSamplingReinitializeSeed(121212)
+
+    monitor = ConvergenceMonitor(
+        optimizer,
+        registration,
+        convergenceWindow,
+        convergenceTolerance,
+        convergenceParameterTolerance,
+    )
+
+    instrument(registration, category="registration")
+    instrument(optimizer, category="registration")
+    watch(registration)
+    watch(optimizer)
+    start = time.perf_counter()
+    registration.Update()
+    seconds = time.perf_counter() - start
+    # a cancelled optimization returns early, never hand it to the cache
+    raise_if_cancelled()
+
+    numberOfPixels = fixedSmoothed.GetBufferedRegion().GetNumberOfPixels()
+    numberOfSamples = (
+        int(numberOfPixels * samplingPercentage)
+        if samplePoints is None
+        else samplePoints.GetNumberOfPoints()
+    )
+    return RegistrationResult(
+        "multimodal",
+        fixedImage,
+        movingImage,
+        _to_list(registration.GetTransform().GetParameters()),
+        _to_list(initialTransform.GetFixedParameters()),
+        monitor.iterations,
+        optimizer.GetValue(),
+        monitor.GetStopConditionDescription(optimizer.GetStopConditionDescription()),
+        {"registration": seconds},
+        numberOfSamples,
+        monitor.history,
+        transform,
+    )
+
+
+def register_multimodal(
+    fixedImageFile,
+    movingImageFile: str,
+    exportDir=None,
+    engine="legacy",
+    numberOfIterations=200,
+    samplingStrategy="random",
+    samplingPercentage=0.1,
+    numberOfHistogramBins=24,
+    numberOfThreads=None,
+    convergenceWindow=None,
+    convergenceTolerance=1e-4,
+    convergenceParameterTolerance=None,
+    transform="translation",
+):
+    """Registration by maximization of mutual information.
+
+    ``engine="legacy"`` runs the original ``ImageRegistrationMethod`` with the
+    Viola-Wells metric. ``engine="v4"`` runs ``ImageRegistrationMethodv4``
+    with Mattes mutual information, ``samplingStrategy`` (``"none"``,
+    ``"regular"`` or ``"random"``) and ``samplingPercentage`` of the fixed
+    image pixels, a multithreaded metric (``numberOfThreads`` work units, ITK's
+    global default when None) and automatically estimated parameter scales.
+    The sampling, bin and thread arguments only apply to the v4 engine.
+
+    Every iteration is recorded in ``result.history``. With a
+    ``convergenceWindow`` of N iterations, the optimizer stops as soon as the
+    metric trend over the last N iterations changes it by less than
+    ``convergenceTolerance`` (relative) and, when given, the parameters by
+    less than ``convergenceParameterTolerance`` (see ``ConvergenceMonitor``).
+    This matters most for the legacy engine, whose fixed learning rate
+    otherwise always runs all ``numberOfIterations``.
+
+    ``transform`` is one of ``transforms.TRANSFORMS`` (see
+    ``register_unimodal``). The v4 engine scales its parameters with
+    ``RegistrationParameterScalesFromPhysicalShift``, the legacy engine with
+    ``physical_shift_scales``.
+
+    ``fixedImageFile`` may also be a ``PreparedFixedImage`` (see
+    ``prepare_fixed_image``), which skips reading and preprocessing the fixed
+    image and, for the v4 engine, drawing its sample points.
+
+    Returns a ``RegistrationResult``; ``print(result)`` gives the summary and
+    ``result.show()`` the fixed/moving/checkerboard figure. The resampled image
+    and the checkerboards are only computed when accessed, or when
+    ``exportDir`` asks for them to be written.
+    """
+    PixelType = itk.F
 
-    plt.tight_layout()
-    plt.show()
+    start = time.perf_counter()
+    with span("read"):
+        fixedImage = _read_fixed(fixedImageFile, PixelType)
+        movingImage = itk.imread(movingImageFile, PixelType)
+    read = time.perf_counter() - start
+
+    if engine == "legacy":
+        result = _register_legacy(
+            fixedImage,
+            movingImage,
+            numberOfIterations,
+            convergenceWindow=convergenceWindow,
+            convergenceTolerance=convergenceTolerance,
+            convergenceParameterTolerance=convergenceParameterTolerance,
+            transform=transform,
+        )
+    elif engine == "v4":
+        result = _register_v4(
+            fixedImage,
+            movingImage,
+            numberOfIterations,
+            samplingStrategy,
+            samplingPercentage,
+            numberOfHistogramBins,
+            numberOfThreads,
+            convergenceWindow=convergenceWindow,
+            convergenceTolerance=convergenceTolerance,
+            convergenceParameterTolerance=convergenceParameterTolerance,
+            transform=transform,
+        )
+    else:
+        raise ValueError("Unknown engine '%s', expected one of %s" % (engine, ENGINES))
+    result.timings["read"] = read
 
     if exportDir is not None:
-        os.makedirs(exportDir, exist_ok=True)
-        outputImageFilePath = os.path.join(exportDir, "outputImageFile.png")
-        checkerBoardBeforePath = os.path.join(exportDir, "checkerBoardBefore.png")
-        checkerBoardAfterPath = os.path.join(exportDir, "checkerBoardAfter.png")
-
-        outputImageFile = Image.fromarray(outputImageFile)
-        outputImageFile.save(outputImageFilePath)
-        checkerBoardBefore = Image.fromarray(checkerBoardBefore)
-        checkerBoardBefore.save(checkerBoardBeforePath)
-        checkerBoardAfter = Image.fromarray(checkerBoardAfter)
-        checkerBoardAfter.save(checkerBoardAfterPath)
+        result.export(exportDir)
+
+    return result
@@ -0,0 +1,219 @@
+"""Fixed-image state shared by repeated registrations.
+
+    from src.registration import prepare_fixed_image, register_multimodal
+
+    atlas = prepare_fixed_image("atlas.mha", engine="v4")
+    atlas.save("atlas.prepared.npz")  # PreparedFixedImage.load() in later sessions
+    for path in movingImageFiles:
+        result = register_multimodal(atlas, path, engine="v4")
+
+Every registration core accepts a ``PreparedFixedImage`` wherever it takes a
+fixed image. Work that only depends on the fixed image is then done once:
+reading it, the normalization and smoothing the mutual information engines
+apply (``_preprocess``), and the v4 engine's metric sample points.
+
+There is no fixed-image gradient to keep: both v4 metrics used here (mean
+squares and Mattes mutual information) take their gradients from the moving
+image only, so ITK never computes one for the fixed image.
+"""
+
+import math
+from functools import cached_property
+
+import itk
+import numpy as np
+
+# bump when the saved layout changes
+FORMAT_VERSION = 1
+
+# the seed the registration cores use "for consistent results when
+# regression testing"
+DEFAULT_SEED = 121212
+
+
+def _geometry(image):
+    return (
+        np.array(image.GetSpacing(), dtype=np.float64),
+        np.array(image.GetOrigin(), dtype=np.float64),
+        itk.array_from_matrix(image.GetDirection()),
+    )
+
+
+def _image(array, spacing, origin, direction):
+    image = itk.image_from_array(np.ascontiguousarray(array, dtype=np.float32))
+    image.SetSpacing([float(s) for s in spacing])
+    image.SetOrigin([float(o) for o in origin])
+    image.SetDirection(itk.matrix_from_array(np.asarray(direction, dtype=np.float64)))
+    return image
+
+
+def sample_points(image, samplingStrategy, samplingPercentage, seed=DEFAULT_SEED):
+    """Physical points (one row each) for the v4 metric sampling strategies.
+
+    Like ``ImageRegistrationMethodv4``, ``"random"`` draws distinct pixels
+    and ``"regular"`` takes every n-th pixel in memory order, and both move
+    each point by a random offset of up to half a pixel. ``"none"`` returns
+    ``None`` (the metric then uses every pixel). The points come from
+    NumPy's generator, not ITK's, so they are a different draw of the same
+    size as the one the method makes itself.
+    """
+    if samplingStrategy == "none":
+        return None
+    size = np.array(image.GetLargestPossibleRegion().GetSize())
+    numberOfPixels = int(np.prod(size))
+    numberOfSamples = min(
+        numberOfPixels, int(math.ceil(numberOfPixels * samplingPercentage))
+    )
+
+    rng = np.random.default_rng(seed)
+    if samplingStrategy == "random":
+        flat = rng.choice(numberOfPixels, numberOfSamples, replace=False)
+    elif samplingStrategy == "regular":
+        flat = (np.arange(numberOfSamples) * numberOfPixels) // numberOfSamples
+    else:
+        raise ValueError("Unknown sampling strategy '%s'" % samplingStrategy)
+
+    # flat indices are in NumPy (slowest axis first) order, ITK indices x first
+    index = np.stack(np.unravel_index(flat, size[::-1])[::-1], axis=1).astype(
+        np.float64
+    )
+    index += rng.uniform(-0.5, 0.5, index.shape)
+    spacing, origin, direction = _geometry(image)
+    return origin + (index * spacing) @ direction.T
+
+
+class PreparedFixedImage:
+    """A fixed image plus what the registration cores derive from it alone.
+
+    ``image`` is the fixed image itself, which results are resampled onto.
+    ``smoothed`` is its normalized and smoothed version for the mutual
+    information engines, and ``GetSamplePoints()`` gives the v4 engine's
+    metric sample points per strategy and percentage. Both are computed on
+    first use and kept, and both survive ``save()``/``load()`` and pickling,
+    so a prepared image handed to worker processes is prepared only once.
+    """
+
+    def __init__(self, image, seed=DEFAULT_SEED):
+        self.image = image
+        self.seed = seed
+        # (strategy, percentage) -> array of physical points
+        self.samplePoints = {}
+        self._pointSets = {}
+
+    def GetCacheKey(self):
+        """What the result cache hashes: everything else derives from these."""
+        return [self.image, self.seed]
+
+    @cached_property
+    def smoothed(self):
+        from .multimodal import _preprocess
+
+        return _preprocess(self.image)
+
+    def GetSampleArray(self, samplingStrategy, samplingPercentage):
+        """The sample points as an ``(n, Dimension)`` array, or ``None``."""
+        key = (samplingStrategy, float(samplingPercentage))
+        if key not in self.samplePoints:
+            self.samplePoints[key] = sample_points(
+                self.image, samplingStrategy, samplingPercentage, self.seed
+            )
+        return self.samplePoints[key]
+
+    def GetSamplePoints(self, samplingStrategy, samplingPercentage):
+        """The sample points as the metric's ``itk.PointSet``, or ``None``."""
+        key = (samplingStrategy, float(samplingPercentage))
+        if key not in self._pointSets:
+            points = self.GetSampleArray(samplingStrategy, samplingPercentage)
+            pointSet = None
+            if points is not None:
+                Dimension = self.image.GetImageDimension()
+                pointSet = itk.PointSet[itk.F, Dimension].New()
+                pointSet.SetPoints(
+                    itk.vector_container_from_array(
+                        np.ascontiguousarray(points, dtype=np.float32).ravel()
+                    )
+                )
+            self._pointSets[key] = pointSet
+        return self._pointSets[key]
+
+    def _arrays(self):
+        spacing, origin, direction = _geometry(self.image)
+        arrays = {
+            "format": np.array(FORMAT_VERSION),
+            "seed": np.array(self.seed),
+            "image": itk.array_from_image(self.image),
+            "spacing": spacing,
+            "origin": origin,
+            "direction": direction,
+        }
+        if "smoothed" in self.__dict__:
+            arrays["smoothed"] = itk.array_from_image(self.smoothed)
+        for (strategy, percentage), points in self.samplePoints.items():
+            if points is not None:
+                arrays["points:%s:%r" % (strategy, percentage)] = points
+        return arrays
+
+    @classmethod
+    def _from_arrays(cls, arrays):
+        if int(arrays["format"]) != FORMAT_VERSION:
+            raise ValueError(
+                "Prepared fixed image format %d, expected %d"
+                % (int(arrays["format"]), FORMAT_VERSION)
+            )
+        geometry = (arrays["spacing"], arrays["origin"], arrays["direction"])
+        prepared = cls(_image(arrays["image"], *geometry), int(arrays["seed"]))
+        if "smoothed" in arrays:
+            prepared.smoothed = _image(arrays["smoothed"], *geometry)
+        for name in arrays:
+            if name.startswith("points:"):
+                _, strategy, percentage = name.split(":")
+                prepared.samplePoints[(strategy, float(percentage))] = np.asarray(
+                    arrays[name]
+                )
+        return prepared
+
+    def save(self, path):
+        """Write everything computed so far to ``path`` (NumPy ``.npz``)."""
+        with open(path, "wb") as f:
+            np.savez(f, **self._arrays())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls._from_arrays({name: arrays[name] for name in arrays.files})
+
+    # pickled as plain arrays; the ITK point sets are rebuilt on demand
+    def __reduce__(self):
+        return (type(self)._from_arrays, (self._arrays(),))
+
+
+def _read_fixed(fixedImageFile, PixelType):
+    # the public registration functions take a path or a prepared image
+    if isinstance(fixedImageFile, PreparedFixedImage):
+        return fixedImageFile
+    return itk.imread(fixedImageFile, PixelType)
+
+
+def prepare_fixed_image(
+    fixedImage,
+    method="multimodal",
+    engine="v4",
+    samplingStrategy="random",
+    samplingPercentage=0.1,
+    seed=DEFAULT_SEED,
+):
+    """A ``PreparedFixedImage`` with what ``method``/``engine`` will need.
+
+    ``fixedImage`` is a path or an ``itk.Image``. For ``"multimodal"`` the
+    smoothed image is computed right away, and for its ``"v4"`` engine also
+    the sample points of ``samplingStrategy`` and ``samplingPercentage``
+    (other settings are computed when first used).
+    """
+    if isinstance(fixedImage, str):
+        fixedImage = itk.imread(fixedImage, itk.F)
+    prepared = PreparedFixedImage(fixedImage, seed)
+    if method == "multimodal":
+        prepared.smoothed
+        if engine == "v4":
+            prepared.GetSamplePoints(samplingStrategy, samplingPercentage)
+    return prepared
@@ -0,0 +1,92 @@
+import math
+
+import itk
+
+
+def auto_schedule(size, minimumSize=64, maximumLevels=4, numberOfIterations=200):
+    """Coarse-to-fine schedule for an image of the given size (in pixels).
+
+    Levels are added while the coarsest level keeps at least ``minimumSize``
+    pixels along its shortest axis. Each level halves the resolution of the
+    next finer one, is smoothed with a sigma of half its shrink factor (in
+    pixels) and gets half the iteration budget of the level above it, since
+    the finer levels start close to the solution.
+
+    Returns ``(shrinkFactors, smoothingSigmas, iterations)``, coarsest first.
+    """
+    shortest = min(size)
+    levels = 1
+    while levels < maximumLevels and shortest / 2**levels >= minimumSize:
+        levels += 1
+
+    shrinkFactors = [2 ** (levels - 1 - level) for level in range(levels)]
+    smoothingSigmas = [factor / 2.0 if factor > 1 else 0.0 for factor in shrinkFactors]
+    iterations = [max(numberOfIterations // 2**level, 20) for level in range(levels)]
+    return shrinkFactors, smoothingSigmas, iterations
+
+
+def resolve_schedule(
+    size,
+    shrinkFactors=None,
+    smoothingSigmas=None,
+    iterations=None,
+    numberOfIterations=200,
+):
+    """Fill in whatever part of a schedule was not given explicitly."""
+    if shrinkFactors is None:
+        autoShrink, autoSigmas, autoIterations = auto_schedule(
+            size, numberOfIterations=numberOfIterations
+        )
+        shrinkFactors = autoShrink
+        smoothingSigmas = autoSigmas if smoothingSigmas is None else smoothingSigmas
+        iterations = autoIterations if iterations is None else iterations
+    shrinkFactors = list(shrinkFactors)
+    levels = len(shrinkFactors)
+
+    if smoothingSigmas is None:
+        smoothingSigmas = [f / 2.0 if f > 1 else 0.0 for f in shrinkFactors]
+    if iterations is None:
+        iterations = numberOfIterations
+    if isinstance(iterations, int):
+        iterations = [iterations] * levels
+
+    smoothingSigmas = list(smoothingSigmas)
+    iterations = list(iterations)
+    if len(smoothingSigmas) != levels or len(iterations) != levels:
+        raise ValueError(
+            "shrinkFactors, smoothingSigmas and iterations need one entry per "
+            "level, got %d, %d and %d" % (levels, len(smoothingSigmas), len(iterations))
+        )
+    return shrinkFactors, smoothingSigmas, iterations
+
+
+def apply_schedule(registration, optimizer, shrinkFactors, smoothingSigmas, iterations):
+    """Configure a v4 registration method for a multi-level schedule.
+
+    ``ImageRegistrationMethodv4`` has no per-level iteration setting, so an
+    observer on ``MultiResolutionIterationEvent`` sets the optimizer budget
+    whenever a new level starts. The observer tag is returned.
+
+    Only meant for optimizers with a learning rate (the gradient descent
+    family used in this package).
+    """
+    registration.SetNumberOfLevels(len(shrinkFactors))
+    registration.SetShrinkFactorsPerLevel(shrinkFactors)
+    registration.SetSmoothingSigmasPerLevel(smoothingSigmas)
+    registration.SmoothingSigmasAreSpecifiedInPhysicalUnitsOff()
+
+    optimizer.SetNumberOfIterations(iterations[0])
+
+    # the optimizer restarts with its full learning rate at every level; finer
+    # levels start close to the solution, so their first steps are scaled down
+    # with the shrink factor instead of re-exploring the coarse range
+    learningRate = optimizer.GetLearningRate()
+
+    def onLevel():
+        level = registration.GetCurrentLevel()
+        optimizer.SetNumberOfIterations(iterations[level])
+        optimizer.SetLearningRate(
+            learningRate * shrinkFactors[level] / shrinkFactors[0]
+        )
+
+    return registration.AddObserver(itk.MultiResolutionIterationEvent(), onLevel)
@@ -0,0 +1,214 @@
+"""Apply one registration transform to many images in one pass.
+
+    result = register_multimodal(fixed, "study/t1.png", engine="v4", transform="euler")
+    resampler = result.GetResampler()
+    channels = resampler.Resample(study)  # (channels, *moving shape) -> (channels, *fixed shape)
+
+The channels of a study share the moving image grid, so the resampler
+stacks them along a new slowest axis and runs a single ``ResampleImageFilter``
+over the stack, with the transform extended by an identity along that axis.
+ITK's work units then split the whole stack, every channel is read and
+written in the same pass, and each value is the one resampling that channel
+on its own would give. A C-contiguous NumPy stack of a pixel type ITK wraps
+(uint8, int16, uint16, float32, float64), including one backed by
+``multiprocessing.shared_memory``, is used without a copy, and the result is
+a view of ITK's output buffer.
+
+The stacked pass needs a linear transform (every one in ``transforms.py``
+is) and images of up to three dimensions. Otherwise the same filter
+resamples the channels one after the other.
+"""
+
+import itk
+import numpy as np
+
+from ..jobs.cancellation import watch
+from ..profiling import instrument
+
+# pixel types ResampleImageFilter is wrapped for
+PIXEL_TYPES = (np.uint8, np.int16, np.uint16, np.float32, np.float64)
+
+# the largest image dimension ITK wraps, for the stacked image
+_MAXIMUM_DIMENSION = 4
+
+
+def _geometry(image):
+    return (
+        [float(v) for v in image.GetSpacing()],
+        [float(v) for v in image.GetOrigin()],
+        itk.array_from_matrix(image.GetDirection()),
+    )
+
+
+def _is_image(value):
+    return hasattr(value, "GetSpacing")
+
+
+def _matrix_offset(transform, Dimension):
+    # (matrix, offset) of a linear transform; a composite applies its last
+    # transform first
+    transforms = [transform]
+    if hasattr(transform, "GetNumberOfTransforms"):
+        transforms = [
+            itk.down_cast(transform.GetNthTransform(i))
+            for i in range(transform.GetNumberOfTransforms())
+        ]
+    matrix = np.eye(Dimension)
+    offset = np.zeros(Dimension)
+    for t in transforms:
+        tMatrix = (
+            itk.array_from_matrix(t.GetMatrix())
+            if hasattr(t, "GetMatrix")
+            else np.eye(Dimension)
+        )
+        tOffset = np.array(t.GetOffset(), dtype=float)
+        offset = matrix @ tOffset + offset
+        matrix = matrix @ tMatrix
+    return matrix, offset
+
+
+class Resampler:
+    """Maps images of the moving study onto the grid of ``referenceImage``.
+
+    ``transform`` maps fixed (reference) points to moving points, as the
+    registration results do. ``movingImage`` gives the spacing, origin and
+    direction of NumPy inputs; ``itk.Image`` inputs carry their own.
+    Pixels mapped outside the moving image get ``defaultPixelValue``.
+    """
+
+    def __init__(
+        self, transform, referenceImage, movingImage=None, defaultPixelValue=0
+    ):
+        self.transform = transform
+        self.referenceImage = referenceImage
+        self.movingImage = movingImage
+        self.defaultPixelValue = defaultPixelValue
+        self.Dimension = referenceImage.GetImageDimension()
+        self._stacked = self.Dimension < _MAXIMUM_DIMENSION and bool(
+            transform.IsLinear()
+        )
+        if self._stacked:
+            matrix, offset = _matrix_offset(transform, self.Dimension)
+            stackedMatrix = np.eye(self.Dimension + 1)
+            stackedMatrix[: self.Dimension, : self.Dimension] = matrix
+            self._stackedTransform = itk.AffineTransform[
+                itk.D, self.Dimension + 1
+            ].New()
+            self._stackedTransform.SetMatrix(itk.matrix_from_array(stackedMatrix))
+            self._stackedTransform.SetOffset([float(v) for v in offset] + [0.0])
+        # one filter per pixel type, reused by every call
+        self._filters = {}
+        self._inputArray = None
+
+    def IsStacked(self):
+        """Whether all channels are resampled in a single pass."""
+        return self._stacked
+
+    def _filter(self, ImageType):
+        if ImageType not in self._filters:
+            resampler = itk.ResampleImageFilter[ImageType, ImageType].New()
+            resampler.SetDefaultPixelValue(self.defaultPixelValue)
+            self._filters[ImageType] = resampler
+        resampler = self._filters[ImageType]
+        instrument(resampler, category="resample")
+        watch(resampler)
+        return resampler
+
+    def _inputs(self, images):
+        # (stack of shape (channels, *moving shape), moving geometry, single)
+        single = _is_image(images) or (
+            isinstance(images, np.ndarray) and images.ndim == self.Dimension
+        )
+        if single:
+            images = [images]
+        if isinstance(images, np.ndarray):
+            stack = images
+            geometry = None
+        else:
+            images = list(images)
+            geometry = _geometry(images[0]) if _is_image(images[0]) else None
+            stack = np.stack(
+                [
+                    itk.array_view_from_image(image) if _is_image(image) else image
+                    for image in images
+                ]
+            )
+        if stack.dtype.type not in PIXEL_TYPES:
+            stack = stack.astype(np.float32)
+        stack = np.ascontiguousarray(stack)
+        if geometry is None:
+            if self.movingImage is not None:
+                geometry = _geometry(self.movingImage)
+            else:
+                Dimension = self.Dimension
+                geometry = ([1.0] * Dimension, [0.0] * Dimension, np.eye(Dimension))
+        return stack, geometry, single
+
+    def _set_output_grid(self, resampler, channels):
+        spacing, origin, direction = _geometry(self.referenceImage)
+        region = self.referenceImage.GetLargestPossibleRegion()
+        size = [int(s) for s in region.GetSize()]
+        start = [int(i) for i in region.GetIndex()]
+        if channels is not None:
+            spacing, origin, direction = _stacked_geometry(spacing, origin, direction)
+            size.append(channels)
+            start.append(0)
+        resampler.SetSize(size)
+        resampler.SetOutputStartIndex(start)
+        resampler.SetOutputSpacing(spacing)
+        resampler.SetOutputOrigin(origin)
+        resampler.SetOutputDirection(itk.matrix_from_array(direction))
+
+    def Resample(self, images):
+        """Resample ``images`` onto the reference grid.
+
+        ``images`` is a NumPy array of shape ``(channels, *moving shape)``, a
+        list of arrays or ``itk.Image`` objects sharing one grid, or a
+        single image or array of the moving shape. Returns an array of shape
+        ``(channels, *reference shape)`` (or the reference shape for a single
+        image) in the input's pixel type, float32 for types ITK does not
+        wrap. With the stacked pass the array is a view of the filter's
+        output, which the next call of this resampler overwrites.
+        """
+        stack, (spacing, origin, direction), single = self._inputs(images)
+        if self._stacked:
+            image = itk.image_view_from_array(stack)
+            stackedSpacing, stackedOrigin, stackedDirection = _stacked_geometry(
+                spacing, origin, direction
+            )
+            image.SetSpacing(stackedSpacing)
+            image.SetOrigin(stackedOrigin)
+            image.SetDirection(itk.matrix_from_array(stackedDirection))
+            resampler = self._filter(type(image))
+            resampler.SetInput(image)
+            # the image view does not own its buffer
+            self._inputArray = stack
+            resampler.SetTransform(self._stackedTransform)
+            self._set_output_grid(resampler, len(stack))
+            resampler.UpdateLargestPossibleRegion()
+            output = itk.array_view_from_image(resampler.GetOutput())
+        else:
+            output = None
+            for channel, array in enumerate(stack):
+                image = itk.image_view_from_array(array)
+                image.SetSpacing(spacing)
+                image.SetOrigin(origin)
+                image.SetDirection(itk.matrix_from_array(direction))
+                resampler = self._filter(type(image))
+                resampler.SetInput(image)
+                resampler.SetTransform(self.transform)
+                self._set_output_grid(resampler, None)
+                resampler.UpdateLargestPossibleRegion()
+                resampled = itk.array_view_from_image(resampler.GetOutput())
+                if output is None:
+                    output = np.empty((len(stack),) + resampled.shape, resampled.dtype)
+                output[channel] = resampled
+        return output[0] if single else output
+
+
+def _stacked_geometry(spacing, origin, direction):
+    # the stack axis is the slowest one, with unit spacing and no rotation
+    Dimension = len(spacing)
+    stackedDirection = np.eye(Dimension + 1)
+    stackedDirection[:Dimension, :Dimension] = direction
+    return list(spacing) + [1.0], list(origin) + [0.0], stackedDirection
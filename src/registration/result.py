@@ -0,0 +1,265 @@
+import os
+import time
+from functools import cached_property
+
+import itk
+
+from ..export import geometry_of, save
+from ..profiling import span
+from .resampler import Resampler
+from .transforms import transform_type
+
+
+class RegistrationResult:
+    """Outcome of one registration.
+
+    The numbers (``parameters``, ``iterations``, ``metricValue``,
+    ``stopCondition``, ``timings``) are plain Python values. ``history`` has
+    one entry per optimizer iteration (see ``ConvergenceMonitor``). The images
+    (``transformedImage``, the difference images and the checkerboards) are
+    only resampled when first accessed and then kept, so a caller that just
+    needs the transform never pays for them. Computing an image adds its time
+    to ``timings``.
+
+    ``transform`` names the optimized transform (see ``transforms.py``);
+    ``GetResampler()`` applies it to further images of the moving study.
+    """
+
+    def __init__(
+        self,
+        kind,
+        fixedImage,
+        movingImage,
+        parameters,
+        fixedParameters,
+        iterations,
+        metricValue,
+        stopCondition,
+        timings,
+        numberOfSamples=None,
+        history=None,
+        transform="translation",
+    ):
+        self.kind = kind
+        self.fixedImage = fixedImage
+        self.movingImage = movingImage
+        self.parameters = list(parameters)
+        self.fixedParameters = list(fixedParameters)
+        self.iterations = iterations
+        self.metricValue = metricValue
+        self.stopCondition = stopCondition
+        self.timings = dict(timings)
+        self.numberOfSamples = numberOfSamples
+        self.history = list(history or [])
+        self.transform = transform
+
+    @property
+    def translation(self):
+        if self.transform == "translation":
+            return self.parameters[: self.fixedImage.GetImageDimension()]
+        return [float(t) for t in self.GetTransform().GetTranslation()]
+
+    def __repr__(self):
+        return (
+            "%s(kind=%r, transform=%r, parameters=%r, iterations=%r, metricValue=%r)"
+            % (
+                type(self).__name__,
+                self.kind,
+                self.transform,
+                self.parameters,
+                self.iterations,
+                self.metricValue,
+            )
+        )
+
+    def __str__(self):
+        lines = ["Result "]
+        for axis, value in zip("XYZ", self.translation):
+            lines.append(" Translation %s = %s" % (axis, value))
+        if self.transform != "translation":
+            lines.append(" Transform     = %s" % self.transform)
+            lines.append(" Parameters    = %s" % self.parameters)
+        lines.append(" Iterations    = %s" % self.iterations)
+        lines.append(" Metric value  = %s" % self.metricValue)
+        if self.numberOfSamples is not None:
+            lines.append(" Numb. Samples = %s" % self.numberOfSamples)
+        lines.append(" Stop condition: %s" % self.stopCondition)
+        return "\n".join(lines)
+
+    def GetTransform(self):
+        Dimension = self.fixedImage.GetImageDimension()
+        transform = transform_type(self.transform, Dimension).New()
+        # fixed parameters (the centre) first, setting them resets the offset
+        transform.SetFixedParameters(_to_parameters(self.fixedParameters))
+        transform.SetParameters(_to_parameters(self.parameters))
+        return transform
+
+    def GetCompositeTransform(self):
+        """The final transform as a ``CompositeTransform``, fixed to moving points."""
+        Dimension = self.fixedImage.GetImageDimension()
+        composite = itk.CompositeTransform[itk.D, Dimension].New()
+        composite.AddTransform(self.GetTransform())
+        return composite
+
+    def GetResampler(self, defaultPixelValue=0):
+        """A ``Resampler`` that maps images of the moving study onto the fixed grid."""
+        return Resampler(
+            self.GetCompositeTransform(),
+            self.fixedImage,
+            self.movingImage,
+            defaultPixelValue,
+        )
+
+    def _identity(self):
+        Dimension = self.fixedImage.GetImageDimension()
+        transform = itk.TranslationTransform[itk.D, Dimension].New()
+        transform.SetIdentity()
+        return transform
+
+    def _resample(self, transform, defaultPixelValue):
+        return itk.resample_image_filter(
+            self.movingImage,
+            transform=transform,
+            use_reference_image=True,
+            reference_image=self.fixedImage,
+            default_pixel_value=defaultPixelValue,
+        )
+
+    def _timed(self, name, function):
+        start = time.perf_counter()
+        with span(name, "result"):
+            value = function()
+        self.timings[name] = time.perf_counter() - start
+        return value
+
+    def _cast(self, image):
+        OutputImageType = itk.Image[itk.UC, image.GetImageDimension()]
+        return itk.array_view_from_image(
+            itk.cast_image_filter(image, ttype=(type(image), OutputImageType))
+        )
+
+    def _difference(self, transform):
+        # the resampler's default value of 1 keeps the border out of the
+        # rescaled range, as in the original example
+        difference = itk.subtract_image_filter(
+            self.fixedImage, self._resample(transform, 1)
+        )
+        OutputImageType = itk.Image[itk.UC, difference.GetImageDimension()]
+        return itk.array_view_from_image(
+            itk.rescale_intensity_image_filter(
+                difference,
+                ttype=(type(difference), OutputImageType),
+                output_minimum=0,
+                output_maximum=255,
+            )
+        )
+
+    def _checkerboard(self, transform):
+        return self._cast(
+            itk.checker_board_image_filter(
+                self.fixedImage, self._resample(transform, 100)
+            )
+        )
+
+    @cached_property
+    def transformedImage(self):
+        """Moving image resampled onto the fixed image grid, as uint8."""
+        return self._timed(
+            "transformedImage",
+            lambda: self._cast(self._resample(self.GetTransform(), 100)),
+        )
+
+    @cached_property
+    def differenceBefore(self):
+        return self._timed(
+            "differenceBefore", lambda: self._difference(self._identity())
+        )
+
+    @cached_property
+    def differenceAfter(self):
+        return self._timed(
+            "differenceAfter", lambda: self._difference(self.GetTransform())
+        )
+
+    @cached_property
+    def checkerBoardBefore(self):
+        return self._timed(
+            "checkerBoardBefore", lambda: self._checkerboard(self._identity())
+        )
+
+    @cached_property
+    def checkerBoardAfter(self):
+        return self._timed(
+            "checkerBoardAfter", lambda: self._checkerboard(self.GetTransform())
+        )
+
+    def _views(self):
+        # the comparison images each registration example has always shown
+        if self.kind == "unimodal":
+            return [
+                ("Difference after", "difference_after", "differenceAfter"),
+                ("Difference before", "difference_before", "differenceBefore"),
+            ]
+        return [
+            ("Checker board before", "checkerBoardBefore", "checkerBoardBefore"),
+            ("Checker board after", "checkerBoardAfter", "checkerBoardAfter"),
+        ]
+
+    def show(self):
+        """Fixed, moving and comparison images; volumes by their middle slice."""
+        import matplotlib.pyplot as plt
+
+        fig, ax = plt.subplots(2, 2, figsize=(6, 6))
+        ax[0][0].imshow(_middle_slice(self.fixedImage), cmap="gray")
+        ax[0][0].set_title("Fixed image")
+        ax[0][1].imshow(_middle_slice(self.movingImage), cmap="gray")
+        ax[0][1].set_title("Moving image")
+
+        for i, (title, _, attribute) in enumerate(self._views()):
+            ax[1][i].imshow(_middle_slice(getattr(self, attribute)), cmap="gray")
+            ax[1][i].set_title(title)
+
+        plt.tight_layout()
+        plt.show()
+
+    def export(self, exportDir, format=None):
+        """Write the transformed image and the comparison images.
+
+        2D results are written as PNG and volumes as MHA on the fixed image
+        grid, unless ``format`` is another of ``"png"``, ``"mha"``, ``"nrrd"``
+        and ``"zarr"``. Inside a ``with WriterPool()`` block the images are
+        queued for the pool's threads.
+        """
+        os.makedirs(exportDir, exist_ok=True)
+        transformedName = (
+            "transformed_img" if self.kind == "unimodal" else "outputImageFile"
+        )
+        images = [(transformedName, "transformedImage")]
+        images += [(name, attribute) for _, name, attribute in self._views()]
+        geometry = geometry_of(self.fixedImage)
+        for name, attribute in images:
+            array = getattr(self, attribute)
+            imageFormat = format or ("png" if array.ndim == 2 else "mha")
+            path = os.path.join(exportDir, "%s.%s" % (name, imageFormat))
+            save(array, path, geometry, imageFormat)
+
+
+def _middle_slice(image):
+    # volumes are shown by their central slice along the slowest axis
+    array = itk.array_view_from_image(image) if hasattr(image, "GetSpacing") else image
+    while array.ndim > 2:
+        array = array[array.shape[0] // 2]
+    return array
+
+
+def _to_list(parameters):
+    # the parameter arrays returned by ITK reference memory owned by the
+    # registration objects, copy them before those go out of scope
+    return [parameters.GetElement(i) for i in range(parameters.GetSize())]
+
+
+def _to_parameters(values):
+    parameters = itk.OptimizerParameters[itk.D](len(values))
+    for i, value in enumerate(values):
+        parameters.SetElement(i, value)
+    return parameters
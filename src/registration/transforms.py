@@ -0,0 +1,109 @@
+"""Transforms the registration cores can optimize.
+
+``"translation"`` is the ``TranslationTransform`` both examples started
+with. ``"euler"`` (rotation and translation, ``Euler2DTransform`` or
+``Euler3DTransform``), ``"similarity"`` (plus an isotropic scale) and
+``"affine"`` rotate and scale about the centre of the fixed image, and start
+with the translation that maps that centre onto the centre of the moving
+image, as ``CenteredTransformInitializer`` does in geometry mode.
+
+Their parameters mix angles, scale factors and millimetres, so a unit step
+means very different physical motions. The v4 engines estimate the
+optimizer scales with ``RegistrationParameterScalesFromPhysicalShift``; the
+legacy engine gets the same kind of scales from ``physical_shift_scales``.
+"""
+
+import itertools
+
+import itk
+import numpy as np
+
+TRANSFORMS = ("translation", "euler", "similarity", "affine")
+
+# class name per transform and image dimension, for the fixed-dimension ones
+_CLASSES = {
+    "euler": {2: "Euler2DTransform", 3: "Euler3DTransform"},
+    "similarity": {2: "Similarity2DTransform", 3: "Similarity3DTransform"},
+}
+
+# parameter change used to measure the physical shift, as ITK's estimator
+_SMALL_PARAMETER_VARIATION = 0.01
+
+
+def transform_type(name, Dimension):
+    if name == "translation":
+        return itk.TranslationTransform[itk.D, Dimension]
+    if name == "affine":
+        return itk.AffineTransform[itk.D, Dimension]
+    if name not in _CLASSES:
+        raise ValueError(
+            "Unknown transform '%s', expected one of %s" % (name, ", ".join(TRANSFORMS))
+        )
+    if Dimension not in _CLASSES[name]:
+        raise ValueError("No %s transform for %dD images" % (name, Dimension))
+    return getattr(itk, _CLASSES[name][Dimension])[itk.D]
+
+
+def _center(image):
+    # physical point of the continuous index at the middle of the grid
+    size = np.array(image.GetLargestPossibleRegion().GetSize(), dtype=float)
+    direction = itk.array_from_matrix(image.GetDirection())
+    offset = np.array(image.GetSpacing()) * (size - 1) / 2.0
+    return [float(c) for c in np.array(image.GetOrigin()) + direction @ offset]
+
+
+def initial_transform(name, fixedImage, movingImage):
+    """Identity ``name`` transform, centred as described in the module docstring."""
+    transform = transform_type(name, fixedImage.GetImageDimension()).New()
+    transform.SetIdentity()
+    if name != "translation":
+        fixedCenter = _center(fixedImage)
+        movingCenter = _center(movingImage)
+        transform.SetCenter(fixedCenter)
+        transform.SetTranslation(
+            [movingCenter[axis] - fixedCenter[axis] for axis in range(len(fixedCenter))]
+        )
+    return transform
+
+
+def physical_shift_scales(transform, image):
+    """Optimizer scales from the physical shift of each parameter.
+
+    Each parameter is changed by a small amount, one at a time, and its scale
+    is the squared largest shift that causes among the corners of ``image``,
+    per unit of the parameter. A translation parameter therefore gets 1 and
+    an angle the squared distance from the centre to the farthest corner.
+    """
+    size = image.GetLargestPossibleRegion().GetSize()
+    Dimension = image.GetImageDimension()
+    corners = [
+        image.TransformIndexToPhysicalPoint([int(c) for c in corner])
+        for corner in itertools.product(
+            *[(0, size[axis] - 1) for axis in range(Dimension)]
+        )
+    ]
+    parameters = transform.GetParameters()
+    original = [parameters.GetElement(i) for i in range(parameters.GetSize())]
+    before = [transform.TransformPoint(corner) for corner in corners]
+
+    scales = _parameters([0.0] * len(original))
+    for i in range(len(original)):
+        varied = list(original)
+        varied[i] += _SMALL_PARAMETER_VARIATION
+        transform.SetParameters(_parameters(varied))
+        shift = max(
+            sum((a[axis] - b[axis]) ** 2 for axis in range(Dimension)) ** 0.5
+            for a, b in zip(
+                (transform.TransformPoint(corner) for corner in corners), before
+            )
+        )
+        scales.SetElement(i, (shift / _SMALL_PARAMETER_VARIATION) ** 2)
+    transform.SetParameters(_parameters(original))
+    return scales
+
+
+def _parameters(values):
+    parameters = itk.OptimizerParameters[itk.D](len(values))
+    for i, value in enumerate(values):
+        parameters.SetElement(i, value)
+    return parameters
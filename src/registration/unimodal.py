@@ -1,32 +1,66 @@
-import itk
-import matplotlib.pyplot as plt
-from PIL import Image
-import os
+import time
 
+import itk
 
-def register_unimodal(fixedImageFile, movingImageFile, exportDir=None):
+from ..caching import cached
+from ..jobs.cancellation import raise_if_cancelled, watch
+from ..profiling import instrument, span
+from .convergence import ConvergenceMonitor
+from .prepared import PreparedFixedImage, _read_fixed
+from .pyramid import apply_schedule, resolve_schedule
+from .result import RegistrationResult, _to_list
+from .transforms import initial_transform
+
+
+@cached
+def _register_unimodal(
+    fixedImage,
+    movingImage,
+    numberOfIterations=200,
+    multiResolution=False,
+    shrinkFactors=None,
+    smoothingSigmas=None,
+    iterationsPerLevel=None,
+    convergenceWindow=None,
+    convergenceTolerance=1e-4,
+    convergenceParameterTolerance=None,
+    transform="translation",
+):
     PixelType = itk.ctype("float")
 
-    fixedImage = itk.imread(fixedImageFile, PixelType)
-    movingImage = itk.imread(movingImageFile, PixelType)
+    # the v4 mean squares metric takes its gradient from the moving image, so
+    # a prepared fixed image only saves reading it
+    if isinstance(fixedImage, PreparedFixedImage):
+        fixedImage = fixedImage.image
 
     Dimension = fixedImage.GetImageDimension()
     FixedImageType = itk.Image[PixelType, Dimension]
     MovingImageType = itk.Image[PixelType, Dimension]
 
     TransformType = itk.TranslationTransform[itk.D, Dimension]
-    initialTransform = TransformType.New()
+    initialTransform = initial_transform(transform, fixedImage, movingImage)
 
     optimizer = itk.RegularStepGradientDescentOptimizerv4.New(
         LearningRate=4,
         MinimumStepLength=0.001,
         RelaxationFactor=0.5,
-        NumberOfIterations=200,
+        NumberOfIterations=numberOfIterations,
     )
 
     metric = itk.MeanSquaresImageToImageMetricv4[FixedImageType, MovingImageType].New()
 
-    registration = itk.ImageRegistrationMethodv4.New(
+    if transform != "translation":
+        # one step has to move angles, scale factors and millimetres alike
+        scalesEstimator = itk.RegistrationParameterScalesFromPhysicalShift[
+            type(metric)
+        ].New()
+        scalesEstimator.SetMetric(metric)
+        optimizer.SetScalesEstimator(scalesEstimator)
+        # rotation and translation pull against each other in the first
+        # iterations; halving the step at every turn stalls far from the optimum
+        optimizer.SetRelaxationFactor(0.8)
+
+    registration = itk.ImageRegistrationMethodv4[FixedImageType, MovingImageType].New(
         FixedImage=fixedImage,
         MovingImage=movingImage,
         Metric=metric,
@@ -36,8 +70,8 @@ def register_unimodal(fixedImageFile, movingImageFile, exportDir=None):
 
     movingInitialTransform = TransformType.New()
     initialParameters = movingInitialTransform.GetParameters()
-    initialParameters[0] = 0
-    initialParameters[1] = 0
+    for axis in range(Dimension):
+        initialParameters[axis] = 0
     movingInitialTransform.SetParameters(initialParameters)
     registration.SetMovingInitialTransform(movingInitialTransform)
 
@@ -45,86 +79,121 @@ def register_unimodal(fixedImageFile, movingImageFile, exportDir=None):
     identityTransform.SetIdentity()
     registration.SetFixedInitialTransform(identityTransform)
 
-    registration.SetNumberOfLevels(1)
-    registration.SetSmoothingSigmasPerLevel([0])
-    registration.SetShrinkFactorsPerLevel([1])
+    if multiResolution or shrinkFactors is not None:
+        size = list(fixedImage.GetLargestPossibleRegion().GetSize())
+        schedule = resolve_schedule(
+            size,
+            shrinkFactors,
+            smoothingSigmas,
+            iterationsPerLevel,
+            numberOfIterations,
+        )
+        apply_schedule(registration, optimizer, *schedule)
+    else:
+        registration.SetNumberOfLevels(1)
+        registration.SetSmoothingSigmasPerLevel([0])
+        registration.SetShrinkFactorsPerLevel([1])
+
+    # the optimizer restarts at every level, so GetCurrentIteration() alone
+    # only covers the finest one; the monitor counts across levels
+    monitor = ConvergenceMonitor(
+        optimizer,
+        registration,
+        convergenceWindow,
+        convergenceTolerance,
+        convergenceParameterTolerance,
+    )
 
+    instrument(registration, category="registration")
+    instrument(optimizer, category="registration")
+    watch(registration)
+    watch(optimizer)
+    start = time.perf_counter()
     registration.Update()
-
-    transform = registration.GetTransform()
-    finalParameters = transform.GetParameters()
-    translationAlongX = finalParameters.GetElement(0)
-    translationAlongY = finalParameters.GetElement(1)
-
-    numberOfIterations = optimizer.GetCurrentIteration()
-
-    bestValue = optimizer.GetValue()
-
-    print("Result = ")
-    print(" Translation X = " + str(translationAlongX))
-    print(" Translation Y = " + str(translationAlongY))
-    print(" Iterations    = " + str(numberOfIterations))
-    print(" Metric value  = " + str(bestValue))
-
-    CompositeTransformType = itk.CompositeTransform[itk.D, Dimension]
-    outputCompositeTransform = CompositeTransformType.New()
-    outputCompositeTransform.AddTransform(movingInitialTransform)
-    outputCompositeTransform.AddTransform(registration.GetModifiableTransform())
-
-    resampler = itk.ResampleImageFilter.New(
-        Input=movingImage,
-        Transform=outputCompositeTransform,
-        UseReferenceImage=True,
-        ReferenceImage=fixedImage,
+    seconds = time.perf_counter() - start
+    # a cancelled optimization returns early, never hand it to the cache
+    raise_if_cancelled()
+
+    return RegistrationResult(
+        "unimodal",
+        fixedImage,
+        movingImage,
+        _to_list(registration.GetTransform().GetParameters()),
+        _to_list(registration.GetTransform().GetFixedParameters()),
+        monitor.iterations,
+        optimizer.GetValue(),
+        monitor.GetStopConditionDescription(optimizer.GetStopConditionDescription()),
+        {"registration": seconds},
+        history=monitor.history,
+        transform=transform,
     )
-    resampler.SetDefaultPixelValue(100)
 
-    OutputPixelType = itk.ctype("unsigned char")
-    OutputImageType = itk.Image[OutputPixelType, Dimension]
 
-    caster = itk.CastImageFilter[FixedImageType, OutputImageType].New(Input=resampler)
-    transformed_img = caster.GetOutput().__array__().copy()
-
-    difference = itk.SubtractImageFilter.New(Input1=fixedImage, Input2=resampler)
+def register_unimodal(
+    fixedImageFile,
+    movingImageFile,
+    exportDir=None,
+    numberOfIterations=200,
+    multiResolution=False,
+    shrinkFactors=None,
+    smoothingSigmas=None,
+    iterationsPerLevel=None,
+    convergenceWindow=None,
+    convergenceTolerance=1e-4,
+    convergenceParameterTolerance=None,
+    transform="translation",
+):
+    """Mean squares registration, of a translation unless ``transform`` says otherwise.
+
+    Returns a ``RegistrationResult``; ``print(result)`` gives the summary and
+    ``result.show()`` the fixed/moving/difference figure. The resampled and
+    difference images are only computed when accessed, or when ``exportDir``
+    asks for them to be written.
+
+    By default all iterations run at full resolution. ``multiResolution=True``
+    switches to a coarse-to-fine pyramid whose levels are chosen from the image
+    size (see ``pyramid.auto_schedule``); ``shrinkFactors``, ``smoothingSigmas``
+    (in pixels) and ``iterationsPerLevel`` override parts of that schedule and
+    are given coarsest level first.
+
+    Every iteration is recorded in ``result.history``. With a
+    ``convergenceWindow`` of N iterations, each level stops as soon as the
+    metric trend over its last N iterations changes it by less than
+    ``convergenceTolerance`` (relative) and, when given, the parameters by
+    less than ``convergenceParameterTolerance`` (see ``ConvergenceMonitor``).
+
+    ``transform`` is one of ``transforms.TRANSFORMS``: ``"euler"``,
+    ``"similarity"`` and ``"affine"`` also rotate (and scale) about the
+    centre of the fixed image, with optimizer scales estimated from the
+    physical shift of each parameter. ``result.GetResampler()`` applies the
+    final transform to further images, e.g. the other channels of a study.
+
+    ``fixedImageFile`` may also be a ``PreparedFixedImage``.
+    """
+    PixelType = itk.ctype("float")
 
-    intensityRescaler = itk.RescaleIntensityImageFilter[
-        FixedImageType, OutputImageType
-    ].New(
-        Input=difference,
-        OutputMinimum=itk.NumericTraits[OutputPixelType].min(),
-        OutputMaximum=itk.NumericTraits[OutputPixelType].max(),
+    start = time.perf_counter()
+    with span("read"):
+        fixedImage = _read_fixed(fixedImageFile, PixelType)
+        movingImage = itk.imread(movingImageFile, PixelType)
+    read = time.perf_counter() - start
+
+    result = _register_unimodal(
+        fixedImage,
+        movingImage,
+        numberOfIterations,
+        multiResolution,
+        shrinkFactors,
+        smoothingSigmas,
+        iterationsPerLevel,
+        convergenceWindow,
+        convergenceTolerance,
+        convergenceParameterTolerance,
+        transform,
     )
-
-    resampler.SetDefaultPixelValue(1)
-    difference_after = intensityRescaler.GetOutput().__array__().copy()
-
-    resampler.SetTransform(identityTransform)
-    difference_before = intensityRescaler.GetOutput().__array__().copy()
-
-    fig, ax = plt.subplots(2, 2, figsize=(6, 6))
-
-    ax[0][0].imshow(fixedImage, cmap="gray")
-    ax[0][0].set_title("Fixed image")
-    ax[0][1].imshow(movingImage, cmap="gray")
-    ax[0][1].set_title("Moving image")
-
-    ax[1][0].imshow(difference_after, cmap="gray")
-    ax[1][0].set_title("Difference after")
-    ax[1][1].imshow(difference_before, cmap="gray")
-    ax[1][1].set_title("Difference before")
-
-    plt.tight_layout()
-    plt.show()
+    result.timings["read"] = read
 
     if exportDir is not None:
-        os.makedirs(exportDir, exist_ok=True)
-        transformed_img_path = os.path.join(exportDir, "transformed_img.png")
-        difference_after_path = os.path.join(exportDir, "difference_after.png")
-        difference_before_path = os.path.join(exportDir, "difference_before.png")
-
-        transformed_img = Image.fromarray(transformed_img)
-        transformed_img.save(transformed_img_path)
-        difference_after = Image.fromarray(difference_after)
-        difference_after.save(difference_after_path)
-        difference_before = Image.fromarray(difference_before)
-        difference_before.save(difference_before_path)
+        result.export(exportDir)
+
+    return result
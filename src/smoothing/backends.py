@@ -0,0 +1,242 @@
+"""Per-call choice between the ITK pipelines and the NumPy backend.
+
+The ``*_array`` functions in ``bluring.py`` take ``backend="itk"`` or
+``backend="numpy"`` (``numpy_backend.py``, identical outputs). With the
+default ``backend=None`` the faster one is picked from a calibration of this
+machine, made once with
+
+    python -m src.smoothing.backends [--sizes 32 64 128 256 512 1024]
+
+which times both backends on 8-bit images per filter, image size and kernel
+size, and saves the timings to ``$ITK_EXPLORE_BACKENDS`` or
+``~/.cache/itk-explore/backends.json``. A call uses the winner of the
+calibrated case nearest to its pixel count and parameter (on a log scale).
+Without a calibration, or with one made under other ITK, NumPy or SciPy
+versions, every call runs on ITK as before.
+"""
+
+import argparse
+import json
+import math
+import os
+import tempfile
+import time
+
+import itk
+import numpy as np
+
+BACKENDS = ("itk", "numpy")
+
+# bump when the saved layout changes
+FORMAT_VERSION = 1
+
+# filter -> values of its one parameter timed by default
+PARAMETERS = {
+    "binomial": (1, 4, 16),
+    "discrete_gaussian": (1.0, 4.0, 16.0),
+    "recursive_gaussian_iir": (1.0, 4.0),
+    "median": (1, 2, 4),
+}
+
+SIZES = (32, 64, 128, 256, 512, 1024)
+
+# stop repeating a timing once its runs took this long
+_BUDGET_SECONDS = 0.25
+
+_calibration = {}
+
+
+def calibration_path():
+    return os.path.expanduser(
+        os.environ.get(
+            "ITK_EXPLORE_BACKENDS",
+            os.path.join("~", ".cache", "itk-explore", "backends.json"),
+        )
+    )
+
+
+def _versions():
+    # the NumPy median runs on SciPy when it is installed
+    try:
+        import scipy
+    except ImportError:
+        scipy = None
+    return {
+        "itk": itk.Version.GetITKVersion(),
+        "numpy": np.__version__,
+        "scipy": None if scipy is None else scipy.__version__,
+    }
+
+
+def load_calibration(path=None):
+    """The saved calibration, or ``None`` if missing or made elsewhere."""
+    path = calibration_path() if path is None else path
+    if path not in _calibration:
+        try:
+            with open(path) as f:
+                calibration = json.load(f)
+        except (OSError, ValueError):
+            calibration = None
+        if calibration is not None and (
+            calibration.get("format") != FORMAT_VERSION
+            or calibration.get("versions") != _versions()
+        ):
+            calibration = None
+        _calibration[path] = calibration
+    return _calibration[path]
+
+
+def _number_of_pixels(image):
+    if isinstance(image, np.ndarray):
+        return image.size
+    return math.prod(image.GetLargestPossibleRegion().GetSize())
+
+
+def select_backend(filterName, image, parameter, backend=None):
+    """``"itk"`` or ``"numpy"`` for filtering ``image`` with ``parameter``.
+
+    ``backend`` forces a choice. Filters without a NumPy implementation,
+    images whose dimension was not calibrated and per-axis parameters (the
+    calibration times one value for every axis) use ITK.
+    """
+    if backend is not None:
+        if backend not in BACKENDS:
+            raise ValueError(
+                "Unknown backend '%s', expected one of %s"
+                % (backend, ", ".join(BACKENDS))
+            )
+        return backend
+    if np.ndim(parameter) != 0:
+        return "itk"
+    calibration = load_calibration()
+    if calibration is None:
+        return "itk"
+    dimension = (
+        image.ndim if isinstance(image, np.ndarray) else image.GetImageDimension()
+    )
+    cases = [
+        case
+        for case in calibration["timings"].get(filterName, [])
+        if case["dimension"] == dimension
+    ]
+    if not cases:
+        return "itk"
+    pixels = math.log2(max(1, _number_of_pixels(image)))
+    kernel = math.log2(1 + parameter)
+
+    def distance(case):
+        return (math.log2(case["pixels"]) - pixels) ** 2 + (
+            math.log2(1 + case["parameter"]) - kernel
+        ) ** 2
+
+    nearest = min(cases, key=distance)
+    return "numpy" if nearest["numpy"] < nearest["itk"] else "itk"
+
+
+def _time(function, *args):
+    best = math.inf
+    total = 0.0
+    for _ in range(5):
+        start = time.perf_counter()
+        function(*args)
+        seconds = time.perf_counter() - start
+        best = min(best, seconds)
+        total += seconds
+        if total > _BUDGET_SECONDS:
+            break
+    return best
+
+
+def calibrate(sizes=SIZES, parameters=None, path=None, seed=0):
+    """Time both backends on square 8-bit images and save the result.
+
+    ``parameters`` maps filter names to the parameter values to time and
+    defaults to ``PARAMETERS``. Returns the calibration, which
+    ``select_backend`` uses from then on.
+    """
+    from . import bluring
+
+    path = calibration_path() if path is None else path
+    parameters = PARAMETERS if parameters is None else parameters
+    functions = {
+        "binomial": bluring.binomial_array,
+        "discrete_gaussian": bluring.discrete_gaussian_array,
+        "recursive_gaussian_iir": bluring.recursive_gaussian_iir_array,
+        "median": bluring.median_array,
+    }
+    rng = np.random.default_rng(seed)
+    timings = {}
+    for filterName, values in parameters.items():
+        # the undecorated function, so the result cache never answers
+        function = functions[filterName].__wrapped__
+        cases = timings[filterName] = []
+        for size in sizes:
+            image = rng.integers(0, 256, (size, size), dtype=np.uint8)
+            for value in values:
+                # not timed: the first call loads ITK's wrappers or SciPy
+                for backend in BACKENDS:
+                    function(image, value, backend=backend)
+                cases.append(
+                    {
+                        "dimension": 2,
+                        "pixels": size * size,
+                        "parameter": value,
+                        **{
+                            backend: _time(function, image, value, None, backend)
+                            for backend in BACKENDS
+                        },
+                    }
+                )
+
+    calibration = {
+        "format": FORMAT_VERSION,
+        "versions": _versions(),
+        "cpus": os.cpu_count(),
+        "timings": timings,
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # written aside and renamed, so concurrent readers never see half a file
+    fd, temporary = tempfile.mkstemp(dir=directory or ".", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(calibration, f, indent=2)
+    os.replace(temporary, path)
+    _calibration[path] = calibration
+    return calibration
+
+
+def format_calibration(calibration):
+    lines = [
+        "%-24s %9s %10s %11s %11s %7s"
+        % ("filter", "pixels", "parameter", "itk s", "numpy s", "winner")
+    ]
+    for filterName, cases in calibration["timings"].items():
+        for case in cases:
+            lines.append(
+                "%-24s %9d %10g %11.5f %11.5f %7s"
+                % (
+                    filterName,
+                    case["pixels"],
+                    case["parameter"],
+                    case["itk"],
+                    case["numpy"],
+                    "numpy" if case["numpy"] < case["itk"] else "itk",
+                )
+            )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate the smoothing backends")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--output", default=None, help="calibration JSON path")
+    args = parser.parse_args(argv)
+
+    calibration = calibrate(args.sizes, path=args.output)
+    print(format_calibration(calibration))
+    print("saved to %s" % (calibration_path() if args.output is None else args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+"""Headless batch smoothing.
+
+Runs one of the smoothing filters over many images in a process pool and
+writes the outputs together with a per-file timing summary. Every worker
+builds the filter pipeline once and reuses it for all of its files, and
+hands the outputs to a background ``WriterPool`` so that encoding one file
+overlaps filtering the next. Unless given, the number of workers and of ITK
+threads per worker are planned from the image size and the filter (see
+``src/jobs/threads.py``). Nothing in this module imports matplotlib, so it
+is safe to use on render nodes.
+
+Example:
+
+    python -m src.smoothing.batch "assets/*.png" --filter "median:radius=3" \\
+        --output-dir exports/batch --workers 8
+"""
+
+import argparse
+import ast
+import glob
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import itk
+import numpy as np
+
+from ..export import WriterPool
+from ..jobs.threads import itk_threads, plan_workers, set_itk_threads
+from . import pipelines
+from .bluring import _export
+from .streaming import stream_smooth
+
+FILTERS = pipelines.PIPELINES
+
+# required parameters per filter; the remaining ones are optional
+REQUIRED = {
+    "binomial": ["number_of_repetitions"],
+    "discrete_gaussian": ["variance"],
+    "recursive_gaussian_iir": ["sigma"],
+    "median": ["radius"],
+    "grad_anisotropic_diffusion": ["numberOfIterations"],
+    "curve_anisotropic_diffusion": ["numberOfIterations"],
+}
+
+# pipelines built by this (worker) process, reused across files
+_pipelines = {}
+
+# volumes keep their format; everything else is written as PNG
+VOLUME_EXTENSIONS = (".mha", ".mhd", ".nrrd", ".nhdr", ".nii", ".nii.gz")
+
+# formats an output can be asked for instead
+OUTPUT_FORMATS = ("png", "mha", "nrrd", "zarr")
+
+# files a worker takes at a time; their writes are awaited before it
+# returns their records
+SHARD_FILES = 8
+
+# inputs whose header is read to plan the workers
+PLAN_SAMPLES = 8
+
+
+def _parse_value(value):
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+def parse_filter_spec(spec):
+    """Parse ``"name:key=value,key=value"`` into ``(name, params)``."""
+    name, _, args = spec.partition(":")
+    name = name.strip()
+    if name not in FILTERS:
+        raise ValueError(
+            "Unknown filter '%s', expected one of %s" % (name, sorted(FILTERS))
+        )
+
+    params = {}
+    for arg in filter(None, (a.strip() for a in args.split(","))):
+        key, sep, value = arg.partition("=")
+        if not sep:
+            raise ValueError("Malformed filter argument '%s'" % arg)
+        params[key.strip()] = _parse_value(value.strip())
+
+    expected = sorted(FILTERS[name].Parameters)
+    unknown = set(params) - set(expected)
+    missing = set(REQUIRED[name]) - set(params)
+    if unknown or missing:
+        raise ValueError(
+            "Filter '%s' takes parameters %s (required: %s), got %s"
+            % (name, expected, REQUIRED[name], sorted(params))
+        )
+    return name, params
+
+
+def _get_pipeline(filter_name, dimension=2, PixelType=None):
+    # filters take ITK's default number of threads when they are created
+    threads = itk.MultiThreaderBase.GetGlobalDefaultNumberOfThreads()
+    key = (filter_name, dimension, PixelType, threads)
+    if key not in _pipelines:
+        _pipelines[key] = FILTERS[filter_name](dimension, PixelType)
+    return _pipelines[key]
+
+
+def collect_inputs(patterns=(), manifest=None):
+    """Expand glob patterns and/or a manifest file (one path per line)."""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        paths.extend(matches if matches else [pattern])
+    if manifest is not None:
+        with open(manifest) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    paths.append(line)
+    return paths
+
+
+def output_path_for(input_path, output_dir, filter_name, format=None):
+    # follows the naming used under exports/bluring, e.g. brain-noise[median].png
+    name = os.path.basename(input_path)
+    stem, _ = os.path.splitext(name)
+    extension = ".png"
+    for volumeExtension in VOLUME_EXTENSIONS:
+        if name.lower().endswith(volumeExtension):
+            stem = name[: -len(volumeExtension)]
+            extension = volumeExtension
+            break
+    if format is not None:
+        extension = "." + format
+    return os.path.join(output_dir, "%s[%s]%s" % (stem, filter_name, extension))
+
+
+def plan_batch(
+    input_paths, filter_name, params, workers=None, threads=None, memoryBudget=None
+):
+    """``(workers, threads)`` for ``batch_smooth``, see ``jobs.plan_workers``.
+
+    The image size is the median of up to ``PLAN_SAMPLES`` inputs spread
+    over the list; unreadable ones are left out. With a ``memoryBudget`` a
+    worker holds that many bytes whatever the image size.
+    """
+    step = max(1, len(input_paths) // PLAN_SAMPLES)
+    sizes = []
+    dimension = 2
+    for path in input_paths[::step][:PLAN_SAMPLES]:
+        try:
+            information = pipelines.read_image_information(path)
+        except Exception:
+            continue
+        dimension = information["dimension"]
+        sizes.append(int(np.prod(information["size"])))
+    pixels = int(np.median(sizes)) if sizes else 0
+    options = {}
+    if memoryBudget is not None and pixels:
+        options["bytesPerPixel"] = memoryBudget / pixels
+    return plan_workers(
+        len(input_paths),
+        pixels,
+        FILTERS[filter_name].GetWorkPerPixel(dimension, **params),
+        workers=workers,
+        threads=threads,
+        **options,
+    )
+
+
+def _process_one(
+    input_path, output_path, filter_name, params, memoryBudget=None, precision="float"
+):
+    start = time.perf_counter()
+    if memoryBudget is not None:
+        return _stream_one(
+            input_path, output_path, filter_name, params, memoryBudget, precision
+        )
+    try:
+        information = pipelines.read_image_information(input_path)
+        pipeline = _get_pipeline(
+            filter_name,
+            information["dimension"],
+            FILTERS[filter_name].GetPixelType(precision, information["pixel_type"]),
+        )
+        pipeline.SetFileName(input_path)
+        pipeline.SetParameters(**params)
+        pipeline.Update()
+        out = itk.array_view_from_image(pipeline.GetOutput())
+        compute = time.perf_counter() - start
+        written = _export(out, output_path, input_path)
+    except Exception as err:
+        return {
+            "input": input_path,
+            "output": None,
+            "error": "%s: %s" % (type(err).__name__, err),
+            "seconds": time.perf_counter() - start,
+        }
+    seconds = time.perf_counter() - start
+    megapixels = out.size / 1e6
+    record = {
+        "input": input_path,
+        "output": output_path,
+        "error": None,
+        "shape": list(out.shape),
+        "compute_seconds": compute,
+        "seconds": seconds,
+        "megapixels": megapixels,
+        "megapixels_per_second": megapixels / seconds if seconds > 0 else None,
+        # the write's future inside a WriterPool, resolved by _process_shard
+        "write": written,
+    }
+    if hasattr(pipeline, "GetConvergence"):
+        # the diffusion filters: iterations run and saved by their tolerance
+        record["convergence"] = pipeline.GetConvergence()
+    return record
+
+
+def _process_shard(
+    input_paths, output_paths, filter_name, params, memoryBudget, precision, writers
+):
+    if not writers:
+        records = [
+            _process_one(i, o, filter_name, params, memoryBudget, precision)
+            for i, o in zip(input_paths, output_paths)
+        ]
+    else:
+        with WriterPool(writers) as pool:
+            records = [
+                _process_one(i, o, filter_name, params, memoryBudget, precision)
+                for i, o in zip(input_paths, output_paths)
+            ]
+            pool.wait(raiseErrors=False)
+    for record in records:
+        written = record.pop("write", None)
+        if written is None:
+            continue
+        error = written.exception()
+        if error is None:
+            record["write_seconds"] = written.result()
+        else:
+            record["output"] = None
+            record["error"] = "%s: %s" % (type(error).__name__, error)
+    return records
+
+
+def _stream_one(input_path, output_path, filter_name, params, memoryBudget, precision):
+    start = time.perf_counter()
+    try:
+        summary = stream_smooth(
+            input_path,
+            filter_name,
+            params,
+            output_path,
+            memoryBudget=memoryBudget,
+            precision=precision,
+        )
+    except Exception as err:
+        return {
+            "input": input_path,
+            "output": None,
+            "error": "%s: %s" % (type(err).__name__, err),
+            "seconds": time.perf_counter() - start,
+        }
+    seconds = time.perf_counter() - start
+    megapixels = float(np.prod(summary["shape"])) / 1e6
+    return {
+        "input": input_path,
+        "output": output_path,
+        "error": None,
+        "shape": summary["shape"],
+        "tiles": summary["tiles"],
+        "compute_seconds": summary["seconds"],
+        "seconds": seconds,
+        "megapixels": megapixels,
+        "megapixels_per_second": megapixels / seconds if seconds > 0 else None,
+    }
+
+
+def batch_smooth(
+    input_paths,
+    filter_name,
+    params,
+    output_dir,
+    workers=None,
+    summary_path=None,
+    memoryBudget=None,
+    precision="float",
+    format=None,
+    writers=1,
+    threads=None,
+):
+    """Apply one filter to every input path using a pool of ``workers`` processes.
+
+    ``workers`` and ``threads`` (ITK threads per worker) are planned by
+    ``plan_batch`` where they are not given.
+
+    With ``memoryBudget`` (bytes per worker) every image is processed tile by
+    tile through ``streaming.stream_smooth``. ``precision="native"`` keeps
+    8 and 16 bit inputs in their own type where the filter allows it (see
+    ``pipelines.py``). ``format`` (one of ``OUTPUT_FORMATS``) replaces the
+    outputs' default PNG or volume extension.
+
+    Each worker writes its outputs in ``writers`` background threads, or
+    itself with ``writers=0``. A record's ``seconds`` then stop once its
+    output is queued, and ``write_seconds`` is the time the write took.
+
+    Returns the summary dictionary, which is also written as JSON to
+    ``summary_path`` (default ``<output_dir>/summary.json``).
+    """
+    if filter_name not in FILTERS:
+        raise ValueError("Unknown filter '%s'" % filter_name)
+    if format is not None and format not in OUTPUT_FORMATS:
+        raise ValueError(
+            "Unknown format '%s', expected one of %s"
+            % (format, ", ".join(OUTPUT_FORMATS))
+        )
+    os.makedirs(output_dir, exist_ok=True)
+    workers, threads = plan_batch(
+        input_paths, filter_name, params, workers, threads, memoryBudget
+    )
+
+    outputs = [output_path_for(p, output_dir, filter_name, format) for p in input_paths]
+    start = time.perf_counter()
+    if workers == 1:
+        with itk_threads(threads):
+            records = _process_shard(
+                input_paths,
+                outputs,
+                filter_name,
+                params,
+                memoryBudget,
+                precision,
+                writers,
+            )
+    else:
+        size = max(1, min(SHARD_FILES, math.ceil(len(input_paths) / workers)))
+        shards = range(0, len(input_paths), size)
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=set_itk_threads, initargs=(threads,)
+        ) as executor:
+            records = [
+                record
+                for shard in executor.map(
+                    _process_shard,
+                    [input_paths[i : i + size] for i in shards],
+                    [outputs[i : i + size] for i in shards],
+                    [filter_name] * len(shards),
+                    [params] * len(shards),
+                    [memoryBudget] * len(shards),
+                    [precision] * len(shards),
+                    [writers] * len(shards),
+                )
+                for record in shard
+            ]
+    wall = time.perf_counter() - start
+
+    succeeded = [r for r in records if r["error"] is None]
+    megapixels = sum(r["megapixels"] for r in succeeded)
+    converged = [r["convergence"] for r in succeeded if "convergence" in r]
+    summary = {
+        "filter": filter_name,
+        "params": params,
+        "workers": workers,
+        "threads": threads,
+        "memory_budget": memoryBudget,
+        "precision": precision,
+        "format": format,
+        "writers": writers,
+        "files": len(records),
+        "failed": len(records) - len(succeeded),
+        "wall_seconds": wall,
+        "files_per_second": len(succeeded) / wall if wall > 0 else None,
+        "megapixels": megapixels,
+        "megapixels_per_second": megapixels / wall if wall > 0 else None,
+        "iterations_saved": (
+            sum(c["iterations_saved"] for c in converged) if converged else None
+        ),
+        "results": records,
+    }
+
+    if summary_path is None:
+        summary_path = os.path.join(output_dir, "summary.json")
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="*", help="input paths or glob patterns")
+    parser.add_argument("--manifest", help="text file with one input path per line")
+    parser.add_argument(
+        "--filter",
+        required=True,
+        help="filter spec, e.g. 'median:radius=3' or 'discrete_gaussian:variance=3'",
+    )
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--threads", type=int, default=None, help="ITK threads per worker"
+    )
+    parser.add_argument("--summary", default=None, help="summary JSON path")
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        default=None,
+        help="process each image in tiles within this many MiB per worker",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=pipelines.PRECISIONS,
+        default="float",
+        help="'native' keeps 8/16 bit inputs in their own type (median, binomial)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default=None,
+        help="output format (default: PNG, volumes keep their own)",
+    )
+    parser.add_argument(
+        "--writers",
+        type=int,
+        default=1,
+        help="background writer threads per worker, 0 writes in the worker itself",
+    )
+    args = parser.parse_args(argv)
+
+    input_paths = collect_inputs(args.inputs, args.manifest)
+    if not input_paths:
+        parser.error("no input images given")
+    try:
+        filter_name, params = parse_filter_spec(args.filter)
+    except ValueError as err:
+        parser.error(str(err))
+
+    summary = batch_smooth(
+        input_paths,
+        filter_name,
+        params,
+        args.output_dir,
+        workers=args.workers,
+        summary_path=args.summary,
+        memoryBudget=(
+            None if args.memory_budget is None else int(args.memory_budget * 2**20)
+        ),
+        precision=args.precision,
+        format=args.format,
+        writers=args.writers,
+        threads=args.threads,
+    )
+    print(
+        "%d files (%d failed) in %.2fs with %d workers x %d ITK threads: "
+        "%.2f files/s, %.2f MP/s"
+        % (
+            summary["files"],
+            summary["failed"],
+            summary["wall_seconds"],
+            summary["workers"],
+            summary["threads"],
+            summary["files_per_second"] or 0.0,
+            summary["megapixels_per_second"] or 0.0,
+        )
+    )
+    if summary["iterations_saved"]:
+        print(
+            "the tolerance saved %d of %d diffusion iterations"
+            % (
+                summary["iterations_saved"],
+                sum(
+                    r["convergence"]["maximum_iterations"]
+                    for r in summary["results"]
+                    if "convergence" in r
+                ),
+            )
+        )
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,166 +1,293 @@
 import itk
-import matplotlib.pyplot as plt
-from PIL import Image
+import numpy as np
 import os
 
+from ..caching import cached
+from ..export import format_for, save
+from ..profiling import span
+from . import histogram_median, numpy_backend
+from .backends import select_backend
+from .pipelines import (
+    BinomialFilter,
+    DiscreteGaussianFilter,
+    MedianFilter,
+    NUMPY_TYPES,
+    RecursiveGaussianFilter,
+    pixel_type_of,
+    read_image_information,
+)
+
+
+def _middle_slice(array):
+    # volumes are shown by their central slice along the slowest axis
+    while array.ndim > 2:
+        array = array[array.shape[0] // 2]
+    return array
+
+
+def _show(inp, out):
+    # matplotlib is only needed for the interactive functions, so headless
+    # callers (e.g. the batch engine) never import it.
+    import matplotlib.pyplot as plt
 
-def binomial(input_image_path, number_of_repetitions, output_image_path=None):
-    InputPixelType = itk.F
-    OutputPixelType = itk.UC
-    Dimension = 2
-
-    InputImageType = itk.Image[InputPixelType, Dimension]
-    OutputImageType = itk.Image[OutputPixelType, Dimension]
-
-    reader = itk.ImageFileReader[InputImageType].New()
-    reader.SetFileName(input_image_path)
-
-    binomialFilter = itk.BinomialBlurImageFilter.New(reader)
-    binomialFilter.SetRepetitions(number_of_repetitions)
-
-    rescaler = itk.RescaleIntensityImageFilter[InputImageType, OutputImageType].New()
-    rescaler.SetInput(binomialFilter.GetOutput())
-    rescaler.SetOutputMinimum(0)
-    rescaler.SetOutputMaximum(255)
-
-    rescaler.Update()
-
-    out = rescaler.GetOutput().__array__()
-    inp = reader.GetOutput().__array__()
     fig, ax = plt.subplots(1, 2, figsize=(8, 4))
-    ax[0].imshow(inp, cmap="gray")
+    ax[0].imshow(_middle_slice(inp), cmap="gray")
     ax[0].set_title("Original image")
-    ax[1].imshow(out, cmap="gray")
+    ax[1].imshow(_middle_slice(out), cmap="gray")
     ax[1].set_title("Processed image")
     plt.show()
 
-    if output_image_path is not None:
-        dir, _ = os.path.split(output_image_path)
-        os.makedirs(dir, exist_ok=True)
-        out = Image.fromarray(out)
-        out.save(output_image_path)
+
+def _export(out, output_image_path, input_image_path=None):
+    # the format follows the extension (see src/export); inside a
+    # ``with WriterPool()`` block the write is queued and its future returned
+    if output_image_path is None:
+        return None
+    geometry = None
+    if input_image_path is not None and format_for(output_image_path) != "png":
+        # outputs keep the geometry of the input they were computed from
+        geometry = read_image_information(input_image_path)
+    return save(out, output_image_path, geometry)
+
+
+def _run_pipeline(PipelineType, input_image_path, precision="float", **parameters):
+    information = read_image_information(input_image_path)
+    pipeline = PipelineType(
+        information["dimension"],
+        PipelineType.GetPixelType(precision, information["pixel_type"]),
+    )
+    pipeline.SetFileName(input_image_path)
+    pipeline.SetParameters(**parameters)
+    pipeline.Update()
+    return pipeline
+
+
+def _run(PipelineType, input_image_path, precision="float", **parameters):
+    pipeline = _run_pipeline(PipelineType, input_image_path, precision, **parameters)
+
+    # the pipeline is private to this call, so views are safe to hand out
+    with span("numpy view"):
+        out = itk.array_view_from_image(pipeline.GetOutput())
+        inp = itk.array_view_from_image(pipeline.reader.GetOutput())
+    return inp, out
+
+
+def _image_dimension(image):
+    if isinstance(image, np.ndarray):
+        return image.ndim
+    return image.GetImageDimension()
+
+
+def _set_input(pipeline, image):
+    if isinstance(image, np.ndarray):
+        pipeline.SetInputArray(image)
+    elif type(image) is pipeline.InputImageType:
+        pipeline.SetInput(image)
+    else:
+        pipeline.SetInput(
+            itk.cast_image_filter(image, ttype=(type(image), pipeline.InputImageType))
+        )
+
+
+def _run_image(PipelineType, pipeline, image, precision="float", **parameters):
+    # a pipeline of the image's dimension unless the caller passed one to reuse
+    if pipeline is None:
+        pipeline = PipelineType(
+            _image_dimension(image),
+            PipelineType.GetPixelType(precision, pixel_type_of(image)),
+        )
+    with span("numpy input"):
+        _set_input(pipeline, image)
+    pipeline.SetParameters(**parameters)
+    pipeline.Update()
+
+    # zero-copy view of the rescaled uint8 output; it keeps the output image
+    # alive, but a reused pipeline overwrites it on its next Update()
+    with span("numpy view"):
+        return itk.array_view_from_image(pipeline.GetOutput())
+
+
+def _run_array(
+    PipelineType, filterName, pipeline, image, backend, precision="float", **parameters
+):
+    # a reused pipeline is an ITK pipeline; otherwise the backend the
+    # calibration picks, unless the caller chose one
+    (parameter,) = parameters.values()
+    if (
+        pipeline is None
+        and select_backend(filterName, image, parameter, backend) == "numpy"
+    ):
+        PixelType = PipelineType.GetPixelType(precision, pixel_type_of(image))
+        # the NumPy filters with a native variant take the pipeline's dtype
+        dtype = {}
+        if PixelType is not PipelineType.InputPixelType:
+            dtype["dtype"] = NUMPY_TYPES[PixelType]
+        with span("numpy backend " + filterName):
+            return numpy_backend.FILTERS[filterName](image, parameter, **dtype)
+    if backend == "numpy":
+        raise ValueError("A reused pipeline always runs on the ITK backend")
+    return _run_image(PipelineType, pipeline, image, precision, **parameters)
+
+
+@cached
+def _binomial(input_image_path, number_of_repetitions, precision="float"):
+    return _run(
+        BinomialFilter,
+        input_image_path,
+        precision,
+        number_of_repetitions=number_of_repetitions,
+    )
+
+
+def binomial(
+    input_image_path, number_of_repetitions, output_image_path=None, precision="float"
+):
+    inp, out = _binomial(input_image_path, number_of_repetitions, precision)
+    _show(inp, out)
+    _export(out, output_image_path, input_image_path)
+
+
+@cached
+def binomial_array(
+    image, number_of_repetitions, pipeline=None, backend=None, precision="float"
+):
+    """In-memory binomial: NumPy array or ``itk.Image`` in, uint8 array view out.
+
+    ``backend`` is ``"itk"``, ``"numpy"`` or ``None`` for the faster one on
+    this machine (see ``backends.py``). ``precision="native"`` filters 8 and
+    16 bit inputs in their own type (see ``pipelines.py``).
+    """
+    return _run_array(
+        BinomialFilter,
+        "binomial",
+        pipeline,
+        image,
+        backend,
+        precision,
+        number_of_repetitions=number_of_repetitions,
+    )
+
+
+@cached
+def _discrete_gaussian(input_image_path, variance):
+    return _run(DiscreteGaussianFilter, input_image_path, variance=variance)
 
 
 def discrete_gaussian(input_image_path, variance, output_image_path):
-    InputPixelType = itk.F
-    OutputPixelType = itk.UC
-    Dimension = 2
+    inp, out = _discrete_gaussian(input_image_path, variance)
+    _show(inp, out)
+    _export(out, output_image_path, input_image_path)
 
-    InputImageType = itk.Image[InputPixelType, Dimension]
-    OutputImageType = itk.Image[OutputPixelType, Dimension]
 
-    reader = itk.ImageFileReader[InputImageType].New()
-    reader.SetFileName(input_image_path)
+@cached
+def discrete_gaussian_array(image, variance, pipeline=None, backend=None):
+    """In-memory discrete_gaussian: NumPy array or ``itk.Image`` in, uint8 array view out."""
+    return _run_array(
+        DiscreteGaussianFilter,
+        "discrete_gaussian",
+        pipeline,
+        image,
+        backend,
+        variance=variance,
+    )
 
-    gaussianFilter = itk.DiscreteGaussianImageFilter.New(reader)
-    gaussianFilter.SetVariance(variance)
 
-    rescaler = itk.RescaleIntensityImageFilter[InputImageType, OutputImageType].New()
-    rescaler.SetInput(gaussianFilter.GetOutput())
-    rescaler.SetOutputMinimum(0)
-    rescaler.SetOutputMaximum(255)
-
-    rescaler.Update()
-
-    out = rescaler.GetOutput().__array__()
-    inp = reader.GetOutput().__array__()
-    fig, ax = plt.subplots(1, 2, figsize=(8, 4))
-    ax[0].imshow(inp, cmap="gray")
-    ax[0].set_title("Original image")
-    ax[1].imshow(out, cmap="gray")
-    ax[1].set_title("Processed image")
-    plt.show()
-
-    if output_image_path is not None:
-        dir, _ = os.path.split(output_image_path)
-        os.makedirs(dir, exist_ok=True)
-        out = Image.fromarray(out)
-        out.save(output_image_path)
+@cached
+def _recursive_gaussian_iir(input_image_path, sigma):
+    return _run(RecursiveGaussianFilter, input_image_path, sigma=sigma)
 
 
 def recursive_gaussian_iir(input_image_path, sigma, output_image_path=None):
-    InputPixelType = itk.SS
-    OutputPixelType = itk.UC
-    Dimension = 2
-
-    InputImageType = itk.Image[InputPixelType, Dimension]
-    OutputImageType = itk.Image[OutputPixelType, Dimension]
-
-    reader = itk.ImageFileReader[InputImageType].New()
-    reader.SetFileName(input_image_path)
-
-    filterX = itk.RecursiveGaussianImageFilter.New()
-    filterX.SetDirection(0)
-    filterX.SetSigma(sigma)
-    filterX.SetOrder(0)
-    filterX.SetNormalizeAcrossScale(False)
-
-    filterY = itk.RecursiveGaussianImageFilter.New()
-    filterY.SetDirection(1)
-    filterY.SetSigma(sigma)
-    filterY.SetOrder(0)
-    filterY.SetNormalizeAcrossScale(False)
-
-    filterX.SetInput(reader.GetOutput())
-    filterY.SetInput(filterX.GetOutput())
-
-    filterY.Update()
-
-    rescaler = itk.RescaleIntensityImageFilter[InputImageType, OutputImageType].New()
-    rescaler.SetInput(filterY.GetOutput())
-    rescaler.SetOutputMinimum(0)
-    rescaler.SetOutputMaximum(255)
-
-    rescaler.Update()
-
-    out = rescaler.GetOutput().__array__()
-    inp = reader.GetOutput().__array__()
-    fig, ax = plt.subplots(1, 2, figsize=(8, 4))
-    ax[0].imshow(inp, cmap="gray")
-    ax[0].set_title("Original image")
-    ax[1].imshow(out, cmap="gray")
-    ax[1].set_title("Processed image")
-    plt.show()
-
-    if output_image_path is not None:
-        dir, _ = os.path.split(output_image_path)
-        os.makedirs(dir, exist_ok=True)
-        out = Image.fromarray(out)
-        out.save(output_image_path)
-
-
-def median(input_image_path, radius, output_image_path=None):
-    InputPixelType = itk.F
-    OutputPixelType = itk.UC
-    Dimension = 2
-
-    InputImageType = itk.Image[InputPixelType, Dimension]
-    OutputImageType = itk.Image[OutputPixelType, Dimension]
-
-    reader = itk.ImageFileReader[InputImageType].New()
-    reader.SetFileName(input_image_path)
-
-    medianFilter = itk.MedianImageFilter.New(reader)
-    medianFilter.SetRadius(radius)
-
-    rescaler = itk.RescaleIntensityImageFilter[InputImageType, OutputImageType].New()
-    rescaler.SetInput(medianFilter.GetOutput())
-    rescaler.SetOutputMinimum(0)
-    rescaler.SetOutputMaximum(255)
-
-    rescaler.Update()
-
-    out = rescaler.GetOutput().__array__()
-    inp = reader.GetOutput().__array__()
-    fig, ax = plt.subplots(1, 2, figsize=(8, 4))
-    ax[0].imshow(inp, cmap="gray")
-    ax[0].set_title("Original image")
-    ax[1].imshow(out, cmap="gray")
-    ax[1].set_title("Processed image")
-    plt.show()
-
-    if output_image_path is not None:
-        dir, _ = os.path.split(output_image_path)
-        os.makedirs(dir, exist_ok=True)
-        out = Image.fromarray(out)
-        out.save(output_image_path)
+    inp, out = _recursive_gaussian_iir(input_image_path, sigma)
+    _show(inp, out)
+    _export(out, output_image_path, input_image_path)
+
+
+@cached
+def recursive_gaussian_iir_array(image, sigma, pipeline=None, backend=None):
+    """In-memory recursive_gaussian_iir: NumPy array or ``itk.Image`` in, uint8 array view out."""
+    return _run_array(
+        RecursiveGaussianFilter,
+        "recursive_gaussian_iir",
+        pipeline,
+        image,
+        backend,
+        sigma=sigma,
+    )
+
+
+def _median_engine(engine, PixelType, Dimension, radius, chosen=False):
+    # "filter" is MedianImageFilter (or the NumPy backend), "histogram" the
+    # constant time median of histogram_median.py for 2D uint8 images. By
+    # default large windows of those take the histogram, unless the caller
+    # chose a pipeline or backend.
+    if engine not in (None,) + histogram_median.ENGINES:
+        raise ValueError(
+            "Unknown median engine %r, expected one of %s"
+            % (engine, histogram_median.ENGINES)
+        )
+    eightBit = PixelType is itk.UC and Dimension == 2
+    if engine == "histogram" and not eightBit:
+        raise ValueError("The histogram median needs a 2D uint8 image")
+    if engine is None:
+        large = eightBit and not chosen and histogram_median.is_large(radius)
+        return "histogram" if large else "filter"
+    return engine
+
+
+def _histogram_median(array, radius):
+    with span("histogram median"):
+        return numpy_backend.rescale_to_uint8(
+            histogram_median.median_filter(array, radius)
+        )
+
+
+@cached
+def _median(input_image_path, radius, precision="float", engine=None):
+    information = read_image_information(input_image_path)
+    engine = _median_engine(
+        engine, information["pixel_type"], information["dimension"], radius
+    )
+    if engine == "histogram":
+        inp = itk.array_view_from_image(itk.imread(input_image_path, itk.UC))
+        return inp, _histogram_median(inp, radius)
+    return _run(MedianFilter, input_image_path, precision, radius=radius)
+
+
+def median(
+    input_image_path, radius, output_image_path=None, precision="float", engine=None
+):
+    """``engine`` is ``"filter"``, ``"histogram"`` or None, see ``median_array``."""
+    inp, out = _median(input_image_path, radius, precision, engine)
+    _show(inp, out)
+    _export(out, output_image_path, input_image_path)
+
+
+@cached
+def median_array(
+    image, radius, pipeline=None, backend=None, precision="float", engine=None
+):
+    """In-memory median: NumPy array or ``itk.Image`` in, uint8 array view out.
+
+    ``engine="histogram"`` takes the median from sliding histograms
+    (``histogram_median.py``), whose time does not grow with the radius; it
+    needs a 2D uint8 image and gives the same output as ``"filter"``. The
+    default ``engine=None`` uses it for those from ``HISTOGRAM_RADIUS`` on,
+    unless a ``pipeline`` or ``backend`` is given.
+    """
+    engine = _median_engine(
+        engine,
+        pixel_type_of(image),
+        _image_dimension(image),
+        radius,
+        chosen=pipeline is not None or backend is not None,
+    )
+    if engine == "histogram":
+        if pipeline is not None:
+            raise ValueError("A reused pipeline always runs MedianImageFilter")
+        if not isinstance(image, np.ndarray):
+            image = itk.array_view_from_image(image)
+        return _histogram_median(image, radius)
+    return _run_array(
+        MedianFilter, "median", pipeline, image, backend, precision, radius=radius
+    )
@@ -1,102 +1,169 @@
-import itk
-import matplotlib.pyplot as plt
-import os
-from PIL import Image
-
-
-def grad_anisotropic_diffusion(
-    inputImagePath, numberOfIterations, conductance=None, timeStep=None, exportPath=None
-):
-    InputPixelType = itk.F
-    OutputPixelType = itk.UC
-    InputImageType = itk.Image[InputPixelType, 2]
-    OutputImageType = itk.Image[OutputPixelType, 2]
-
-    FilterType = itk.GradientAnisotropicDiffusionImageFilter[
-        InputImageType, InputImageType
-    ]
-    filter = FilterType.New()
+"""Edge preserving smoothing: gradient and curvature anisotropic diffusion.
+
+Both filters run ``numberOfIterations`` iterations unless a ``tolerance`` is
+given, which stops them once an iteration changes the image by less than
+that root mean square, in the units of the input intensities; the number of
+iterations then becomes a maximum. ``timeStep=None`` takes the largest time
+step that is stable for the image spacing (``GetStableTimeStep`` in
+``pipelines.py``). The interactive functions print the iterations a
+tolerance saved; with a ``pipeline`` passed to the ``*_array`` functions,
+``pipeline.GetConvergence()`` gives them.
+"""
 
-    reader = itk.ImageFileReader[InputImageType].New()
-    reader.SetFileName(inputImagePath)
-    filter.SetInput(reader.GetOutput())
+import itk
 
-    filter.SetNumberOfIterations(numberOfIterations)
-    filter.SetTimeStep(timeStep)
-    filter.SetConductanceParameter(conductance)
-    rescaler = itk.RescaleIntensityImageFilter[InputImageType, OutputImageType].New()
-    rescaler.SetInput(filter.GetOutput())
-    rescaler.SetOutputMinimum(0)
-    rescaler.SetOutputMaximum(255)
+from ..caching import cached
+from .bluring import _export, _middle_slice, _run_image, _run_pipeline
+from .pipelines import (
+    CurvatureAnisotropicDiffusionFilter,
+    GradientAnisotropicDiffusionFilter,
+)
 
-    rescaler.Update()
 
-    input = reader.GetOutput().__array__()
-    output = rescaler.GetOutput().__array__()
+def _show(input, output):
+    import matplotlib.pyplot as plt
 
     fig, ax = plt.subplots(1, 2, figsize=(10, 5))
-    ax[0].imshow(input, cmap="gray")
+    ax[0].imshow(_middle_slice(input), cmap="gray")
     ax[0].set_title("Input image")
-    ax[1].imshow(output, cmap="gray")
+    ax[1].imshow(_middle_slice(output), cmap="gray")
     ax[1].set_title("Processed image")
 
     plt.show()
 
-    if exportPath is not None:
-        dir, _ = os.path.split(exportPath)
-        os.makedirs(dir, exist_ok=True)
-        output = Image.fromarray(output)
-        output.save(exportPath)
 
+def _run_diffusion(PipelineType, inputImagePath, **parameters):
+    # as bluring._run, with the convergence of the run
+    pipeline = _run_pipeline(PipelineType, inputImagePath, **parameters)
+    output = itk.array_view_from_image(pipeline.GetOutput())
+    input = itk.array_view_from_image(pipeline.reader.GetOutput())
+    return input, output, pipeline.GetConvergence()
 
-def curve_anisotropic_diffusion(
+
+def _report(convergence):
+    if convergence["rms_change"] is not None:
+        print(
+            "Stopped after %d of %d iterations (%d saved), RMS change %.4g"
+            % (
+                convergence["iterations"],
+                convergence["maximum_iterations"],
+                convergence["iterations_saved"],
+                convergence["rms_change"],
+            )
+        )
+
+
+@cached
+def _grad_anisotropic_diffusion(
+    inputImagePath, numberOfIterations, conductance=None, timeStep=None, tolerance=None
+):
+    return _run_diffusion(
+        GradientAnisotropicDiffusionFilter,
+        inputImagePath,
+        numberOfIterations=numberOfIterations,
+        conductance=conductance,
+        timeStep=timeStep,
+        tolerance=tolerance,
+    )
+
+
+def grad_anisotropic_diffusion(
     inputImagePath,
     numberOfIterations,
     conductance=None,
     timeStep=None,
-    useImageSpacing=False,
     exportPath=None,
+    tolerance=None,
 ):
-    InputPixelType = itk.F
-    OutputPixelType = itk.UC
-    InputImageType = itk.Image[InputPixelType, 2]
-    OutputImageType = itk.Image[OutputPixelType, 2]
-
-    reader = itk.ImageFileReader[InputImageType].New()
-    reader.SetFileName(inputImagePath)
-
-    FilterType = itk.CurvatureAnisotropicDiffusionImageFilter[
-        InputImageType, InputImageType
-    ]
-    filter = FilterType.New()
-    filter.SetInput(reader.GetOutput())
+    input, output, convergence = _grad_anisotropic_diffusion(
+        inputImagePath, numberOfIterations, conductance, timeStep, tolerance
+    )
+    _report(convergence)
+    _show(input, output)
+    _export(output, exportPath, inputImagePath)
 
-    filter.SetNumberOfIterations(numberOfIterations)
-    filter.SetTimeStep(timeStep)
-    filter.SetConductanceParameter(conductance)
-    if useImageSpacing:
-        filter.UseImageSpacingOn()
 
-    rescaler = itk.RescaleIntensityImageFilter[InputImageType, OutputImageType].New()
-    rescaler.SetInput(filter.GetOutput())
-    rescaler.SetOutputMinimum(0)
-    rescaler.SetOutputMaximum(255)
-
-    rescaler.Update()
-
-    input = reader.GetOutput().__array__()
-    output = rescaler.GetOutput().__array__()
-
-    fig, ax = plt.subplots(1, 2, figsize=(10, 5))
-    ax[0].imshow(input, cmap="gray")
-    ax[0].set_title("Input image")
-    ax[1].imshow(output, cmap="gray")
-    ax[1].set_title("Processed image")
+@cached
+def grad_anisotropic_diffusion_array(
+    image,
+    numberOfIterations,
+    conductance=None,
+    timeStep=None,
+    pipeline=None,
+    tolerance=None,
+):
+    """In-memory gradient anisotropic diffusion, returns a uint8 array view."""
+    return _run_image(
+        GradientAnisotropicDiffusionFilter,
+        pipeline,
+        image,
+        numberOfIterations=numberOfIterations,
+        conductance=conductance,
+        timeStep=timeStep,
+        tolerance=tolerance,
+    )
+
+
+@cached
+def _curve_anisotropic_diffusion(
+    inputImagePath,
+    numberOfIterations,
+    conductance=None,
+    timeStep=None,
+    useImageSpacing=False,
+    tolerance=None,
+):
+    return _run_diffusion(
+        CurvatureAnisotropicDiffusionFilter,
+        inputImagePath,
+        numberOfIterations=numberOfIterations,
+        conductance=conductance,
+        timeStep=timeStep,
+        useImageSpacing=useImageSpacing,
+        tolerance=tolerance,
+    )
 
-    plt.show()
 
-    if exportPath is not None:
-        dir, _ = os.path.split(exportPath)
-        os.makedirs(dir, exist_ok=True)
-        output = Image.fromarray(output)
-        output.save(exportPath)
+def curve_anisotropic_diffusion(
+    inputImagePath,
+    numberOfIterations,
+    conductance=None,
+    timeStep=None,
+    useImageSpacing=False,
+    exportPath=None,
+    tolerance=None,
+):
+    input, output, convergence = _curve_anisotropic_diffusion(
+        inputImagePath,
+        numberOfIterations,
+        conductance,
+        timeStep,
+        useImageSpacing,
+        tolerance,
+    )
+    _report(convergence)
+    _show(input, output)
+    _export(output, exportPath, inputImagePath)
+
+
+@cached
+def curve_anisotropic_diffusion_array(
+    image,
+    numberOfIterations,
+    conductance=None,
+    timeStep=None,
+    useImageSpacing=False,
+    pipeline=None,
+    tolerance=None,
+):
+    """In-memory curvature anisotropic diffusion, returns a uint8 array view."""
+    return _run_image(
+        CurvatureAnisotropicDiffusionFilter,
+        pipeline,
+        image,
+        numberOfIterations=numberOfIterations,
+        conductance=conductance,
+        timeStep=timeStep,
+        useImageSpacing=useImageSpacing,
+        tolerance=tolerance,
+    )
@@ -0,0 +1,121 @@
+"""Median filter for 8-bit 2D images in constant time per pixel.
+
+``MedianImageFilter`` selects the middle of the ``(2r+1)^2`` values around
+every pixel, so its cost grows with the area of the window. This engine
+follows Perreault and Hebert's constant time median: every column of the
+image keeps a histogram of the ``2r+1`` values in the window's rows, and
+moving down one row removes one value from each column histogram and adds
+one. The window histogram of each pixel is the sum of ``2r+1`` column
+histograms, taken from a running sum along the row, and its median is found
+in two steps, first the 16-level coarse bin and then the value inside it.
+Each step is a NumPy operation over a whole row (per coarse bin for the
+second one), so the work per pixel does not depend on the radius.
+
+The result is exactly ``MedianImageFilter``'s for uint8 inputs: the same
+window (with ``(rx, ry)`` radii in ITK order), the same edge replication
+at the borders (ITK's zero flux Neumann condition) and the same middle
+value, as the window always holds an odd number of pixels.
+"""
+
+import numpy as np
+
+ENGINES = ("filter", "histogram")
+
+# radius from which the histogram median is the faster engine, from
+# python -m benchmarks.bench_median (on one core, for 256 to 1024 squared)
+HISTOGRAM_RADIUS = 4
+
+LEVELS = 256
+
+# the coarse histograms group 16 consecutive levels
+_COARSE = 16
+_BINS = LEVELS // _COARSE
+
+
+def radii(radius, Dimension=2):
+    """``radius`` (a number or a sequence in ITK order) as a list per axis."""
+    if np.ndim(radius) == 0:
+        return [int(radius)] * Dimension
+    radius = [int(r) for r in radius]
+    if len(radius) != Dimension:
+        raise ValueError("Expected %d radii, got %s" % (Dimension, radius))
+    return radius
+
+
+def is_large(radius, Dimension=2):
+    """Whether ``radius`` has at least the window of ``HISTOGRAM_RADIUS``."""
+    return (
+        np.prod([2 * r + 1 for r in radii(radius, Dimension)])
+        >= (2 * HISTOGRAM_RADIUS + 1) ** Dimension
+    )
+
+
+def median_filter(array, radius):
+    """The median of every window of a 2D uint8 ``array``, as uint8."""
+    array = np.asarray(array)
+    if array.dtype != np.uint8 or array.ndim != 2:
+        raise ValueError(
+            "The histogram median needs a 2D uint8 image, got %dD %s"
+            % (array.ndim, array.dtype)
+        )
+    radiusX, radiusY = radii(radius)
+    height, width = array.shape
+    padded = np.pad(array, ((radiusY, radiusY), (radiusX, radiusX)), mode="edge")
+    columns = width + 2 * radiusX
+    window = 2 * radiusX + 1
+    # index of the median among the window's sorted values
+    middle = window * (2 * radiusY + 1) // 2
+
+    # column histograms, fine[b, c, l] counting level 16 * b + l in column c
+    column = np.arange(columns)
+    counts = np.bincount(
+        (column * LEVELS + padded[: 2 * radiusY + 1]).ravel(),
+        minlength=columns * LEVELS,
+    )
+    fine = np.ascontiguousarray(
+        counts.reshape(columns, _BINS, _COARSE).transpose(1, 0, 2), np.int32
+    )
+    coarse = np.ascontiguousarray(fine.sum(axis=2).T)
+
+    # running sums along the row, with a zero row in front so that the
+    # histogram of a window is the difference of two rows
+    coarseSum = np.zeros((columns + 1, _BINS), np.int32)
+    fineSum = np.zeros((columns + 1, _COARSE), np.int32)
+    fineCounts = np.empty((width, _COARSE), np.int32)
+    x = np.arange(width)
+    offsets = np.arange(window)
+    output = np.empty((height, width), np.uint8)
+    for y in range(height):
+        # the coarse bin holding each median, and the count below it
+        np.cumsum(coarse, axis=0, out=coarseSum[1:])
+        counts = np.cumsum(coarseSum[window:] - coarseSum[:-window], axis=1)
+        bins = (counts <= middle).sum(axis=1)
+        below = np.where(bins > 0, counts[x, bins - 1], 0)
+
+        # window histograms of the 16 levels of that bin, one bin at a time
+        for b in np.unique(bins):
+            selected = np.flatnonzero(bins == b)
+            first, last = selected[0], selected[-1] + window
+            if len(selected) * window < last - first:
+                # a few scattered pixels: sum their windows directly
+                fineCounts[selected] = fine[b][selected[:, None] + offsets].sum(axis=1)
+            else:
+                np.cumsum(
+                    fine[b, first:last], axis=0, out=fineSum[1 : last - first + 1]
+                )
+                selected -= first
+                fineCounts[selected + first] = (
+                    fineSum[selected + window] - fineSum[selected]
+                )
+        counts = below[:, None] + np.cumsum(fineCounts, axis=1)
+        output[y] = bins * _COARSE + (counts <= middle).sum(axis=1)
+
+        if y + 1 < height:
+            # slide the column histograms down by one row
+            removed = padded[y]
+            added = padded[y + 2 * radiusY + 1]
+            fine[removed // _COARSE, column, removed % _COARSE] -= 1
+            fine[added // _COARSE, column, added % _COARSE] += 1
+            coarse[column, removed // _COARSE] -= 1
+            coarse[column, added // _COARSE] += 1
+    return output
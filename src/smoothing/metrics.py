@@ -0,0 +1,126 @@
+"""Image quality metrics for comparing smoothing outputs with a reference.
+
+All three take NumPy arrays of the same shape (2D or 3D) and return a float,
+higher meaning closer to the reference. They only need NumPy.
+"""
+
+import math
+
+import numpy as np
+
+# SSIM constants and window of Wang et al. (2004), as in scikit-image's defaults
+_SSIM_WINDOW = 7
+_SSIM_K1 = 0.01
+_SSIM_K2 = 0.03
+
+
+def _as_float(image, reference):
+    image = np.asarray(image, dtype=np.float64)
+    reference = np.asarray(reference, dtype=np.float64)
+    if image.shape != reference.shape:
+        raise ValueError(
+            "Image shape %s does not match the reference shape %s"
+            % (image.shape, reference.shape)
+        )
+    return image, reference
+
+
+def _data_range(reference, dataRange):
+    if dataRange is not None:
+        return float(dataRange)
+    return float(reference.max() - reference.min()) or 1.0
+
+
+def psnr(image, reference, dataRange=None):
+    """Peak signal-to-noise ratio in dB.
+
+    ``dataRange`` defaults to the reference's max - min; pass 255 to compare
+    8-bit outputs on their full scale. Identical images give ``inf``.
+    """
+    image, reference = _as_float(image, reference)
+    mse = np.mean((image - reference) ** 2)
+    if mse == 0:
+        return math.inf
+    return float(10 * np.log10(_data_range(reference, dataRange) ** 2 / mse))
+
+
+def _box_mean(array, width):
+    # mean over every complete width^n window ("valid" mode), one cumulative
+    # sum per axis
+    for axis in range(array.ndim):
+        cumulative = np.cumsum(array, axis=axis)
+        zero = np.zeros_like(np.take(cumulative, [0], axis=axis))
+        cumulative = np.concatenate([zero, cumulative], axis=axis)
+        n = cumulative.shape[axis]
+        array = (
+            np.take(cumulative, range(width, n), axis=axis)
+            - np.take(cumulative, range(0, n - width), axis=axis)
+        ) / width
+    return array
+
+
+def ssim(image, reference, dataRange=None):
+    """Mean structural similarity index.
+
+    Uses a uniform 7-pixel window with sample covariances and averages over
+    the windows that lie completely inside the image, like
+    ``skimage.metrics.structural_similarity`` with its default arguments.
+    """
+    image, reference = _as_float(image, reference)
+    width = _SSIM_WINDOW
+    if min(image.shape) < width:
+        raise ValueError("SSIM needs images of at least %d pixels per axis" % width)
+
+    dataRange = _data_range(reference, dataRange)
+    c1 = (_SSIM_K1 * dataRange) ** 2
+    c2 = (_SSIM_K2 * dataRange) ** 2
+    # sample instead of population (co)variances
+    correction = width**image.ndim / (width**image.ndim - 1.0)
+
+    meanX = _box_mean(image, width)
+    meanY = _box_mean(reference, width)
+    varianceX = correction * (_box_mean(image * image, width) - meanX * meanX)
+    varianceY = correction * (_box_mean(reference * reference, width) - meanY * meanY)
+    covariance = correction * (_box_mean(image * reference, width) - meanX * meanY)
+
+    index = ((2 * meanX * meanY + c1) * (2 * covariance + c2)) / (
+        (meanX**2 + meanY**2 + c1) * (varianceX + varianceY + c2)
+    )
+    return float(index.mean())
+
+
+def _laplacian(array):
+    # 2n+1 point Laplacian over the interior
+    interior = tuple(slice(1, -1) for _ in range(array.ndim))
+    result = -2.0 * array.ndim * array[interior]
+    for axis in range(array.ndim):
+        for offset in (slice(0, -2), slice(2, None)):
+            neighbour = list(interior)
+            neighbour[axis] = offset
+            result += array[tuple(neighbour)]
+    return result
+
+
+def edge_preservation(image, reference):
+    """Edge preservation index of Sattar et al. (1997).
+
+    The correlation between the Laplacians of the image and of the
+    reference: 1 when every edge of the reference is kept with its contrast
+    (up to a scale), lower when edges are blurred away or noise adds new ones.
+    """
+    image, reference = _as_float(image, reference)
+    x = _laplacian(image)
+    y = _laplacian(reference)
+    x -= x.mean()
+    y -= y.mean()
+    denominator = math.sqrt(float(np.sum(x * x)) * float(np.sum(y * y)))
+    if denominator == 0:
+        return 0.0
+    return float(np.sum(x * y) / denominator)
+
+
+METRICS = {
+    "psnr": psnr,
+    "ssim": ssim,
+    "edge_preservation": edge_preservation,
+}
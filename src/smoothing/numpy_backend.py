@@ -0,0 +1,402 @@
+"""NumPy implementations of the primitive smoothing pipelines.
+
+Each function takes what the ``*_array`` functions in ``bluring.py`` take (a
+NumPy array or an ``itk.Image``) and returns the same uint8 array, without
+building an ITK pipeline. The arithmetic follows the ITK filters operation
+by operation, in the same precision and order, so the outputs are identical
+to the pipelines' (``benchmarks/bench_backends.py`` checks this):
+
+* ``binomial``: ``BinomialBlurImageFilter``, in double, x axis first;
+* ``discrete_gaussian``: ``GaussianOperator`` kernels applied per axis by
+  ``NeighborhoodOperatorImageFilter``, slowest axis first;
+* ``recursive_gaussian``: ``RecursiveGaussianImageFilter``'s zero order
+  Deriche recursion with its border initialization, one ``itk.SS`` pass per
+  axis;
+* ``median``: ``MedianImageFilter``, with ``scipy.ndimage`` when SciPy is
+  installed.
+
+Every filter extends the image by edge replication (ITK's zero flux Neumann
+boundary) and the result is rescaled to [0, 255] like
+``RescaleIntensityImageFilter``. ``binomial`` and ``median`` take the
+``dtype`` of the pipeline's pixel type, for the ``"native"`` precision
+policy.
+"""
+
+import math
+
+import itk
+import numpy as np
+
+# pixels per slab of the NumPy median; its window copies stay small
+SLAB_PIXELS = 2**16
+
+
+def _input(image, dtype):
+    # pixels converted to the pipeline's input type, and the spacing in ITK
+    # axis order
+    if isinstance(image, np.ndarray):
+        return image.astype(dtype, copy=False), (1.0,) * image.ndim
+    array = itk.array_view_from_image(image)
+    return array.astype(dtype, copy=False), tuple(image.GetSpacing())
+
+
+def _itk_axes(ndim):
+    # NumPy axis of ITK axis 0 (x), 1 (y), ...
+    return range(ndim - 1, -1, -1)
+
+
+def _per_axis(value, ndim):
+    # a scalar or per-axis parameter in ITK order, per NumPy axis
+    if np.ndim(value) == 0:
+        return [value] * ndim
+    if len(value) != ndim:
+        raise ValueError("Expected %d values, one per axis, got %s" % (ndim, value))
+    return list(value)[::-1]
+
+
+def _rescale_coefficients(inputMinimum, inputMaximum, outputMinimum, outputMaximum):
+    # RescaleIntensityImageFilter::BeforeThreadedGenerateData
+    if inputMinimum != inputMaximum:
+        scale = (outputMaximum - outputMinimum) / (inputMaximum - inputMinimum)
+    elif inputMaximum != 0:
+        scale = (outputMaximum - outputMinimum) / inputMaximum
+    else:
+        scale = 0.0
+    return scale, outputMinimum - inputMinimum * scale
+
+
+def _rescale_values(array, scale, shift):
+    value = array.astype(np.float64)
+    value *= scale
+    value += shift
+    np.clip(value, 0.0, 255.0, out=value)
+    return value.astype(np.uint8)
+
+
+def rescale_to_uint8(array, minimum=None, maximum=None):
+    """``RescaleIntensityImageFilter`` to [0, 255] with a uint8 output.
+
+    ``minimum`` and ``maximum`` default to the array's own. 8 and 16 bit
+    integer arrays are rescaled through a table of every possible value,
+    straight into the output without a double precision copy of the image.
+    """
+    minimum = float(array.min()) if minimum is None else float(minimum)
+    maximum = float(array.max()) if maximum is None else float(maximum)
+    scale, shift = _rescale_coefficients(minimum, maximum, 0.0, 255.0)
+    if array.dtype.kind in "iu" and array.dtype.itemsize <= 2:
+        # indexed by the bit pattern, so signed types need no offset
+        unsigned = np.dtype("u%d" % array.dtype.itemsize)
+        codes = np.arange(2 ** (8 * array.dtype.itemsize), dtype=unsigned)
+        table = _rescale_values(codes.view(array.dtype), scale, shift)
+        return table[array.view(unsigned)]
+    return _rescale_values(array, scale, shift)
+
+
+def binomial(image, number_of_repetitions, dtype=np.float32):
+    array, _ = _input(image, dtype)
+    work = array.astype(np.float64)
+    for _ in range(number_of_repetitions):
+        for axis in _itk_axes(work.ndim):
+            line = np.moveaxis(work, axis, 0)
+            # forward then backward two-tap averages, each reading the
+            # neighbour the previous step left behind
+            line[:-1] = (line[:-1] + line[1:]) / 2.0
+            line[1:] = (line[1:] + line[:-1]) / 2.0
+    return rescale_to_uint8(work.astype(dtype))
+
+
+def _bessel_i0(y):
+    # GaussianOperator::ModifiedBesselI0
+    d = abs(y)
+    if d < 3.75:
+        m = y / 3.75
+        m *= m
+        return 1.0 + m * (
+            3.5156229
+            + m
+            * (
+                3.0899424
+                + m * (1.2067492 + m * (0.2659732 + m * (0.360768e-1 + m * 0.45813e-2)))
+            )
+        )
+    m = 3.75 / d
+    return (math.exp(d) / math.sqrt(d)) * (
+        0.39894228
+        + m
+        * (
+            0.1328592e-1
+            + m
+            * (
+                0.225319e-2
+                + m
+                * (
+                    -0.157565e-2
+                    + m
+                    * (
+                        0.916281e-2
+                        + m
+                        * (
+                            -0.2057706e-1
+                            + m * (0.2635537e-1 + m * (-0.1647633e-1 + m * 0.392377e-2))
+                        )
+                    )
+                )
+            )
+        )
+    )
+
+
+def _bessel_i1(y):
+    # GaussianOperator::ModifiedBesselI1
+    d = abs(y)
+    if d < 3.75:
+        m = y / 3.75
+        m *= m
+        accumulator = d * (
+            0.5
+            + m
+            * (
+                0.87890594
+                + m
+                * (
+                    0.51498869
+                    + m
+                    * (
+                        0.15084934
+                        + m * (0.2658733e-1 + m * (0.301532e-2 + m * 0.32411e-3))
+                    )
+                )
+            )
+        )
+    else:
+        m = 3.75 / d
+        accumulator = 0.2282967e-1 + m * (
+            -0.2895312e-1 + m * (0.1787654e-1 - m * 0.420059e-2)
+        )
+        accumulator = 0.39894228 + m * (
+            -0.3988024e-1
+            + m
+            * (-0.362018e-2 + m * (0.163801e-2 + m * (-0.1031555e-1 + m * accumulator)))
+        )
+        accumulator *= math.exp(d) / math.sqrt(d)
+    return -accumulator if y < 0.0 else accumulator
+
+
+def _bessel_in(n, y):
+    # GaussianOperator::ModifiedBesselI, Miller's downward recurrence
+    toy = 2.0 / abs(y)
+    qip = accumulator = 0.0
+    qi = 1.0
+    for j in range(2 * (n + int(math.sqrt(40.0 * n))), 0, -1):
+        qim = qip + j * toy * qi
+        qip = qi
+        qi = qim
+        if abs(qi) > 1.0e10:
+            accumulator *= 1.0e-10
+            qi *= 1.0e-10
+            qip *= 1.0e-10
+        if j == n:
+            accumulator = qip
+    accumulator *= _bessel_i0(y) / qi
+    return -accumulator if y < 0.0 and n & 1 else accumulator
+
+
+def gaussian_kernel(variance, maximumError=0.01, maximumKernelWidth=32):
+    """The coefficients ``itk.GaussianOperator`` generates for ``variance``."""
+    et = math.exp(-variance)
+    cap = 1.0 - maximumError
+    coefficients = [et * _bessel_i0(variance), et * _bessel_i1(variance)]
+    total = coefficients[0] + coefficients[1] * 2.0
+    i = 2
+    while total < cap:
+        coefficients.append(et * _bessel_in(i, variance))
+        total += coefficients[i] * 2.0
+        if coefficients[i] <= 0.0 or len(coefficients) > maximumKernelWidth:
+            break
+        i += 1
+    half = [c / total for c in coefficients]
+    return np.array(half[:0:-1] + half)
+
+
+def _convolve(work, axis, kernel):
+    # NeighborhoodInnerProduct: 0 + c[-r] * f(x-r) + ... + c[r] * f(x+r)
+    radius = len(kernel) // 2
+    pad = [(0, 0)] * work.ndim
+    pad[axis] = (radius, radius)
+    padded = np.moveaxis(np.pad(work, pad, mode="edge"), axis, 0)
+    n = work.shape[axis]
+    out = padded[0:n] * kernel[0]
+    for k in range(1, len(kernel)):
+        out += padded[k : k + n] * kernel[k]
+    return np.moveaxis(out, 0, axis)
+
+
+def discrete_gaussian(image, variance):
+    array, spacing = _input(image, np.float32)
+    # DiscreteGaussianImageFilter runs the last ITK axis first, sums in
+    # double and stores every pass as float; the variance is in physical
+    # units (UseImageSpacing)
+    variances = _per_axis(variance, array.ndim)
+    for axis in range(array.ndim):
+        s = spacing[array.ndim - 1 - axis]
+        kernel = gaussian_kernel(variances[axis] / (s * s))
+        array = _convolve(array.astype(np.float64), axis, kernel).astype(np.float32)
+    return rescale_to_uint8(array)
+
+
+def _recursive_coefficients(sigma, spacing):
+    # RecursiveGaussianImageFilter::SetUp for the zero order, without
+    # normalization across scale
+    a1, b1, w1, l1 = 1.3530, 1.8151, 0.6681, -1.3932
+    a2, b2, w2, l2 = -0.3531, 0.0902, 2.0787, -1.3732
+    sigmad = sigma / spacing
+
+    cos1 = math.cos(w1 / sigmad)
+    exp1 = math.exp(l1 / sigmad)
+    cos2 = math.cos(w2 / sigmad)
+    exp2 = math.exp(l2 / sigmad)
+    d4 = exp1 * exp1 * exp2 * exp2
+    d3 = -2 * cos1 * exp1 * exp2 * exp2
+    d3 += -2 * cos2 * exp2 * exp1 * exp1
+    d2 = 4 * cos2 * cos1 * exp1 * exp2
+    d2 += exp1 * exp1 + exp2 * exp2
+    d1 = -2 * (exp2 * cos2 + exp1 * cos1)
+    sd = 1.0 + d1 + d2 + d3 + d4
+
+    sin1 = math.sin(w1 / sigmad)
+    sin2 = math.sin(w2 / sigmad)
+    n0 = a1 + a2
+    n1 = exp2 * (b2 * sin2 - (a2 + 2 * a1) * cos2)
+    n1 += exp1 * (b1 * sin1 - (a1 + 2 * a2) * cos1)
+    n2 = (a1 + a2) * cos2 * cos1
+    n2 -= b1 * cos2 * sin1 + b2 * cos1 * sin2
+    n2 *= 2 * exp1 * exp2
+    n2 += a2 * exp1 * exp1 + a1 * exp2 * exp2
+    n3 = exp2 * exp1 * exp1 * (b2 * sin2 - a2 * cos2)
+    n3 += exp1 * exp2 * exp2 * (b1 * sin1 - a1 * cos1)
+    sn = n0 + n1 + n2 + n3
+
+    alpha0 = 2 * sn / sd - n0
+    n0 *= 1.0 / alpha0
+    n1 *= 1.0 / alpha0
+    n2 *= 1.0 / alpha0
+    n3 *= 1.0 / alpha0
+
+    # symmetric anti-causal coefficients, and the border coefficients that
+    # extend the first and last pixel to infinity
+    m1 = n1 - d1 * n0
+    m2 = n2 - d2 * n0
+    m3 = n3 - d3 * n0
+    m4 = -d4 * n0
+    sn = n0 + n1 + n2 + n3
+    sm = m1 + m2 + m3 + m4
+    sd = 1.0 + d1 + d2 + d3 + d4
+    d = (d1, d2, d3, d4)
+    return (
+        (n0, n1, n2, n3),
+        (m1, m2, m3, m4),
+        d,
+        tuple(di * sn / sd for di in d),
+        tuple(di * sm / sd for di in d),
+    )
+
+
+def _recursive_pass(data, coefficients):
+    # RecursiveSeparableImageFilter::FilterDataArray on every line at once;
+    # ``data`` holds the lines along axis 0
+    (n0, n1, n2, n3), (m1, m2, m3, m4), (d1, d2, d3, d4), bn, bm = coefficients
+    n = data.shape[0]
+
+    # causal part, the input before the first pixel being data[0]
+    v = data[0]
+    e = np.concatenate([np.broadcast_to(v, (3,) + v.shape), data])
+    causal = e[3:] * n0 + e[2:-1] * n1 + e[1:-2] * n2 + e[:-3] * n3
+    s = causal
+    s[0] -= v * bn[0] + v * bn[1] + v * bn[2] + v * bn[3]
+    s[1] -= s[0] * d1 + v * bn[1] + v * bn[2] + v * bn[3]
+    s[2] -= s[1] * d1 + s[0] * d2 + v * bn[2] + v * bn[3]
+    s[3] -= s[2] * d1 + s[1] * d2 + s[0] * d3 + v * bn[3]
+    for i in range(4, n):
+        s[i] -= s[i - 1] * d1 + s[i - 2] * d2 + s[i - 3] * d3 + s[i - 4] * d4
+
+    # anti-causal part, the input after the last pixel being data[-1]
+    v = data[-1]
+    e = np.concatenate([data, np.broadcast_to(v, (4,) + v.shape)])
+    a = e[1:-3] * m1 + e[2:-2] * m2 + e[3:-1] * m3 + e[4:] * m4
+    a[n - 1] -= v * bm[0] + v * bm[1] + v * bm[2] + v * bm[3]
+    a[n - 2] -= a[n - 1] * d1 + v * bm[1] + v * bm[2] + v * bm[3]
+    a[n - 3] -= a[n - 2] * d1 + a[n - 1] * d2 + v * bm[2] + v * bm[3]
+    a[n - 4] -= a[n - 3] * d1 + a[n - 2] * d2 + a[n - 1] * d3 + v * bm[3]
+    for i in range(n - 5, -1, -1):
+        a[i] -= a[i + 1] * d1 + a[i + 2] * d2 + a[i + 3] * d3 + a[i + 4] * d4
+
+    causal += a
+    return causal
+
+
+def recursive_gaussian(image, sigma):
+    array, spacing = _input(image, np.int16)
+    for direction, axis in enumerate(_itk_axes(array.ndim)):
+        if array.shape[axis] < 4:
+            raise ValueError(
+                "The number of pixels along direction %d is less than 4. "
+                "This filter requires a minimum of four pixels along the "
+                "dimension to be processed." % direction
+            )
+        coefficients = _recursive_coefficients(sigma, spacing[direction])
+        lines = np.moveaxis(array, axis, 0).astype(np.float64)
+        # every axis filter writes an itk.SS image
+        array = np.moveaxis(_recursive_pass(lines, coefficients), 0, axis).astype(
+            np.int16
+        )
+    return rescale_to_uint8(array)
+
+
+def _ndimage():
+    # SciPy is optional; without it the median runs on NumPy alone
+    try:
+        from scipy import ndimage
+    except ImportError:
+        return None
+    return ndimage
+
+
+def _median_windows(array, radii):
+    sizes = tuple(2 * r + 1 for r in radii)
+    padded = np.pad(array, [(r, r) for r in radii], mode="edge")
+    windows = np.lib.stride_tricks.sliding_window_view(padded, sizes)
+    # the middle of the sorted window values, an odd number of them
+    window = math.prod(sizes)
+    middle = window // 2
+    out = np.empty_like(array)
+    rows = max(1, SLAB_PIXELS // max(1, window * array[0].size))
+    for start in range(0, array.shape[0], rows):
+        slab = windows[start : start + rows].reshape(
+            windows[start : start + rows].shape[: array.ndim] + (-1,)
+        )
+        out[start : start + rows] = np.partition(slab, middle, axis=-1)[..., middle]
+    return out
+
+
+def median(image, radius, dtype=np.float32):
+    array, _ = _input(image, dtype)
+    radii = _per_axis(radius, array.ndim)
+    ndimage = _ndimage()
+    if ndimage is not None:
+        # the window holds an odd number of pixels, so the median is one of
+        # them, exactly as ITK's
+        out = ndimage.median_filter(
+            array, size=[2 * r + 1 for r in radii], mode="nearest"
+        )
+    else:
+        out = _median_windows(array, radii)
+    return rescale_to_uint8(out)
+
+
+# pipeline name (pipelines.PIPELINES) -> implementation
+FILTERS = {
+    "binomial": binomial,
+    "discrete_gaussian": discrete_gaussian,
+    "recursive_gaussian_iir": recursive_gaussian,
+    "median": median,
+}
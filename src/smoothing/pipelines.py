@@ -0,0 +1,523 @@
+"""Reusable smoothing pipelines.
+
+Each class builds its reader -> filter -> rescaler graph once, in the same
+style as ``EdgeFilter``. Changing the input file or a parameter only marks
+the affected stages as modified, so ``Update()`` re-executes just those
+stages: re-running with a new radius does not re-read the image, and
+re-running with a new file does not rebuild any ITK objects.
+
+The image returned by ``GetOutput()`` is owned by the pipeline and is
+overwritten by the next ``Update()``; copy it (``itk.array_from_image``)
+if it has to outlive the next run.
+
+Pipelines are 2D unless constructed with another ``Dimension``, e.g.
+``MedianFilter(3)`` for volumes; ``read_image_information`` gives the
+dimension of a file without reading its pixels.
+
+They run in ``itk.F`` (``itk.SS`` for the recursive Gaussian) unless
+constructed with another ``PixelType``. Under the ``"native"`` precision
+policy, ``GetPixelType`` keeps an 8 or 16 bit input in its own type for
+the filters listed in ``NativePixelTypes`` (median and binomial), which
+reads, filters and rescales a quarter or half of the bytes. The median is
+unchanged by this; the binomial output is truncated to the input type
+before rescaling.
+
+The anisotropic diffusion pipelines take the largest stable time step for
+the input's spacing unless given one, and can stop before
+``numberOfIterations`` once an iteration changes the image by less than a
+``tolerance`` (``GetConvergence`` reports the iterations it saved).
+"""
+
+import math
+import weakref
+
+import itk
+import numpy as np
+
+from ..jobs.cancellation import watch
+from ..profiling import active, instrument
+
+NUMPY_TYPES = {
+    itk.UC: np.uint8,
+    itk.SS: np.int16,
+    itk.US: np.uint16,
+    itk.F: np.float32,
+    itk.D: np.float64,
+}
+
+# "float" runs every filter in its InputPixelType, "native" keeps integer
+# inputs in their own type where the filter allows it
+PRECISIONS = ("float", "native")
+
+# ImageIO component type names of the pixel types above
+_COMPONENT_TYPES = {
+    "unsigned_char": itk.UC,
+    "short": itk.SS,
+    "unsigned_short": itk.US,
+    "float": itk.F,
+    "double": itk.D,
+}
+
+
+def pixel_type_of(image):
+    """ITK pixel type of a NumPy array or ``itk.Image``, or ``None``."""
+    if isinstance(image, np.ndarray):
+        for PixelType, dtype in NUMPY_TYPES.items():
+            if image.dtype == dtype:
+                return PixelType
+        return None
+    return itk.template(image)[1][0]
+
+
+def read_image_information(fileName):
+    """Dimension, size, spacing, origin, direction and pixel type of an image file.
+
+    Only the header is read. The direction is a NumPy matrix whose columns
+    are the axis directions, as ``itk.array_from_matrix(image.GetDirection())``.
+    The pixel type is ``None`` for multi-component (e.g. RGB) files.
+    """
+    imageIO = itk.ImageIOFactory.CreateImageIO(
+        fileName, itk.CommonEnums.IOFileMode_ReadMode
+    )
+    if imageIO is None:
+        raise RuntimeError("Could not create IO object for reading file %s" % fileName)
+    imageIO.SetFileName(fileName)
+    imageIO.ReadImageInformation()
+    Dimension = imageIO.GetNumberOfDimensions()
+    PixelType = None
+    if imageIO.GetNumberOfComponents() == 1:
+        PixelType = _COMPONENT_TYPES.get(
+            imageIO.GetComponentTypeAsString(imageIO.GetComponentType())
+        )
+    return {
+        "dimension": Dimension,
+        "size": [imageIO.GetDimensions(i) for i in range(Dimension)],
+        "spacing": [imageIO.GetSpacing(i) for i in range(Dimension)],
+        "origin": [imageIO.GetOrigin(i) for i in range(Dimension)],
+        "direction": np.array(
+            [imageIO.GetDirection(i) for i in range(Dimension)], dtype=np.float64
+        ).T,
+        "pixel_type": PixelType,
+    }
+
+
+class _SmoothingPipeline:
+    InputPixelType = itk.F
+    OutputPixelType = itk.UC
+    Dimension = 2
+
+    # keyword name -> setter method, used by SetParameters
+    Parameters = {}
+
+    # integer pixel types the filter can run in under the "native" policy
+    NativePixelTypes = ()
+
+    def __init__(self, Dimension=None, PixelType=None):
+        if Dimension is not None:
+            self.Dimension = Dimension
+        if PixelType is not None:
+            self.InputPixelType = PixelType
+        self.InputImageType = itk.Image[self.InputPixelType, self.Dimension]
+        self.OutputImageType = itk.Image[self.OutputPixelType, self.Dimension]
+
+        self.reader = itk.ImageFileReader[self.InputImageType].New()
+        self.readerConnected = False
+        self.inputArray = None
+        self.firstFilter, self.lastFilter = self._build()
+
+        self.rescaler = itk.RescaleIntensityImageFilter[
+            self.InputImageType, self.OutputImageType
+        ].New()
+        self.rescaler.SetInput(self.lastFilter.GetOutput())
+        self.rescaler.SetOutputMinimum(0)
+        self.rescaler.SetOutputMaximum(255)
+
+    @classmethod
+    def GetPixelType(cls, precision="float", inputPixelType=None):
+        """Pixel type to run in for an input of ``inputPixelType``."""
+        if precision not in PRECISIONS:
+            raise ValueError(
+                "Unknown precision '%s', expected one of %s"
+                % (precision, ", ".join(PRECISIONS))
+            )
+        if precision == "native" and inputPixelType in cls.NativePixelTypes:
+            return inputPixelType
+        return cls.InputPixelType
+
+    @classmethod
+    def GetWorkPerPixel(cls, Dimension=2, **parameters):
+        """Rough number of operations per pixel for ``parameters``.
+
+        Only relative sizes matter: the thread planner (``src/jobs/threads.py``)
+        compares it with the reading and rescaling every image needs.
+        """
+        return 1.0
+
+    def _build(self):
+        raise NotImplementedError
+
+    def SetFileName(self, fileName):
+        # the reader only re-reads when the file name actually changes
+        self.reader.SetFileName(fileName)
+        if not self.readerConnected:
+            self.firstFilter.SetInput(self.reader.GetOutput())
+            self.readerConnected = True
+            self.inputArray = None
+
+    def SetInput(self, input):
+        self.firstFilter.SetInput(input)
+        self.readerConnected = False
+        self.inputArray = None
+
+    def SetInputArray(self, array):
+        """Use a NumPy array as input.
+
+        The array is wrapped without a copy when its dtype already matches
+        ``InputPixelType`` and converted once otherwise.
+        """
+        array = np.ascontiguousarray(array, dtype=NUMPY_TYPES[self.InputPixelType])
+        self.SetInput(itk.image_view_from_array(array))
+        # the image view does not own its buffer
+        self.inputArray = array
+
+    def GetInput(self):
+        return self.firstFilter.GetInput()
+
+    def SetParameters(self, **parameters):
+        for name, value in parameters.items():
+            if name not in self.Parameters:
+                raise TypeError(
+                    "%s has no parameter '%s'" % (type(self).__name__, name)
+                )
+            getattr(self, self.Parameters[name])(value)
+
+    def _filters(self):
+        if self.firstFilter is self.lastFilter:
+            return [self.firstFilter]
+        return [self.firstFilter, self.lastFilter]
+
+    def GetProcessObjects(self):
+        """``(stage name, ITK object)`` for every stage, in pipeline order."""
+        stages = [("ImageFileReader", self.reader)] if self.readerConnected else []
+        stages += [(f.GetNameOfClass(), f) for f in self._filters()]
+        stages.append(("RescaleIntensityImageFilter", self.rescaler))
+        return stages
+
+    def _instrument(self):
+        tracing = active() is not None
+        for name, processObject in self.GetProcessObjects():
+            if tracing:
+                instrument(processObject, name, type(self).__name__)
+            watch(processObject)
+
+    def Update(self):
+        self._instrument()
+        # inputs may change size between runs, so never keep a stale
+        # requested region around
+        self.rescaler.UpdateLargestPossibleRegion()
+
+    def UpdateFilter(self):
+        """Run the pipeline up to the smoothing stage, without rescaling."""
+        self._instrument()
+        self.lastFilter.UpdateLargestPossibleRegion()
+
+    def GetHaloRadius(self):
+        """Pixels of context each output pixel needs along every axis.
+
+        Used by tiled execution to grow each tile so that its core matches
+        the whole-image result.
+        """
+        raise NotImplementedError(
+            "%s cannot be computed tile by tile" % type(self).__name__
+        )
+
+    def GetFilterOutput(self):
+        """Output of the smoothing stage, before rescaling to 8 bit."""
+        return self.lastFilter.GetOutput()
+
+    def GetOutput(self):
+        return self.rescaler.GetOutput()
+
+
+class BinomialFilter(_SmoothingPipeline):
+    Parameters = {"number_of_repetitions": "SetRepetitions"}
+    NativePixelTypes = (itk.UC, itk.US, itk.SS)
+
+    def _build(self):
+        self.binomialFilter = itk.BinomialBlurImageFilter[
+            self.InputImageType, self.InputImageType
+        ].New()
+        return self.binomialFilter, self.binomialFilter
+
+    @classmethod
+    def GetWorkPerPixel(cls, Dimension=2, number_of_repetitions=1, **parameters):
+        # a 3-tap pass per axis and repetition
+        return 3.0 * Dimension * number_of_repetitions
+
+    def SetRepetitions(self, number_of_repetitions):
+        self.binomialFilter.SetRepetitions(number_of_repetitions)
+
+    def GetHaloRadius(self):
+        # every repetition is a 3-tap pass
+        return self.binomialFilter.GetRepetitions()
+
+
+class DiscreteGaussianFilter(_SmoothingPipeline):
+    Parameters = {"variance": "SetVariance"}
+
+    def _build(self):
+        self.gaussianFilter = itk.DiscreteGaussianImageFilter[
+            self.InputImageType, self.InputImageType
+        ].New()
+        return self.gaussianFilter, self.gaussianFilter
+
+    @classmethod
+    def GetWorkPerPixel(cls, Dimension=2, variance=1.0, **parameters):
+        # one separable pass per axis with a kernel of about 3 sigma on each
+        # side, at most the default MaximumKernelWidth of 32
+        width = min(2 * math.ceil(3 * math.sqrt(float(variance))) + 1, 32)
+        return float(Dimension * width)
+
+    def SetVariance(self, variance):
+        self.gaussianFilter.SetVariance(variance)
+
+    def GetHaloRadius(self):
+        # the kernel is truncated to MaximumKernelWidth
+        return self.gaussianFilter.GetMaximumKernelWidth() // 2
+
+
+class RecursiveGaussianFilter(_SmoothingPipeline):
+    InputPixelType = itk.SS
+    Parameters = {"sigma": "SetSigma"}
+
+    def _build(self):
+        FilterType = itk.RecursiveGaussianImageFilter[
+            self.InputImageType, self.InputImageType
+        ]
+        # one separable pass per axis: filters[0] along X, filters[1] along Y...
+        self.filters = []
+        for direction in range(self.Dimension):
+            axisFilter = FilterType.New()
+            axisFilter.SetDirection(direction)
+            axisFilter.SetOrder(0)
+            axisFilter.SetNormalizeAcrossScale(False)
+            if self.filters:
+                axisFilter.SetInput(self.filters[-1].GetOutput())
+            self.filters.append(axisFilter)
+        return self.filters[0], self.filters[-1]
+
+    def _filters(self):
+        return self.filters
+
+    @classmethod
+    def GetWorkPerPixel(cls, Dimension=2, **parameters):
+        # the IIR passes cost the same for every sigma
+        return 8.0 * Dimension
+
+    def SetSigma(self, sigma):
+        for axisFilter in self.filters:
+            axisFilter.SetSigma(sigma)
+
+    def GetHaloRadius(self):
+        # the IIR response has infinite support; the input is integer (SS), so
+        # even tiny boundary differences can flip a rounded pixel. 16 sigma
+        # reproduced the whole-image result on the sample sections.
+        return int(math.ceil(16 * self.filters[0].GetSigma()))
+
+
+class MedianFilter(_SmoothingPipeline):
+    Parameters = {"radius": "SetRadius"}
+    NativePixelTypes = (itk.UC, itk.US, itk.SS)
+
+    def _build(self):
+        self.medianFilter = itk.MedianImageFilter[
+            self.InputImageType, self.InputImageType
+        ].New()
+        return self.medianFilter, self.medianFilter
+
+    @classmethod
+    def GetWorkPerPixel(cls, Dimension=2, radius=1, **parameters):
+        # every pixel of the neighborhood is visited
+        radii = radius if isinstance(radius, (list, tuple)) else [radius] * Dimension
+        return float(np.prod([2 * r + 1 for r in radii]))
+
+    def SetRadius(self, radius):
+        self.medianFilter.SetRadius(radius)
+
+    def GetHaloRadius(self):
+        return max(self.medianFilter.GetRadius())
+
+
+class _AnisotropicDiffusionFilter(_SmoothingPipeline):
+    # the itk attribute name; looking the template up loads its wrapper
+    # module, which is left to the first pipeline that needs it
+    FilterTemplate = None
+    # operations per pixel, axis and iteration
+    IterationWork = 10.0
+    Parameters = {
+        "numberOfIterations": "SetNumberOfIterations",
+        "conductance": "SetConductanceParameter",
+        "timeStep": "SetTimeStep",
+        "useImageSpacing": "SetUseImageSpacing",
+        "tolerance": "SetTolerance",
+    }
+
+    def _build(self):
+        self.diffusionFilter = getattr(itk, self.FilterTemplate)[
+            self.InputImageType, self.InputImageType
+        ].New()
+        self.numberOfIterations = self.diffusionFilter.GetNumberOfIterations()
+        self.timeStep = None
+        self.tolerance = None
+        self.rmsChanges = []
+        self._previous = None
+        self._observe()
+        return self.diffusionFilter, self.diffusionFilter
+
+    def _observe(self):
+        # ITK's dense finite difference filters never compute their RMS
+        # change (GetRMSChange() stays 0, so SetMaximumRMSError would stop
+        # them after one iteration); it is measured here between iterations.
+        # The observers keep no reference to the pipeline, which owns them.
+        reference = weakref.ref(self)
+
+        def onStart():
+            pipeline = reference()
+            if pipeline is not None:
+                pipeline._onStart()
+
+        def onIteration():
+            pipeline = reference()
+            if pipeline is not None:
+                pipeline._onIteration()
+
+        def onEnd():
+            # restored before the output is marked up to date, so the next
+            # Update() does not run the filter again
+            pipeline = reference()
+            if pipeline is not None:
+                pipeline.diffusionFilter.SetNumberOfIterations(
+                    pipeline.numberOfIterations
+                )
+
+        self.diffusionFilter.AddObserver(itk.StartEvent(), onStart)
+        self.diffusionFilter.AddObserver(itk.IterationEvent(), onIteration)
+        self.diffusionFilter.AddObserver(itk.EndEvent(), onEnd)
+
+    def _onStart(self):
+        self.rmsChanges = []
+        self._previous = None
+        if self.tolerance:
+            self._previous = np.array(
+                itk.array_view_from_image(self.diffusionFilter.GetInput())
+            )
+
+    def _onIteration(self):
+        if self._previous is None:
+            return
+        current = itk.array_view_from_image(self.diffusionFilter.GetOutput())
+        change = np.subtract(current, self._previous, out=self._previous)
+        rmsChange = math.sqrt(float(np.vdot(change, change)) / change.size)
+        self.rmsChanges.append(rmsChange)
+        np.copyto(self._previous, current)
+        if rmsChange < self.tolerance:
+            # Halt() is checked right after this event
+            self.diffusionFilter.SetNumberOfIterations(
+                self.diffusionFilter.GetElapsedIterations()
+            )
+
+    @classmethod
+    def GetWorkPerPixel(cls, Dimension=2, numberOfIterations=1, **parameters):
+        # an upper bound when a tolerance may stop the filter earlier
+        return cls.IterationWork * Dimension * numberOfIterations
+
+    def SetNumberOfIterations(self, numberOfIterations):
+        self.numberOfIterations = numberOfIterations
+        self.diffusionFilter.SetNumberOfIterations(numberOfIterations)
+
+    # None keeps the filter's default conductance, matching the optional
+    # arguments of the functions in edge_preserving_smoothing.py
+    def SetConductanceParameter(self, conductance):
+        if conductance is not None:
+            self.diffusionFilter.SetConductanceParameter(conductance)
+
+    def SetTimeStep(self, timeStep):
+        """Time step of every iteration; None for ``GetStableTimeStep()``."""
+        self.timeStep = timeStep
+
+    def SetUseImageSpacing(self, useImageSpacing):
+        self.diffusionFilter.SetUseImageSpacing(bool(useImageSpacing))
+
+    def SetTolerance(self, tolerance):
+        """Stop once an iteration changes the image by less than ``tolerance``.
+
+        The change is the root mean square over the pixels, in the units of
+        the input intensities. ``numberOfIterations`` stays the maximum;
+        None or 0 always runs all of them.
+        """
+        if tolerance != self.tolerance:
+            self.tolerance = tolerance
+            self.diffusionFilter.Modified()
+
+    def GetStableTimeStep(self):
+        """Largest time step the explicit scheme is stable with.
+
+        The bound ``AnisotropicDiffusionImageFilter`` warns about: the
+        smallest spacing (1 without ``useImageSpacing``) over ``2^(D+1)``,
+        0.125 in 2D and 0.0625 in 3D at unit spacing.
+        """
+        spacing = 1.0
+        if self.diffusionFilter.GetUseImageSpacing():
+            self.diffusionFilter.UpdateOutputInformation()
+            spacing = min(self.diffusionFilter.GetInput().GetSpacing())
+        return spacing / 2.0 ** (self.Dimension + 1)
+
+    def _setTimeStep(self):
+        timeStep = self.timeStep
+        if timeStep is None:
+            timeStep = self.GetStableTimeStep()
+        # setting an unchanged value would still mark the filter modified
+        if timeStep != self.diffusionFilter.GetTimeStep():
+            self.diffusionFilter.SetTimeStep(timeStep)
+
+    def Update(self):
+        self._setTimeStep()
+        super().Update()
+
+    def UpdateFilter(self):
+        self._setTimeStep()
+        super().UpdateFilter()
+
+    def GetConvergence(self):
+        """Iterations run and saved by the tolerance in the last ``Update()``."""
+        elapsed = self.diffusionFilter.GetElapsedIterations()
+        return {
+            "iterations": elapsed,
+            "maximum_iterations": self.numberOfIterations,
+            "iterations_saved": self.numberOfIterations - elapsed,
+            "rms_change": self.rmsChanges[-1] if self.rmsChanges else None,
+            "time_step": self.diffusionFilter.GetTimeStep(),
+        }
+
+    # no GetHaloRadius: the conductance is scaled by the average gradient
+    # magnitude of the whole image, so tiles do not reproduce the result
+
+
+class GradientAnisotropicDiffusionFilter(_AnisotropicDiffusionFilter):
+    FilterTemplate = "GradientAnisotropicDiffusionImageFilter"
+
+
+class CurvatureAnisotropicDiffusionFilter(_AnisotropicDiffusionFilter):
+    FilterTemplate = "CurvatureAnisotropicDiffusionImageFilter"
+    # the curvature term needs second derivatives
+    IterationWork = 20.0
+
+
+PIPELINES = {
+    "binomial": BinomialFilter,
+    "discrete_gaussian": DiscreteGaussianFilter,
+    "recursive_gaussian_iir": RecursiveGaussianFilter,
+    "median": MedianFilter,
+    "grad_anisotropic_diffusion": GradientAnisotropicDiffusionFilter,
+    "curve_anisotropic_diffusion": CurvatureAnisotropicDiffusionFilter,
+}
@@ -0,0 +1,190 @@
+"""Tiled execution of the smoothing filters for images larger than memory.
+
+The image is processed in slabs along its slowest axis. Each slab is read
+together with a halo of ``GetHaloRadius()`` rows on both sides, filtered by
+the regular pipeline, and only its core is kept, so the result matches the
+whole-image filter. Readers whose ImageIO can stream (MHA, NRRD, ...) only
+read the rows a slab needs; other formats are read once and kept by the
+reader.
+
+Rescaling to 8 bit needs the global minimum and maximum of the filtered
+image, so the first pass writes the filtered slabs (in the pipeline's pixel
+type, float unless the ``"native"`` precision keeps the input's) to a
+temporary memory-mapped file while tracking the extrema, and the second pass
+rescales that file slab by slab into the (memory-mapped) output. The output
+is written in the format of its extension (see ``src/export``); a ``.zarr``
+chunk store is written and later read one chunk at a time.
+"""
+
+import math
+import os
+import tempfile
+import time
+
+import itk
+import numpy as np
+
+from ..export import geometry_of, write
+from ..jobs.cancellation import watch
+from ..profiling import instrument, span
+from .numpy_backend import rescale_to_uint8
+from .pipelines import NUMPY_TYPES, PIPELINES, read_image_information
+
+DEFAULT_MEMORY_BUDGET = 256 * 2**20
+
+
+def _bytes_per_pixel(pipeline):
+    # reader region + extracted tile + one buffer per filter stage
+    stages = 2 if pipeline.firstFilter is not pipeline.lastFilter else 1
+    itemsize = np.dtype(NUMPY_TYPES[pipeline.InputPixelType]).itemsize
+    return itemsize * (2 + stages)
+
+
+def plan_tiles(shape, halo, bytesPerPixel, memoryBudget):
+    """Split ``shape`` (NumPy order) into slabs along axis 0.
+
+    Returns a list of ``(start, stop)`` core ranges such that a slab plus
+    its halo stays within ``memoryBudget`` bytes.
+    """
+    rowBytes = bytesPerPixel * int(np.prod(shape[1:]))
+    rows = memoryBudget // rowBytes - 2 * halo
+    if rows < 1:
+        raise ValueError(
+            "A memory budget of %d bytes cannot hold one row plus the %d-row halo "
+            "(%d bytes per row)" % (memoryBudget, halo, rowBytes)
+        )
+    rows = min(rows, shape[0])
+    count = math.ceil(shape[0] / rows)
+    # spread the rows evenly instead of leaving a thin last slab
+    rows = math.ceil(shape[0] / count)
+    return [(start, min(start + rows, shape[0])) for start in range(0, shape[0], rows)]
+
+
+def _region(ImageType, shape, start, stop):
+    # NumPy axis 0 is the last ITK index dimension
+    Dimension = len(shape)
+    region = itk.ImageRegion[Dimension]()
+    index = [0] * Dimension
+    size = list(reversed(shape))
+    index[-1] = start
+    size[-1] = stop - start
+    region.SetIndex(index)
+    region.SetSize(size)
+    return region
+
+
+def stream_smooth(
+    input_image_path,
+    filter_name,
+    params,
+    output_image_path,
+    memoryBudget=DEFAULT_MEMORY_BUDGET,
+    tempDir=None,
+    precision="float",
+):
+    """Apply a smoothing filter tile by tile within ``memoryBudget`` bytes.
+
+    ``filter_name``/``params`` are as in ``batch.parse_filter_spec``, e.g.
+    ``"median", {"radius": 3}``. The anisotropic diffusion filters cannot be
+    tiled and raise ``ValueError``. ``precision`` is the pipelines' policy.
+    Returns a summary dictionary with the tiling and the global intensity
+    range.
+    """
+    if filter_name not in PIPELINES:
+        raise ValueError("Unknown filter '%s'" % filter_name)
+    PipelineType = PIPELINES[filter_name]
+    information = read_image_information(input_image_path)
+    pipeline = PipelineType(
+        information["dimension"],
+        PipelineType.GetPixelType(precision, information["pixel_type"]),
+    )
+    pipeline.SetParameters(**params)
+    try:
+        halo = pipeline.GetHaloRadius()
+    except NotImplementedError as err:
+        raise ValueError(str(err)) from None
+
+    start = time.perf_counter()
+    reader = pipeline.reader
+    reader.SetFileName(input_image_path)
+    reader.UpdateOutputInformation()
+    largest = reader.GetOutput().GetLargestPossibleRegion()
+    shape = tuple(reversed([int(s) for s in largest.GetSize()]))
+
+    tiles = plan_tiles(shape, halo, _bytes_per_pixel(pipeline), memoryBudget)
+
+    extractor = itk.ExtractImageFilter[
+        pipeline.InputImageType, pipeline.InputImageType
+    ].New()
+    extractor.SetInput(reader.GetOutput())
+    extractor.SetDirectionCollapseToSubmatrix()
+    instrument(reader, "ImageFileReader", type(pipeline).__name__)
+    instrument(extractor, category=type(pipeline).__name__)
+    watch(reader)
+    watch(extractor)
+    pipeline.SetInput(extractor.GetOutput())
+
+    with tempfile.TemporaryDirectory(dir=tempDir) as directory:
+        filtered = np.lib.format.open_memmap(
+            os.path.join(directory, "filtered.npy"),
+            mode="w+",
+            dtype=NUMPY_TYPES[pipeline.InputPixelType],
+            shape=shape,
+        )
+
+        # pass 1: filter every slab with its halo, keep the core, track extrema
+        minimum, maximum = np.inf, -np.inf
+        for coreStart, coreStop in tiles:
+            haloStart = max(coreStart - halo, 0)
+            haloStop = min(coreStop + halo, shape[0])
+            extractor.SetExtractionRegion(
+                _region(pipeline.InputImageType, shape, haloStart, haloStop)
+            )
+            pipeline.UpdateFilter()
+
+            with span("spill slab"):
+                slab = itk.array_view_from_image(pipeline.GetFilterOutput())
+                core = slab[coreStart - haloStart : coreStop - haloStart]
+                filtered[coreStart:coreStop] = core
+                minimum = min(minimum, float(core.min()))
+                maximum = max(maximum, float(core.max()))
+
+        # the filters' buffers are not needed for the second pass
+        pipeline.lastFilter.GetOutput().ReleaseData()
+        extractor.GetOutput().ReleaseData()
+        reader.GetOutput().ReleaseData()
+
+        # pass 2: rescale with the global range into the output
+        dir, _ = os.path.split(output_image_path)
+        if dir:
+            os.makedirs(dir, exist_ok=True)
+        output = np.lib.format.open_memmap(
+            os.path.join(directory, "output.npy"),
+            mode="w+",
+            dtype=np.uint8,
+            shape=shape,
+        )
+        with span("rescale slabs"):
+            for coreStart, coreStop in tiles:
+                output[coreStart:coreStop] = rescale_to_uint8(
+                    filtered[coreStart:coreStop], minimum, maximum
+                )
+            output.flush()
+
+        # written here, not through a writer pool: the memory map lives in
+        # the temporary directory
+        write(output, output_image_path, geometry_of(reader.GetOutput()))
+        del output, filtered
+
+    return {
+        "filter": filter_name,
+        "params": params,
+        "shape": list(shape),
+        "halo": halo,
+        "tiles": len(tiles),
+        "rows_per_tile": tiles[0][1] - tiles[0][0],
+        "memory_budget": memoryBudget,
+        "minimum": minimum,
+        "maximum": maximum,
+        "seconds": time.perf_counter() - start,
+    }
@@ -0,0 +1,362 @@
+"""Parameter sweeps over the smoothing filters.
+
+    from src.smoothing.sweep import sweep
+
+    result = sweep(
+        "assets/brain-noise.png",
+        "grad_anisotropic_diffusion",
+        {"numberOfIterations": [5, 10, 25, 50], "conductance": [1.0, 3.0, 9.0]},
+        reference=cleanImage,
+    )
+    result.outputs.shape                  # (12, height, width), uint8
+    print(result.format_table())
+    parameters, output, metrics = result.best("ssim")
+
+The input is read once and handed to a pool of worker processes once per
+worker; every worker builds the filter pipeline once and only re-executes its
+smoothing and rescaling stages for each parameter combination. The outputs
+are the same 8-bit images the ``*_array`` functions return, stacked along a
+new first axis in grid order.
+
+With a ``reference`` (path, NumPy array or ``itk.Image`` of the input's
+shape, on the 0..255 scale of the outputs) every output is scored with the
+metrics of ``metrics.py``.
+
+Anisotropic diffusion is iterative and its state after ``n`` iterations is
+just the diffused image: combinations that only differ in
+``numberOfIterations`` run as one chain, in increasing order, each resuming
+from the previous one's (unrescaled) output. Reaching 25 and 50 iterations
+costs 50 iterations instead of 75, and gives the same images as separate
+runs.
+
+Nothing in this module imports matplotlib.
+"""
+
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import itk
+import numpy as np
+
+from ..jobs.threads import itk_threads, plan_workers, set_itk_threads
+from .batch import REQUIRED
+from .metrics import METRICS
+from .pipelines import NUMPY_TYPES, PIPELINES
+
+# per (worker) process: the input, the reference and the pipeline
+_state = {}
+
+
+def _read(image, pixelType=itk.F):
+    # NumPy array (float32) plus the geometry needed to rebuild the image
+    if isinstance(image, str):
+        image = itk.imread(image, pixelType)
+    if isinstance(image, np.ndarray):
+        return np.asarray(image, dtype=np.float32), None
+    geometry = (
+        tuple(image.GetSpacing()),
+        tuple(image.GetOrigin()),
+        itk.array_from_matrix(image.GetDirection()),
+    )
+    return itk.array_from_image(image).astype(np.float32, copy=False), geometry
+
+
+def expand_grid(grid):
+    """List of parameter dictionaries for ``grid``.
+
+    ``grid`` maps parameter names to a value or a list of values and expands
+    to their Cartesian product, the last name varying fastest. A list of
+    dictionaries is returned as it is.
+    """
+    if not isinstance(grid, dict):
+        return [dict(combination) for combination in grid]
+    names = list(grid)
+    values = [
+        grid[name] if isinstance(grid[name], (list, tuple)) else [grid[name]]
+        for name in names
+    ]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def _check(filterName, combinations):
+    if filterName not in PIPELINES:
+        raise ValueError(
+            "Unknown filter '%s', expected one of %s" % (filterName, sorted(PIPELINES))
+        )
+    expected = sorted(PIPELINES[filterName].Parameters)
+    for parameters in combinations:
+        unknown = set(parameters) - set(expected)
+        missing = set(REQUIRED[filterName]) - set(parameters)
+        if unknown or missing:
+            raise ValueError(
+                "Filter '%s' takes parameters %s (required: %s), got %s"
+                % (filterName, expected, REQUIRED[filterName], sorted(parameters))
+            )
+
+
+def _chains(filterName, combinations, incremental):
+    """Indices of ``combinations`` grouped into the runs of one worker task.
+
+    Diffusion combinations that share all other parameters form one chain
+    sorted by ``numberOfIterations``; everything else runs on its own.
+    """
+    if not incremental or "numberOfIterations" not in PIPELINES[filterName].Parameters:
+        return [[index] for index in range(len(combinations))]
+    groups = {}
+    for index, parameters in enumerate(combinations):
+        key = tuple(
+            sorted(
+                (name, value)
+                for name, value in parameters.items()
+                if name != "numberOfIterations"
+            )
+        )
+        groups.setdefault(key, []).append(index)
+    return [
+        sorted(indices, key=lambda i: combinations[i]["numberOfIterations"])
+        for indices in groups.values()
+    ]
+
+
+def _init_worker(filterName, array, geometry, reference, dataRange, threads=None):
+    _state.clear()
+    set_itk_threads(threads)
+    pipeline = PIPELINES[filterName](array.ndim)
+    _state["pipeline"] = pipeline
+    _state["input"] = _input_image(pipeline, array, geometry)
+    _state["reference"] = reference
+    _state["dataRange"] = dataRange
+
+
+def _input_image(pipeline, array, geometry):
+    # wrapped once per worker; the pipeline keeps the buffer alive through
+    # its inputArray reference
+    array = np.ascontiguousarray(array, dtype=NUMPY_TYPES[pipeline.InputPixelType])
+    image = itk.image_view_from_array(array)
+    if geometry is not None:
+        spacing, origin, direction = geometry
+        image.SetSpacing(spacing)
+        image.SetOrigin(origin)
+        image.SetDirection(itk.matrix_from_array(direction))
+    pipeline.SetInput(image)
+    pipeline.inputArray = array
+    return image
+
+
+def _score(output):
+    reference = _state["reference"]
+    if reference is None:
+        return {}
+    scores = {}
+    for name, metric in METRICS.items():
+        if name == "edge_preservation":
+            scores[name] = metric(output, reference)
+        else:
+            scores[name] = metric(output, reference, _state["dataRange"])
+    return scores
+
+
+def _run_chain(chain):
+    """Run ``[(index, parameters), ...]`` and return one record per entry."""
+    pipeline = _state["pipeline"]
+    pipeline.SetInput(_state["input"])
+    # only diffusion chains (see _chains) have more than one link
+    resumable = len(chain) > 1
+    records = []
+    done = 0
+    for index, parameters in chain:
+        if resumable:
+            iterations = parameters["numberOfIterations"]
+            if records and iterations == done:
+                # the same iteration count twice in the grid
+                records.append(dict(records[-1], index=index, seconds=0.0))
+                continue
+            parameters = dict(parameters, numberOfIterations=iterations - done)
+
+        start = time.perf_counter()
+        pipeline.SetParameters(**parameters)
+        pipeline.Update()
+        output = itk.array_from_image(pipeline.GetOutput())
+        if resumable:
+            # the next link starts from this (unrescaled) diffusion result
+            filterOutput = pipeline.GetFilterOutput()
+            state = itk.image_from_array(itk.array_from_image(filterOutput))
+            state.CopyInformation(filterOutput)
+            pipeline.SetInput(state)
+        records.append(
+            {
+                "index": index,
+                "output": output,
+                "seconds": time.perf_counter() - start,
+                "resumedFrom": done or None,
+                "metrics": _score(output),
+            }
+        )
+        if resumable:
+            done = iterations
+    return records
+
+
+class SweepResult:
+    """Outputs and scores of one sweep, in grid order.
+
+    ``outputs[i]`` is the 8-bit result for ``parameters[i]``, ``metrics[i]``
+    its scores against the reference (empty without one) and ``seconds[i]``
+    the compute time of that combination alone; ``resumedFrom[i]`` is the
+    iteration count a diffusion run continued from, or ``None``.
+    """
+
+    def __init__(
+        self,
+        filterName,
+        parameters,
+        outputs,
+        metrics,
+        seconds,
+        resumedFrom,
+        wallSeconds,
+        workers,
+        threads=None,
+    ):
+        self.filterName = filterName
+        self.parameters = parameters
+        self.outputs = outputs
+        self.metrics = metrics
+        self.seconds = seconds
+        self.resumedFrom = resumedFrom
+        self.wallSeconds = wallSeconds
+        self.workers = workers
+        self.threads = threads
+
+    def __len__(self):
+        return len(self.parameters)
+
+    def best(self, metric="ssim"):
+        """``(parameters, output, metrics)`` of the highest scoring combination."""
+        if not any(self.metrics):
+            raise ValueError("The sweep was run without a reference image")
+        index = max(range(len(self)), key=lambda i: self.metrics[i][metric])
+        return self.parameters[index], self.outputs[index], self.metrics[index]
+
+    def to_dict(self):
+        """Everything but the output images, e.g. for ``json.dump``."""
+        return {
+            "filter": self.filterName,
+            "workers": self.workers,
+            "threads": self.threads,
+            "wall_seconds": self.wallSeconds,
+            "shape": list(self.outputs.shape[1:]),
+            "results": [
+                dict(
+                    parameters=parameters,
+                    seconds=seconds,
+                    resumed_from=resumedFrom,
+                    **metrics,
+                )
+                for parameters, seconds, resumedFrom, metrics in zip(
+                    self.parameters, self.seconds, self.resumedFrom, self.metrics
+                )
+            ],
+        }
+
+    def format_table(self):
+        names = sorted({name for parameters in self.parameters for name in parameters})
+        metricNames = [name for name in METRICS if any(name in m for m in self.metrics)]
+        columns = names + ["seconds"] + metricNames
+        lines = ["  ".join("%18s" % column for column in columns)]
+        for parameters, seconds, metrics in zip(
+            self.parameters, self.seconds, self.metrics
+        ):
+            row = ["%18s" % (parameters.get(name, "-"),) for name in names]
+            row.append("%18.4f" % seconds)
+            row += ["%18.4f" % metrics[name] for name in metricNames]
+            lines.append("  ".join(row))
+        return "\n".join(lines)
+
+
+def sweep(
+    image,
+    filterName,
+    grid,
+    reference=None,
+    workers=None,
+    incremental=True,
+    dataRange=255,
+    threads=None,
+):
+    """Run ``filterName`` (a key of ``pipelines.PIPELINES``) for every
+    combination of ``grid`` (see ``expand_grid``) on ``image`` (path, NumPy
+    array or ``itk.Image``) and return a ``SweepResult``.
+
+    ``workers`` processes with ``threads`` ITK threads each evaluate the
+    grid (1 worker runs in this process); where they are not given they are
+    planned from the image size and the chains' work (see
+    ``src/jobs/threads.py``). ``incremental=False`` runs every diffusion combination
+    from the input. ``dataRange`` is the value range PSNR and SSIM assume
+    for the outputs and the reference.
+    """
+    combinations = expand_grid(grid)
+    _check(filterName, combinations)
+    if not combinations:
+        raise ValueError("The parameter grid is empty")
+
+    array, geometry = _read(image)
+    if reference is not None:
+        reference = _read(reference)[0]
+        if reference.shape != array.shape:
+            raise ValueError(
+                "Reference shape %s does not match the input shape %s"
+                % (reference.shape, array.shape)
+            )
+
+    chains = [
+        [(index, combinations[index]) for index in chain]
+        for chain in _chains(filterName, combinations, incremental)
+    ]
+    # a chain costs what its last (longest) combination costs
+    workPerPixel = np.mean(
+        [
+            PIPELINES[filterName].GetWorkPerPixel(array.ndim, **chain[-1][1])
+            for chain in chains
+        ]
+    )
+    workers, threads = plan_workers(
+        len(chains), array.size, workPerPixel, workers=workers, threads=threads
+    )
+    workers = min(workers, len(chains))
+    initArgs = (filterName, array, geometry, reference, dataRange, threads)
+
+    start = time.perf_counter()
+    if workers == 1:
+        with itk_threads(threads):
+            _init_worker(*initArgs)
+            try:
+                results = [_run_chain(chain) for chain in chains]
+            finally:
+                _state.clear()
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=initArgs
+        ) as executor:
+            results = list(executor.map(_run_chain, chains))
+    wallSeconds = time.perf_counter() - start
+
+    records = sorted(
+        (record for chainRecords in results for record in chainRecords),
+        key=lambda record: record["index"],
+    )
+    outputs = np.empty((len(records),) + array.shape, dtype=np.uint8)
+    for record in records:
+        outputs[record["index"]] = record["output"]
+    return SweepResult(
+        filterName,
+        combinations,
+        outputs,
+        [record["metrics"] for record in records],
+        [record["seconds"] for record in records],
+        [record["resumedFrom"] for record in records],
+        wallSeconds,
+        workers,
+        threads,
+    )